@@ -4,19 +4,50 @@
 Flatpak Manager - Gestor profesional de aplicaciones Flatpak
 """
 
+import argparse
+import os
+import re
+import html
+import ctypes
+import gc
+import fcntl
+import fnmatch
+import queue
+import shlex
+import shutil
+import signal
+import socket
+import socketserver
+import sqlite3
 import sys
 import subprocess
 import platform
-from datetime import datetime
+import threading
+import time
+import json
+import urllib.error
+import urllib.request
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import partial
+from http.server import BaseHTTPRequestHandler, SimpleHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QPushButton, QVBoxLayout, 
                            QWidget, QTextEdit, QLabel, QMessageBox, QHBoxLayout,
                            QTabWidget, QProgressBar, QFileDialog, QSystemTrayIcon,
                            QMenu, QStyle, QStatusBar, QSizePolicy, QGroupBox,
-                           QFormLayout, QCheckBox, QComboBox, QInputDialog)
-from PyQt6.QtCore import QSettings
+                           QFormLayout, QCheckBox, QComboBox, QInputDialog,
+                           QDialog, QDialogButtonBox, QListWidget, QListWidgetItem,
+                           QSpinBox, QTableWidget, QTableWidgetItem, QHeaderView,
+                           QTableView, QAbstractItemView, QLineEdit, QSplitter,
+                           QTreeWidget, QTreeWidgetItem)
+from PyQt6.QtCore import QSettings, QAbstractTableModel, QModelIndex, QObject, QTimer, QPoint
 from PyQt6.QtCore import Qt, QThread, pyqtSignal, QSize
-from PyQt6.QtGui import QIcon, QAction, QFont, QTextCursor, QGuiApplication
+from PyQt6.QtGui import (QIcon, QAction, QFont, QTextCursor, QGuiApplication, QImage,
+                         QImageReader, QPixmap, QPixmapCache)
 
 # Constantes
 APP_NAME = "Flatpak Manager"
@@ -24,6 +55,2466 @@ VERSION = "2.0.0"
 AUTHOR = "Soporte Técnico"
 YEAR = datetime.now().year
 
+# Directorios de datos y caché (respetando XDG)
+DATA_DIR = Path(os.environ.get("XDG_DATA_HOME", Path.home() / ".local" / "share")) / "flatpak-manager"
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "flatpak-manager"
+
+# Repositorios OSTree de las instalaciones de Flatpak
+SYSTEM_REPO = Path("/var/lib/flatpak/repo")
+USER_REPO = Path.home() / ".local" / "share" / "flatpak" / "repo"
+
+# Espejo local
+MIRROR_REMOTE = "flatpak-manager-mirror"
+MIRROR_DEFAULT_PORT = 8470
+MIRROR_PRIORITY = 10
+
+def c_locale_env():
+    """Entorno con mensajes en inglés para poder interpretar la salida de flatpak"""
+    env = dict(os.environ)
+    env.pop("LC_ALL", None)
+    env.pop("LANGUAGE", None)
+    env["LC_MESSAGES"] = "C"
+    return env
+
+def user_bus_available():
+    """Indica si hay un bus de sesión de usuario, necesario para systemd-run --user"""
+    if os.environ.get("DBUS_SESSION_BUS_ADDRESS"):
+        return True
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    return bool(runtime_dir) and os.path.exists(os.path.join(runtime_dir, "bus"))
+
+@dataclass
+class ResourcePolicy:
+    """
+    Límites de recursos para los procesos de una tarea
+
+    Cada límite se aplica anteponiendo al comando el programa correspondiente
+    (systemd-run, nice, ionice, trickle) si está instalado; si no, se omite.
+    trickle limita las descargas del propio proceso de flatpak, que es quien
+    descarga también para la instalación del sistema.
+    """
+    nice: int = 0            # 0 sin cambio, hasta 19
+    io_class: int = 0        # clase de ionice: 0 sin cambio, 2 best-effort, 3 idle
+    io_level: int = 4        # nivel de best-effort (0 máximo, 7 mínimo)
+    bandwidth: int = 0       # KB/s de descarga; 0 sin límite
+    scope_weight: int = 0    # CPUWeight/IOWeight de un scope de systemd; 0 sin scope
+
+    def wrap(self, command):
+        """Devuelve command precedido de los programas que aplican la política"""
+        prefix = []
+        if self.scope_weight and shutil.which("systemd-run") and user_bus_available():
+            prefix += ["systemd-run", "--user", "--scope", "--quiet",
+                       f"--property=CPUWeight={self.scope_weight}",
+                       f"--property=IOWeight={self.scope_weight}", "--"]
+        if self.nice and shutil.which("nice"):
+            prefix += ["nice", "-n", str(self.nice)]
+        if self.io_class and shutil.which("ionice"):
+            prefix += ["ionice", "-c", str(self.io_class)]
+            if self.io_class == 2:
+                prefix += ["-n", str(self.io_level)]
+        if self.bandwidth and shutil.which("trickle"):
+            prefix += ["trickle", "-s", "-d", str(self.bandwidth)]
+        return prefix + list(command)
+
+# Prioridad de las tareas en segundo plano (performance/background_priority)
+POLICY_PRESETS = {
+    "low": ResourcePolicy(nice=19, io_class=3, scope_weight=20),
+    "medium": ResourcePolicy(nice=10, io_class=2, io_level=7, scope_weight=50),
+    "normal": ResourcePolicy(),
+}
+
+def background_policy(settings):
+    """Construye la política de las tareas en segundo plano a partir de la configuración"""
+    preset = POLICY_PRESETS.get(settings.value("performance/background_priority", "low"),
+                                POLICY_PRESETS["low"])
+    return ResourcePolicy(
+        nice=preset.nice,
+        io_class=preset.io_class,
+        io_level=preset.io_level,
+        bandwidth=settings.value("performance/background_bandwidth", 0, type=int),
+        scope_weight=preset.scope_weight if settings.value(
+            "performance/systemd_scope", True, type=bool) else 0,
+    )
+
+_policy_state = threading.local()
+
+def apply_policy(policy, func, *args, **kwargs):
+    """Ejecuta func con policy como política de los procesos que lance este hilo"""
+    previous = getattr(_policy_state, "policy", None)
+    _policy_state.policy = policy
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _policy_state.policy = previous
+
+def policy_command(command):
+    """Aplica a command la política del hilo actual (las tareas en primer plano no tienen)"""
+    policy = getattr(_policy_state, "policy", None)
+    return policy.wrap(command) if policy else list(command)
+
+class ProcessRegistry:
+    """Procesos en curso lanzados por run_process, para pausarlos y reanudarlos"""
+    def __init__(self):
+        self._processes = set()
+        self._lock = threading.Lock()
+        self.paused = False
+
+    @staticmethod
+    def _signal(process, sig):
+        # Cada proceso tiene su propio grupo, que incluye a systemd-run, nice, etc.
+        try:
+            os.killpg(process.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def add(self, process):
+        """Registra un proceso; si las operaciones están en pausa, lo detiene"""
+        with self._lock:
+            self._processes.add(process)
+            if self.paused:
+                self._signal(process, signal.SIGSTOP)
+
+    def remove(self, process):
+        """Deja de seguir un proceso terminado"""
+        with self._lock:
+            self._processes.discard(process)
+
+    def pause(self):
+        """Detiene (SIGSTOP) los procesos en curso y los que se lancen a continuación"""
+        with self._lock:
+            self.paused = True
+            for process in self._processes:
+                self._signal(process, signal.SIGSTOP)
+
+    def resume(self):
+        """Reanuda (SIGCONT) los procesos detenidos"""
+        with self._lock:
+            self.paused = False
+            for process in self._processes:
+                self._signal(process, signal.SIGCONT)
+
+PROCESSES = ProcessRegistry()
+
+def run_process(command, log=None, env=None):
+    """
+    Ejecuta un comando y devuelve su resultado, transmitiendo la salida línea a línea
+
+    El comando se lanza con la política de recursos del hilo actual y queda
+    registrado en PROCESSES mientras se ejecuta, para poder pausarlo.
+
+    Args:
+        command (list): Comando y argumentos a ejecutar
+        log (callable): Función que recibe cada línea de salida (opcional)
+        env (dict): Entorno del proceso (opcional)
+
+    Returns:
+        subprocess.CompletedProcess: Resultado con stdout y stderr combinados
+    """
+    process = subprocess.Popen(
+        policy_command(command),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        universal_newlines=True,
+        bufsize=1,
+        env=env,
+        start_new_session=True
+    )
+    PROCESSES.add(process)
+    started = time.time()
+    lines = []
+    try:
+        for line in process.stdout:
+            line = line.rstrip("\n")
+            lines.append(line)
+            if log and line.strip():
+                log(line.strip())
+        process.wait()
+    finally:
+        PROCESSES.remove(process)
+    output = "\n".join(lines)
+    record_operation(command, started, time.time(), process.returncode, output)
+    return subprocess.CompletedProcess(command, process.returncode, output, "")
+
+def run_captured(command, env=None):
+    """
+    Equivalente a subprocess.run con la salida capturada, pero pausable
+
+    El proceso recibe la política de recursos del hilo y su propio grupo, y
+    se registra en PROCESSES. Los lanzados desde el hilo de la interfaz no se
+    registran: si se detuvieran, la ventana quedaría bloqueada sin poder reanudarlos.
+
+    Returns:
+        subprocess.CompletedProcess: Resultado con stdout y stderr por separado
+    """
+    process = subprocess.Popen(policy_command(command), stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, text=True, env=env,
+                               start_new_session=True)
+    pausable = threading.current_thread() is not threading.main_thread()
+    if pausable:
+        PROCESSES.add(process)
+    try:
+        stdout, stderr = process.communicate()
+    finally:
+        if pausable:
+            PROCESSES.remove(process)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+HISTORY_DB_FILE = DATA_DIR / "history.db"
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_OUTPUT = 64 * 1024   # caracteres de salida guardados por operación
+# Identificador de los mensajes que flatpak escribe en el journal (flatpak history)
+FLATPAK_JOURNAL_MESSAGE_ID = "c7b39b1e006b464599465e105b361485"
+
+class HistoryStore:
+    """
+    Historial de operaciones en una base de datos SQLite local
+
+    Guarda tanto las operaciones lanzadas por el gestor como las importadas
+    del journal (flatpak history). Las consultas usan índices por fecha y,
+    si SQLite lo permite, un índice de texto completo FTS5 para la búsqueda.
+    Se puede usar desde varios hilos.
+    """
+    def __init__(self, path=HISTORY_DB_FILE):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS operations (
+                id INTEGER PRIMARY KEY,
+                source TEXT NOT NULL,
+                started REAL NOT NULL,
+                finished REAL,
+                command TEXT NOT NULL,
+                scope TEXT NOT NULL DEFAULT '',
+                refs TEXT NOT NULL DEFAULT '',
+                exit_code INTEGER,
+                output TEXT NOT NULL DEFAULT ''
+            );
+            CREATE INDEX IF NOT EXISTS idx_operations_started ON operations(started, id);
+            CREATE INDEX IF NOT EXISTS idx_operations_refs ON operations(refs);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        try:
+            self._db.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS operations_fts USING fts5(
+                    command, refs, output, content='operations', content_rowid='id');
+                CREATE TRIGGER IF NOT EXISTS operations_fts_insert AFTER INSERT ON operations BEGIN
+                    INSERT INTO operations_fts(rowid, command, refs, output)
+                    VALUES (new.id, new.command, new.refs, new.output);
+                END;
+            """)
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            self.has_fts = False
+
+    def add(self, source, started, finished, command, scope="", refs="", exit_code=None, output=""):
+        """Guarda una operación"""
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO operations (source, started, finished, command, scope, refs, exit_code, output)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (source, started, finished, command, scope, refs, exit_code,
+                 output[-HISTORY_MAX_OUTPUT:]))
+            self._db.commit()
+
+    def page(self, query="", before=None, limit=HISTORY_PAGE_SIZE):
+        """
+        Devuelve una página de operaciones, de la más reciente a la más antigua
+
+        La paginación usa la posición (started, id) de la última fila de la
+        página anterior, por lo que su coste no depende del número de página.
+
+        Args:
+            query (str): Texto a buscar en comando, refs y salida (opcional)
+            before (tuple): (started, id) de la última fila de la página anterior
+
+        Returns:
+            list: Filas sqlite3.Row sin la columna output
+        """
+        conditions = []
+        params = []
+        if query.strip():
+            if self.has_fts:
+                terms = " ".join('"' + term.replace('"', '""') + '"*' for term in query.split())
+                conditions.append("id IN (SELECT rowid FROM operations_fts WHERE operations_fts MATCH ?)")
+                params.append(terms)
+            else:
+                for term in query.split():
+                    conditions.append("(command LIKE ? OR refs LIKE ? OR output LIKE ?)")
+                    params.extend([f"%{term}%"] * 3)
+        if before is not None:
+            conditions.append("(started < ? OR (started = ? AND id < ?))")
+            params.extend([before[0], before[0], before[1]])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            return self._db.execute(
+                "SELECT id, source, started, finished, command, scope, refs, exit_code"
+                f" FROM operations {where} ORDER BY started DESC, id DESC LIMIT ?",
+                params + [limit]).fetchall()
+
+    def output(self, operation_id):
+        """Devuelve la salida guardada de una operación"""
+        with self._lock:
+            row = self._db.execute("SELECT output FROM operations WHERE id = ?",
+                                   (operation_id,)).fetchone()
+        return row["output"] if row else ""
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else default
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+            self._db.commit()
+
+    def import_journal(self, log):
+        """
+        Importa las entradas de flatpak history desde el journal de forma incremental
+
+        Se guarda el cursor del journal de la última entrada importada para no
+        repetir entradas en las siguientes importaciones.
+
+        Returns:
+            int: Número de entradas importadas
+        """
+        command = ["journalctl", "--no-pager", "-o", "json",
+                   f"MESSAGE_ID={FLATPAK_JOURNAL_MESSAGE_ID}"]
+        cursor = self.get_meta("journal_cursor")
+        if cursor:
+            command.append(f"--after-cursor={cursor}")
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or "No se pudo leer el journal")
+
+        rows = []
+        for line in result.stdout.splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            timestamp = int(entry.get("__REALTIME_TIMESTAMP", 0)) / 1_000_000
+            operation = entry.get("OPERATION", "")
+            rows.append((
+                "journal", timestamp, timestamp,
+                " ".join(part for part in (entry.get("TOOL", "flatpak"), operation) if part),
+                entry.get("INSTALLATION", ""),
+                entry.get("REF", ""),
+                None,
+                entry.get("MESSAGE", ""),
+            ))
+            cursor = entry.get("__CURSOR", cursor)
+        if rows:
+            with self._lock:
+                self._db.executemany(
+                    "INSERT INTO operations (source, started, finished, command, scope, refs, exit_code, output)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                self._db.commit()
+            self.set_meta("journal_cursor", cursor)
+        log(f"{len(rows)} entradas importadas del journal")
+        return len(rows)
+
+_history = None
+_history_lock = threading.Lock()
+
+def get_history():
+    """Devuelve el historial compartido, abriéndolo la primera vez, o None si no está disponible"""
+    global _history
+    with _history_lock:
+        if _history is None:
+            try:
+                _history = HistoryStore()
+            except (sqlite3.Error, OSError) as e:
+                print(f"No se pudo abrir el historial: {e}")
+                _history = False
+        return _history or None
+
+def record_operation(command, started, finished, exit_code, output=""):
+    """
+    Registra en el historial y en las métricas un comando ejecutado por el gestor
+
+    El ámbito y las refs se deducen de los argumentos del comando.
+    """
+    args = shlex.split(command) if isinstance(command, str) else list(command)
+    program = os.path.basename(args[0]) if args else ""
+    operation = args[1] if program == "flatpak" and len(args) > 1 else program
+    METRICS.observe_operation(operation, finished - started, exit_code != 0)
+    history = get_history()
+    if history is None:
+        return
+    scope = "user" if "--user" in args else "system" if "--system" in args else ""
+    # Las refs son los argumentos posicionales con forma de ID (org.x.Y) o de ref (app/...)
+    refs = [arg for arg in args[2:] if not arg.startswith("-") and ("/" in arg or "." in arg)
+            and not arg.startswith(("http://", "https://", "file://"))]
+    history.add("gestor", started, finished,
+                command if isinstance(command, str) else shlex.join(command),
+                scope, " ".join(refs), exit_code, output)
+
+def run_recorded(command):
+    """Ejecuta un comando capturando su salida y lo registra en el historial"""
+    started = time.time()
+    result = run_captured(command)
+    record_operation(command, started, time.time(), result.returncode,
+                     "\n".join(part for part in (result.stdout, result.stderr) if part))
+    return result
+
+def installation_repo(installation):
+    """Devuelve la ruta del repositorio OSTree de una instalación ('system' o 'user')"""
+    return USER_REPO if installation == "user" else SYSTEM_REPO
+
+def list_installed_refs():
+    """
+    Obtiene las refs instaladas con su commit activo
+
+    Returns:
+        list: Diccionarios con las claves ref, commit, origin e installation
+    """
+    output = subprocess.check_output(
+        ["flatpak", "list", "--columns=ref,active,origin,installation"],
+        text=True
+    )
+    refs = []
+    for line in output.splitlines():
+        fields = line.split("\t")
+        if len(fields) < 4 or "/" not in fields[0]:
+            continue
+        refs.append({
+            "ref": fields[0].strip(),
+            "commit": fields[1].strip(),
+            "origin": fields[2].strip(),
+            "installation": fields[3].strip(),
+        })
+    return refs
+
+_SIZE_UNITS = {
+    "byte": 1, "bytes": 1, "b": 1,
+    "kb": 1000, "mb": 1000 ** 2, "gb": 1000 ** 3, "tb": 1000 ** 4,
+    "kib": 1024, "mib": 1024 ** 2, "gib": 1024 ** 3, "tib": 1024 ** 4,
+}
+
+def parse_size(text):
+    """
+    Convierte un tamaño formateado por flatpak (ej: '1.2 MB') a bytes
+
+    Returns:
+        int: Tamaño en bytes, o 0 si el texto no es reconocible
+    """
+    match = re.match(r"\s*([\d.,]+)\s*([A-Za-z]+)", text or "")
+    if not match:
+        return 0
+    number = float(match.group(1).replace(",", "."))
+    return int(number * _SIZE_UNITS.get(match.group(2).lower(), 1))
+
+def format_size(size, signed=False):
+    """Formatea un tamaño en bytes con unidades legibles"""
+    sign = ""
+    if signed:
+        sign = "+" if size > 0 else "-" if size < 0 else ""
+    size = abs(size)
+    for unit in ("B", "kB", "MB", "GB"):
+        if size < 1000:
+            break
+        size /= 1000
+    else:
+        unit = "TB"
+    return f"{sign}{size:.0f} {unit}" if unit == "B" else f"{sign}{size:.1f} {unit}"
+
+@dataclass
+class UpdateEntry:
+    """Actualización pendiente de una ref"""
+    ref: str
+    version: str = ""
+    origin: str = ""
+    commit: str = ""
+    download_size: int = 0
+    installed_size: int = 0
+    current_size: int = 0
+    runtime: str = ""
+    new_runtime: bool = False
+    shared_by: list = field(default_factory=list)
+
+    @property
+    def kind(self):
+        return self.ref.split("/")[0]
+
+    @property
+    def name(self):
+        parts = self.ref.split("/")
+        return parts[1] if len(parts) > 1 else self.ref
+
+    @property
+    def size_delta(self):
+        return self.installed_size - self.current_size
+
+def list_masks(log=None, installation=None):
+    """
+    Obtiene los patrones fijados con flatpak mask
+
+    Args:
+        installation (str): 'system' o 'user'; None para reunir los de ambas
+
+    Returns:
+        list: Patrones enmascarados (ej: org.gimp.GIMP o app/org.gimp.GIMP//stable)
+    """
+    masks = []
+    for name in [installation] if installation else ["system", "user"]:
+        result = subprocess.run(["flatpak", "mask", installation_flag(name)],
+                                capture_output=True, text=True, env=c_locale_env())
+        if result.returncode != 0:
+            continue
+        # La salida lista cada patrón sangrado bajo el encabezado "Masked patterns:"
+        masks += [line.strip() for line in result.stdout.splitlines()
+                  if line[:1].isspace() and line.strip() and line.strip() not in masks]
+    return masks
+
+def load_masks(log=None):
+    """Obtiene los patrones fijados de cada instalación: {instalación: patrones}"""
+    return {installation: list_masks(installation=installation)
+            for installation in ("system", "user")}
+
+def ref_matches_pattern(ref, pattern):
+    """
+    Indica si una ref coincide con un patrón de flatpak mask
+
+    Los patrones tienen la forma [app/|runtime/]ID[/ARCH[/RAMA]], admiten
+    comodines en el ID y las partes vacías coinciden con cualquier valor.
+    """
+    kind, ref_id, arch, branch = (ref.split("/") + ["", "", ""])[:4]
+    parts = pattern.split("/")
+    if parts[0] in ("app", "runtime"):
+        if parts[0] != kind:
+            return False
+        parts = parts[1:]
+    parts += [""] * (3 - len(parts))
+    pattern_id, pattern_arch, pattern_branch = parts[:3]
+    return (fnmatch.fnmatchcase(ref_id, pattern_id)
+            and (not pattern_arch or pattern_arch == arch)
+            and (not pattern_branch or pattern_branch == branch))
+
+def is_masked(ref, masks):
+    """Indica si una ref está fijada por alguno de los patrones"""
+    return any(ref_matches_pattern(ref, pattern) for pattern in masks)
+
+def fetch_update_plan(log=None):
+    """
+    Construye la lista de actualizaciones pendientes con su coste
+
+    Para cada actualización se obtiene el tamaño de descarga, la diferencia
+    de tamaño instalado y qué aplicaciones comparten el runtime afectado.
+    Las refs fijadas con flatpak mask se omiten; como remote-ls no indica la
+    instalación de cada actualización, basta con que esté fijada en una de ellas.
+
+    Returns:
+        list: Objetos UpdateEntry ordenados por ref
+    """
+    installed = subprocess.check_output(
+        ["flatpak", "list", "--columns=ref,size,runtime"], text=True)
+    current_sizes = {}
+    users = {}
+    for line in installed.splitlines():
+        fields = line.split("\t")
+        if len(fields) < 3 or "/" not in fields[0]:
+            continue
+        ref = fields[0].strip()
+        current_sizes[ref] = parse_size(fields[1])
+        runtime = fields[2].strip()
+        if runtime and ref.startswith("app/"):
+            users.setdefault(f"runtime/{runtime}", []).append(ref.split("/")[1])
+
+    result = run_captured(
+        ["flatpak", "remote-ls", "--updates",
+         "--columns=ref,version,origin,commit,download-size,installed-size,runtime"])
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or "No se pudieron obtener las actualizaciones")
+
+    masks = list_masks()
+    plan = []
+    for line in result.stdout.splitlines():
+        fields = line.split("\t")
+        if len(fields) < 7 or "/" not in fields[0]:
+            continue
+        ref = fields[0].strip()
+        if is_masked(ref, masks):
+            if log:
+                log(f"{ref}: omitida, versión fijada")
+            continue
+        runtime = fields[6].strip()
+        entry = UpdateEntry(
+            ref=ref,
+            version=fields[1].strip(),
+            origin=fields[2].strip(),
+            commit=fields[3].strip(),
+            download_size=parse_size(fields[4]),
+            installed_size=parse_size(fields[5]),
+            current_size=current_sizes.get(ref, 0),
+            runtime=runtime,
+            new_runtime=bool(runtime) and f"runtime/{runtime}" not in current_sizes,
+            shared_by=sorted(users.get(ref, [])),
+        )
+        plan.append(entry)
+        if log:
+            log(f"{entry.name}: {format_size(entry.download_size)} a descargar")
+    return sorted(plan, key=lambda entry: entry.ref)
+
+UPDATE_STATS_FILE = DATA_DIR / "update_stats.jsonl"
+
+# Líneas de la transacción no interactiva: "Updating app/org.gimp.GIMP/x86_64/stable"
+_TRANSACTION_OP_RE = re.compile(r"^(Installing|Updating|Uninstalling)\s+(\S+)")
+
+def _match_planned_ref(name, refs):
+    """Busca en refs la ref completa que corresponde al nombre mostrado por flatpak"""
+    for ref in refs:
+        if ref == name or ref.split("/", 1)[-1] == name or ref.split("/")[1] == name:
+            return ref
+    return name
+
+def run_update_transaction(log, progress, plan=None, no_pull=False):
+    """
+    Ejecuta una única transacción no interactiva de flatpak update y mide su rendimiento
+
+    Args:
+        log (callable): Función que recibe cada línea de salida
+        progress (callable): Recibe un diccionario con action, ref, index y total
+        plan (list): Actualizaciones (UpdateEntry) a aplicar; si es None se actualiza todo
+        no_pull (bool): Desplegar solo lo ya descargado, sin acceder a la red
+
+    Returns:
+        dict: Estadísticas de la transacción, o None si no había nada que actualizar
+    """
+    update_all = plan is None
+    if update_all:
+        plan = fetch_update_plan()
+    if not plan:
+        log("No hay actualizaciones disponibles.")
+        return None
+
+    sizes = {entry.ref: entry.download_size for entry in plan}
+    durations = {}
+    failed = set()
+    state = {"ref": None, "start": None, "index": 0}
+
+    def handle_line(line):
+        log(line)
+        match = _TRANSACTION_OP_RE.match(line)
+        if match:
+            now = time.monotonic()
+            if state["ref"]:
+                durations[state["ref"]] = now - state["start"]
+            state["ref"] = _match_planned_ref(match.group(2), sizes)
+            state["start"] = now
+            state["index"] += 1
+            progress({
+                "action": match.group(1),
+                "ref": state["ref"],
+                "index": state["index"],
+                "total": max(len(plan), state["index"]),
+            })
+        elif line.lower().startswith("error") and state["ref"]:
+            failed.add(state["ref"])
+
+    command = ["flatpak", "update", "-y", "--noninteractive"]
+    if no_pull:
+        command.append("--no-pull")
+    if not update_all:
+        command += [entry.ref for entry in plan]
+    log(f"$ {shlex.join(command)}")
+
+    started = time.monotonic()
+    result = run_process(command, handle_line, env=c_locale_env())
+    elapsed = time.monotonic() - started
+    if state["ref"]:
+        durations[state["ref"]] = time.monotonic() - state["start"]
+
+    # Los bytes se estiman con el tamaño de descarga del plan de las refs completadas
+    downloaded = 0 if no_pull else sum(sizes.get(ref, 0) for ref in durations if ref not in failed)
+    stats = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "success": result.returncode == 0,
+        "refs": len(durations),
+        "failed": sorted(failed),
+        "bytes": downloaded,
+        "seconds": round(elapsed, 2),
+        "throughput": downloaded / elapsed if elapsed > 0 else 0,
+        "durations": {ref: round(seconds, 2) for ref, seconds in durations.items()},
+    }
+    save_update_stats(stats)
+    return stats
+
+STAGED_UPDATES_FILE = DATA_DIR / "staged_updates.json"
+STAGING_INTERVAL = 12 * 3600   # segundos mínimos entre dos descargas programadas
+
+def in_time_window(hour, start, end):
+    """Indica si hour está en la franja [start, end), que puede cruzar la medianoche"""
+    if start == end:
+        return True
+    if start < end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+def load_staged_updates():
+    """Devuelve las actualizaciones ya descargadas pendientes de aplicar (UpdateEntry)"""
+    try:
+        with open(STAGED_UPDATES_FILE) as f:
+            return [UpdateEntry(**item) for item in json.load(f)]
+    except (OSError, ValueError, TypeError):
+        return []
+
+def save_staged_updates(entries):
+    """Guarda la lista de actualizaciones descargadas pendientes de aplicar"""
+    STAGED_UPDATES_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(STAGED_UPDATES_FILE, "w") as f:
+        json.dump([asdict(entry) for entry in entries], f, indent=2)
+
+def discard_staged_updates(stats):
+    """
+    Quita de las actualizaciones preparadas las refs que una transacción ya actualizó
+
+    Returns:
+        list: UpdateEntry que siguen preparadas
+    """
+    staged = load_staged_updates()
+    # Si la transacción terminó bien, las refs que no aparecen no tenían nada que aplicar
+    remaining = [entry for entry in staged if entry.ref in stats["failed"]
+                 or (not stats["success"] and entry.ref not in stats["durations"])]
+    if len(remaining) != len(staged):
+        save_staged_updates(remaining)
+    return remaining
+
+def stage_updates(log):
+    """
+    Descarga las actualizaciones pendientes sin desplegarlas (flatpak update --no-deploy)
+
+    Returns:
+        list: UpdateEntry descargadas, listas para aplicarse con deploy_staged_updates
+    """
+    plan = fetch_update_plan(log)
+    if not plan:
+        save_staged_updates([])
+        return []
+    command = ["flatpak", "update", "--no-deploy", "-y", "--noninteractive"]
+    command += [entry.ref for entry in plan]
+    log(f"$ {shlex.join(command)}")
+    result = run_process(command, log, env=c_locale_env())
+    if result.returncode != 0:
+        raise RuntimeError(f"flatpak update --no-deploy terminó con código {result.returncode}")
+    save_staged_updates(plan)
+    return plan
+
+def deploy_staged_updates(log, progress):
+    """
+    Aplica las actualizaciones descargadas desde los objetos locales (--no-pull)
+
+    Las refs que fallan siguen marcadas como descargadas.
+
+    Returns:
+        dict: Estadísticas de la transacción, o None si no había nada preparado
+    """
+    staged = load_staged_updates()
+    if not staged:
+        log("No hay actualizaciones preparadas.")
+        return None
+    stats = run_update_transaction(log, progress, staged, no_pull=True)
+    discard_staged_updates(stats)
+    return stats
+
+def save_update_stats(stats):
+    """Añade las estadísticas de una transacción al historial en disco"""
+    UPDATE_STATS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(UPDATE_STATS_FILE, "a") as f:
+        f.write(json.dumps(stats) + "\n")
+
+def load_update_stats(limit=20):
+    """Devuelve las estadísticas de las últimas transacciones de actualización"""
+    try:
+        with open(UPDATE_STATS_FILE) as f:
+            lines = f.readlines()[-limit:]
+    except OSError:
+        return []
+    stats = []
+    for line in lines:
+        try:
+            stats.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return stats
+
+REMOTE_PROBES_FILE = CACHE_DIR / "remote_probes.json"
+PROBE_TIMEOUT = 10          # segundos
+PROBE_SLOW_LATENCY = 1.0    # segundos hasta el primer byte
+PROBE_STALE_DAYS = 14       # días sin cambios en el summary
+
+@dataclass
+class RemoteInfo:
+    """Remoto de Flatpak configurado"""
+    name: str
+    url: str = ""
+    priority: int = 1
+    options: list = field(default_factory=list)
+    filter: str = ""
+
+    @property
+    def enabled(self):
+        return "disabled" not in self.options
+
+    @property
+    def scope_args(self):
+        """Argumentos para operar sobre la instalación a la que pertenece el remoto"""
+        return ["--user"] if "user" in self.options else ["--system"]
+
+def load_remotes(log=None):
+    """
+    Obtiene los remotos configurados, incluidos los desactivados
+
+    Returns:
+        list: Objetos RemoteInfo ordenados por prioridad descendente
+    """
+    output = subprocess.check_output(
+        ["flatpak", "remotes", "--show-disabled", "--columns=name,url,priority,options,filter"],
+        text=True)
+    remotes = []
+    for line in output.splitlines():
+        fields = line.split("\t")
+        if len(fields) < 5 or not fields[0].strip():
+            continue
+        try:
+            priority = int(fields[2].strip() or 1)
+        except ValueError:
+            priority = 1
+        remotes.append(RemoteInfo(
+            name=fields[0].strip(),
+            url=fields[1].strip(),
+            priority=priority,
+            options=[option for option in fields[3].strip().split(",") if option],
+            filter=fields[4].strip(),
+        ))
+    return sorted(remotes, key=lambda remote: (-remote.priority, remote.name))
+
+def remote_collection_id(name):
+    """Devuelve el collection-id de un remoto de la instalación del sistema ('' si no tiene)"""
+    output = subprocess.check_output(
+        ["flatpak", "remotes", "--system", "--show-disabled", "--columns=name,collection"],
+        text=True)
+    for line in output.splitlines():
+        fields = line.split("\t")
+        if len(fields) >= 2 and fields[0].strip() == name:
+            collection = fields[1].strip()
+            return "" if collection == "-" else collection
+    return ""
+
+def remote_trusted_keys(name):
+    """Ruta del anillo de claves GPG con el que el sistema verifica un remoto"""
+    return SYSTEM_REPO / f"{name}.trustedkeys.gpg"
+
+def list_remote_refs(remote):
+    """
+    Obtiene las refs que ofrece un remoto de la instalación del sistema
+
+    Returns:
+        dict: Ref publicada (ej: app/org.gimp.GIMP/x86_64/stable) -> commit
+    """
+    output = subprocess.check_output(
+        ["flatpak", "remote-ls", "--system", "--columns=ref,commit", remote], text=True)
+    refs = {}
+    for line in output.splitlines():
+        fields = line.split("\t")
+        if len(fields) >= 2 and fields[0].strip().count("/") == 3:
+            refs[fields[0].strip()] = fields[1].strip()
+    return refs
+
+def mirror_offers_app(app_id):
+    """Indica si el remoto del espejo publica la aplicación (False si no responde)"""
+    try:
+        refs = list_remote_refs(MIRROR_REMOTE)
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return False
+    return any(ref.startswith(f"app/{app_id}/") for ref in refs)
+
+def install_app(log, app_id, prefer_mirror=False):
+    """
+    Instala una aplicación, desde el espejo si se prefiere y la ofrece
+
+    Returns:
+        str: El ID de la aplicación instalada
+    """
+    command = ["flatpak", "install", "-y", app_id]
+    if prefer_mirror and mirror_offers_app(app_id):
+        log(f"Instalando desde el espejo ({MIRROR_REMOTE})")
+        command = ["flatpak", "install", "--system", "-y", MIRROR_REMOTE, app_id]
+    run_flatpak_commands(log, [command])
+    return app_id
+
+def repoint_refs_to_mirror(log):
+    """
+    Cambia el origen de las refs del sistema que ofrece el espejo para que se actualicen desde él
+
+    flatpak no permite cambiar el origen de una ref instalada; se reinstala
+    desde el espejo. Solo se cambian las refs cuyo commit en el espejo es el
+    desplegado, de modo que no cambian de versión y apenas se descarga nada;
+    las fijadas con flatpak mask se dejan en su origen.
+
+    Returns:
+        int: Número de refs que ahora se actualizan desde el espejo
+    """
+    available = list_remote_refs(MIRROR_REMOTE)
+    masks = list_masks(installation="system")
+    refs = []
+    for item in list_installed_refs():
+        if (item["installation"] != "system" or item["origin"] == MIRROR_REMOTE
+                or item["ref"] not in available):
+            continue
+        if is_masked(item["ref"], masks):
+            log(f"Omitiendo {item['ref']}: su versión está fijada")
+        elif available[item["ref"]] != item["commit"]:
+            log(f"Omitiendo {item['ref']}: el espejo tiene otro commit "
+                f"({available[item['ref']][:12]}, instalado {item['commit'][:12]})")
+        else:
+            refs.append(item["ref"])
+    if not refs:
+        log("Ninguna ref instalada está disponible en el espejo")
+        return 0
+    return run_flatpak_commands(log, [
+        ["flatpak", "install", "--system", "-y", "--noninteractive", "--reinstall",
+         MIRROR_REMOTE, ref] for ref in refs])
+
+def run_flatpak_commands(log, commands):
+    """
+    Ejecuta varios comandos de flatpak en orden, deteniéndose en el primer error
+
+    Returns:
+        int: Número de comandos ejecutados
+    """
+    for command in commands:
+        log(f"$ {shlex.join(command)}")
+        result = run_process(command, log)
+        if result.returncode != 0:
+            raise RuntimeError(f"'{shlex.join(command)}' terminó con código {result.returncode}")
+    return len(commands)
+
+@dataclass
+class RemoteProbe:
+    """Resultado del diagnóstico de un remoto"""
+    name: str
+    url: str
+    checked: str = ""
+    status: str = "inaccesible"
+    latency: float = 0.0
+    throughput: float = 0.0
+    size: int = 0
+    age_days: float = -1.0
+    error: str = ""
+
+def probe_remote(name, url, timeout=PROBE_TIMEOUT):
+    """
+    Mide la latencia y la velocidad de descarga del summary de un remoto
+
+    Se intenta primero summary.idx (usado por flatpak moderno) y después summary.
+
+    Returns:
+        RemoteProbe: Resultado con estado ok, lento, desactualizado o inaccesible
+    """
+    probe = RemoteProbe(name, url, checked=datetime.now().isoformat(timespec="seconds"))
+    if not url.startswith(("http://", "https://", "file://")):
+        probe.status = "no soportado"
+        probe.error = "Solo se pueden diagnosticar remotos HTTP o locales"
+        return probe
+
+    base = url.rstrip("/")
+    for filename in ("summary.idx", "summary"):
+        try:
+            started = time.monotonic()
+            with urllib.request.urlopen(f"{base}/{filename}", timeout=timeout) as response:
+                first_byte = response.read(1)
+                probe.latency = time.monotonic() - started
+                body = first_byte + response.read()
+                transfer = time.monotonic() - started
+                last_modified = response.headers.get("Last-Modified")
+        except urllib.error.HTTPError as e:
+            probe.error = f"HTTP {e.code} al descargar {filename}"
+            if e.code == 404:
+                continue
+            return probe
+        except (urllib.error.URLError, OSError) as e:
+            reason = getattr(e, "reason", e)
+            probe.error = str(reason)
+            if isinstance(reason, FileNotFoundError):
+                continue
+            return probe
+
+        probe.size = len(body)
+        probe.throughput = probe.size / transfer if transfer > 0 else 0.0
+        probe.error = ""
+        if last_modified:
+            try:
+                modified = parsedate_to_datetime(last_modified)
+                probe.age_days = (datetime.now(timezone.utc) - modified).total_seconds() / 86400
+            except (TypeError, ValueError):
+                pass
+        if probe.age_days > PROBE_STALE_DAYS:
+            probe.status = "desactualizado"
+        elif probe.latency > PROBE_SLOW_LATENCY:
+            probe.status = "lento"
+        else:
+            probe.status = "ok"
+        return probe
+    return probe
+
+def probe_remotes(log, remotes, max_workers=8):
+    """
+    Diagnostica varios remotos en paralelo y guarda los resultados en caché
+
+    Args:
+        log (callable): Función para informar del progreso
+        remotes (list): Tuplas (nombre, url)
+
+    Returns:
+        list: Objetos RemoteProbe en el mismo orden que remotes
+    """
+    if not remotes:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(remotes))) as executor:
+        probes = list(executor.map(lambda remote: probe_remote(*remote), remotes))
+    for probe in probes:
+        log(f"{probe.name}: {probe.status}")
+    cache = load_remote_probes()
+    cache.update({probe.name: probe for probe in probes})
+    REMOTE_PROBES_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(REMOTE_PROBES_FILE, "w") as f:
+        json.dump({name: asdict(probe) for name, probe in cache.items()}, f, indent=2)
+    return probes
+
+def load_remote_probes():
+    """Devuelve los últimos diagnósticos guardados, indexados por nombre de remoto"""
+    try:
+        with open(REMOTE_PROBES_FILE) as f:
+            data = json.load(f)
+        return {name: RemoteProbe(**values) for name, values in data.items()}
+    except (OSError, ValueError, TypeError):
+        return {}
+
+# Solo permisos declarados; la versión anterior guardaba permisos ya combinados con las anulaciones
+PERMISSIONS_CACHE_FILE = CACHE_DIR / "declared_permissions.json"
+METADATA_WORKERS = min(8, os.cpu_count() or 2)
+
+# Directorios de anulaciones de permisos (flatpak override)
+OVERRIDE_DIRS = [
+    Path("/var/lib/flatpak/overrides"),
+    Path.home() / ".local" / "share" / "flatpak" / "overrides",
+]
+
+# Claves de [Context] que contienen listas separadas por ';'
+CONTEXT_LIST_KEYS = ("shared", "sockets", "devices", "features", "filesystems", "persistent")
+# Alias aceptados en los filtros (como en las opciones de flatpak override)
+PERMISSION_ALIASES = {
+    "share": "shared", "socket": "sockets", "device": "devices",
+    "allow": "features", "feature": "features", "filesystem": "filesystems",
+    "persist": "persistent", "env": "environment",
+}
+
+def parse_keyfile(text):
+    """
+    Interpreta un archivo con formato keyfile (metadata, overrides)
+
+    Returns:
+        dict: {sección: {clave: valor}}
+    """
+    sections = {}
+    current = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            current = sections.setdefault(line[1:-1], {})
+        elif "=" in line and current is not None:
+            key, value = line.split("=", 1)
+            current[key.strip()] = value.strip()
+    return sections
+
+def merge_permissions(base, override):
+    """
+    Aplica las anulaciones sobre los permisos de la aplicación
+
+    En las listas de [Context], '!valor' elimina un permiso y 'valor' lo añade;
+    en el resto de secciones el valor anulado sustituye al original.
+    """
+    merged = {section: dict(values) for section, values in base.items()}
+    for section, values in override.items():
+        target = merged.setdefault(section, {})
+        for key, value in values.items():
+            if section == "Context" and key in CONTEXT_LIST_KEYS:
+                items = [item for item in target.get(key, "").split(";") if item]
+                for item in (item for item in value.split(";") if item):
+                    if item.startswith("!"):
+                        items = [current for current in items if current != item[1:]]
+                    elif item not in items:
+                        items.append(item)
+                target[key] = ";".join(items) + (";" if items else "")
+            else:
+                target[key] = value
+    return merged
+
+def flatten_permissions(permissions):
+    """Convierte los permisos en una lista de cadenas 'clave=valor'"""
+    entries = []
+    for section, values in permissions.items():
+        prefix = "" if section == "Context" else f"{section}:"
+        for key, value in values.items():
+            if section == "Context" and key in CONTEXT_LIST_KEYS:
+                entries.extend(f"{key}={item}" for item in value.split(";") if item)
+            else:
+                entries.append(f"{prefix}{key}={value}")
+    return entries
+
+def permissions_match(permissions, query):
+    """
+    Indica si los permisos cumplen el filtro
+
+    El filtro se compone de términos separados por espacios que deben
+    cumplirse todos. Un término 'clave=valor' compara con los permisos
+    (admitiendo alias como filesystem=host y sufijos como host:ro); cualquier
+    otro término se busca como texto.
+    """
+    entries = [entry.lower() for entry in flatten_permissions(permissions)]
+    for term in query.lower().split():
+        if "=" in term:
+            key, value = term.split("=", 1)
+            key = PERMISSION_ALIASES.get(key, key)
+            wanted = f"{key}={value}"
+            if not any(entry == wanted or entry.startswith(wanted + ":")
+                       or entry.endswith(":" + wanted) for entry in entries):
+                return False
+        elif not any(term in entry for entry in entries):
+            return False
+    return True
+
+def read_overrides(app_id):
+    """Lee las anulaciones de permisos globales y de la aplicación en todas las instalaciones"""
+    overrides = {}
+    for directory in OVERRIDE_DIRS:
+        for name in ("global", app_id):
+            try:
+                text = (directory / name).read_text()
+            except OSError:
+                continue
+            overrides = merge_permissions(overrides, parse_keyfile(text))
+    return overrides
+
+class CommitCache:
+    """
+    Caché en disco de datos por ref, invalidada cuando cambia el commit desplegado
+
+    Es segura para usarse desde varios hilos a la vez.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path) as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def get(self, ref, commit):
+        """Devuelve los datos guardados para ref si corresponden al commit, o None"""
+        with self._lock:
+            entry = self._entries.get(ref)
+        if entry and entry.get("commit") == commit:
+            return entry.get("data")
+        return None
+
+    def put(self, ref, commit, data):
+        """Guarda los datos de ref para el commit indicado"""
+        with self._lock:
+            self._entries[ref] = {"commit": commit, "data": data}
+
+    def prune(self, refs):
+        """Elimina las entradas de refs que ya no están instaladas"""
+        with self._lock:
+            for ref in set(self._entries) - set(refs):
+                del self._entries[ref]
+
+    def save(self):
+        """Escribe la caché en disco"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            data = json.dumps(self._entries)
+        with open(self.path, "w") as f:
+            f.write(data)
+
+def fetch_permissions(ref):
+    """
+    Obtiene los permisos declarados en el metadata de una ref
+
+    Se lee el metadata del commit y no --show-permissions, que ya incluye las
+    anulaciones actuales: estas se combinan aparte, leídas de disco cada vez.
+    """
+    output = subprocess.check_output(
+        ["flatpak", "info", "--show-metadata", ref], text=True, stderr=subprocess.DEVNULL)
+    return {section: values for section, values in parse_keyfile(output).items()
+            if section in ("Context", "Environment", "Session Bus Policy", "System Bus Policy")
+            or section.startswith("Policy ")}
+
+def load_app_permissions(log, cache, max_workers=METADATA_WORKERS):
+    """
+    Obtiene los permisos efectivos de todas las aplicaciones instaladas
+
+    Los permisos declarados se consultan en paralelo con un número limitado
+    de hilos y solo para las aplicaciones cuyo commit no está en la caché.
+    Las anulaciones se leen directamente de disco en cada carga.
+
+    Returns:
+        dict: {id de aplicación: {"ref", "commit", "permissions", "overrides", "effective"}}
+    """
+    apps = [item for item in list_installed_refs() if item["ref"].startswith("app/")]
+    missing = [item for item in apps if cache.get(item["ref"], item["commit"]) is None]
+    if missing:
+        log(f"Consultando permisos de {len(missing)} de {len(apps)} aplicaciones...")
+
+        def fetch(item):
+            try:
+                return item, fetch_permissions(item["ref"])
+            except (subprocess.CalledProcessError, OSError):
+                return item, None
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for item, permissions in executor.map(fetch, missing):
+                if permissions is None:
+                    log(f"No se pudieron obtener los permisos de {item['ref']}")
+                    continue
+                cache.put(item["ref"], item["commit"], permissions)
+        cache.prune([item["ref"] for item in apps])
+        cache.save()
+
+    result = {}
+    for item in apps:
+        app_id = item["ref"].split("/")[1]
+        permissions = cache.get(item["ref"], item["commit"]) or {}
+        overrides = read_overrides(app_id)
+        result[app_id] = {
+            "ref": item["ref"],
+            "commit": item["commit"],
+            "permissions": permissions,
+            "overrides": overrides,
+            "effective": merge_permissions(permissions, overrides),
+        }
+    return result
+
+APP_DETAILS_CACHE_SIZE = 64   # entradas en la caché LRU de detalles
+PREFETCH_RADIUS = 2           # filas vecinas que se precargan al seleccionar
+
+class LRUCache:
+    """Caché LRU acotada y segura entre hilos"""
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Devuelve el valor y lo marca como usado recientemente, o None"""
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        """Guarda un valor, descartando el menos usado si se supera el tamaño"""
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def pop(self, key):
+        """Elimina una entrada si existe"""
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        """Vacía la caché"""
+        with self._lock:
+            self._items.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+def load_installed_apps(log=None):
+    """
+    Obtiene las aplicaciones instaladas con los datos que muestra flatpak list
+
+    Returns:
+        list: Diccionarios ordenados por nombre con application, name, description,
+              version, ref, commit, origin, size e installation
+    """
+    keys = ["application", "name", "description", "version", "ref", "active",
+            "origin", "size", "installation"]
+    output = subprocess.check_output(
+        ["flatpak", "list", "--app", f"--columns={','.join(keys)}"], text=True)
+    apps = []
+    for line in output.splitlines():
+        fields = line.split("\t")
+        if len(fields) < len(keys) or "/" not in fields[4]:
+            continue
+        app = dict(zip(keys, (value.strip() for value in fields)))
+        app["commit"] = app.pop("active")
+        apps.append(app)
+    return sorted(apps, key=lambda app: (app["name"] or app["application"]).lower())
+
+def parse_info_output(text):
+    """Interpreta la salida 'Clave: valor' de flatpak info"""
+    info = {}
+    for line in text.splitlines():
+        if ": " in line:
+            key, value = line.split(": ", 1)
+            info[key.strip()] = value.strip()
+    return info
+
+def fetch_app_details(app, permissions_cache):
+    """
+    Reúne los detalles de una aplicación para el panel de detalles
+
+    Los permisos se toman de la caché por commit si están disponibles.
+    """
+    output = subprocess.check_output(
+        ["flatpak", "info", app["ref"]], text=True, env=c_locale_env(), stderr=subprocess.DEVNULL)
+    info = parse_info_output(output)
+    permissions = permissions_cache.get(app["ref"], app["commit"])
+    if permissions is None:
+        permissions = fetch_permissions(app["ref"])
+        permissions_cache.put(app["ref"], app["commit"], permissions)
+    return {
+        "info": info,
+        "permissions": merge_permissions(permissions, read_overrides(app["application"])),
+    }
+
+ICON_SIZE = 32                       # píxeles de los iconos de la lista
+ICON_CACHE_DIR = CACHE_DIR / "icons"
+PIXMAP_CACHE_LIMIT = 10 * 1024       # KB de iconos decodificados en memoria
+# Iconos exportados por las aplicaciones, en orden de preferencia
+EXPORT_ICON_DIRS = [
+    Path("/var/lib/flatpak/exports/share/icons/hicolor"),
+    Path.home() / ".local" / "share" / "flatpak" / "exports" / "share" / "icons" / "hicolor",
+]
+ICON_SIZE_DIRS = ["64x64", "128x128", "48x48", "96x96", "256x256", "scalable", "512x512", "32x32"]
+
+def find_app_icon(app):
+    """Busca el icono exportado de una aplicación (PNG o SVG)"""
+    roots = EXPORT_ICON_DIRS if app["installation"] != "user" else EXPORT_ICON_DIRS[::-1]
+    for root in roots:
+        for size in ICON_SIZE_DIRS:
+            for extension in ("png", "svg"):
+                path = root / size / "apps" / f"{app['application']}.{extension}"
+                if path.exists():
+                    return path
+    return None
+
+class IconLoader(QObject):
+    """
+    Decodifica los iconos de las aplicaciones fuera del hilo de la interfaz
+
+    Los iconos ya escalados se guardan en disco por aplicación y commit, de
+    forma que en los siguientes arranques solo se lee una miniatura PNG
+    pequeña. La conversión a QPixmap y la caché en memoria (QPixmapCache)
+    se hacen en el hilo principal al recibir la señal loaded.
+    """
+    loaded = pyqtSignal(str, QImage)
+
+    def __init__(self, size=ICON_SIZE, parent=None):
+        super().__init__(parent)
+        self.size = size
+        self._executor = ThreadPoolExecutor(max_workers=2)
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def key(self, app):
+        """Clave del icono de una aplicación en las cachés"""
+        return f"{app['application']}-{app['commit'][:16]}-{self.size}"
+
+    def request(self, app):
+        """Solicita el icono de app si no se está cargando ya"""
+        key = self.key(app)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self._executor.submit(self._load, app, key)
+
+    def _load(self, app, key):
+        try:
+            thumbnail = ICON_CACHE_DIR / f"{key}.png"
+            image = QImage(str(thumbnail)) if thumbnail.exists() else QImage()
+            if image.isNull():
+                path = find_app_icon(app)
+                if path is None:
+                    return
+                reader = QImageReader(str(path))
+                reader.setScaledSize(QSize(self.size, self.size))
+                image = reader.read()
+                if image.isNull():
+                    return
+                ICON_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                image.save(str(thumbnail), "PNG")
+            self.loaded.emit(key, image)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def prune(self, apps):
+        """Elimina de disco las miniaturas de commits que ya no están instalados"""
+        valid = {f"{self.key(app)}.png" for app in apps}
+
+        def remove_stale():
+            try:
+                entries = list(os.scandir(ICON_CACHE_DIR))
+            except OSError:
+                return
+            for entry in entries:
+                if entry.name.endswith(f"-{self.size}.png") and entry.name not in valid:
+                    try:
+                        os.unlink(entry.path)
+                    except OSError:
+                        pass
+
+        self._executor.submit(remove_stale)
+
+    def shutdown(self):
+        """Cancela las cargas pendientes"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+class AppDetailsLoader(QObject):
+    """
+    Carga los detalles de aplicaciones en hilos de fondo y los guarda en una caché LRU
+
+    La caché se indexa por (ref, commit), de modo que una actualización hecha
+    por cualquier vía deja de mostrar los detalles del commit anterior.
+    Las peticiones repetidas mientras una carga está en curso se ignoran.
+    """
+    loaded = pyqtSignal(object, object)  # (ref, commit), detalles
+
+    def __init__(self, permissions_cache, parent=None):
+        super().__init__(parent)
+        self.permissions_cache = permissions_cache
+        self.cache = LRUCache(APP_DETAILS_CACHE_SIZE)
+        self._executor = ThreadPoolExecutor(max_workers=2)
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(app):
+        """Clave de caché de los detalles de app"""
+        return (app["ref"], app["commit"])
+
+    def get(self, app):
+        """Devuelve los detalles guardados de app o None"""
+        return self.cache.get(self.key(app))
+
+    def request(self, app):
+        """Solicita los detalles de app si no están en caché ni en curso"""
+        key = self.key(app)
+        if key in self.cache:
+            return
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending.add(key)
+        self._executor.submit(self._load, app)
+
+    def _load(self, app):
+        key = self.key(app)
+        try:
+            details = fetch_app_details(app, self.permissions_cache)
+        except (subprocess.CalledProcessError, OSError) as e:
+            details = {"error": str(e)}
+        else:
+            self.cache.put(key, details)
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+        self.loaded.emit(key, details)
+
+    def invalidate(self, app):
+        """Descarta los detalles guardados de app"""
+        self.cache.pop(self.key(app))
+
+    def shutdown(self):
+        """Cancela las cargas pendientes"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+FLATPAK_INSTANCES_DIR = Path(os.environ.get("XDG_RUNTIME_DIR", f"/run/user/{os.getuid()}")) / ".flatpak"
+MONITOR_DEFAULT_INTERVAL = 2  # segundos
+
+def _read_pid(path):
+    """Lee un PID de un archivo de texto, devolviendo 0 si no es posible"""
+    try:
+        return int(path.read_text().strip())
+    except (OSError, ValueError):
+        return 0
+
+def list_running_instances():
+    """
+    Obtiene las instancias de Flatpak en ejecución sin lanzar subprocesos
+
+    Lee los directorios de instancia en $XDG_RUNTIME_DIR/.flatpak, igual que
+    hace flatpak ps.
+
+    Returns:
+        list: Diccionarios con instance, app y pid (proceso bwrap)
+    """
+    instances = []
+    try:
+        entries = list(os.scandir(FLATPAK_INSTANCES_DIR))
+    except OSError:
+        return instances
+    for entry in entries:
+        if not entry.is_dir():
+            continue
+        directory = Path(entry.path)
+        try:
+            info = parse_keyfile((directory / "info").read_text())
+        except OSError:
+            continue
+        pid = _read_pid(directory / "pid")
+        if not pid:
+            try:
+                with open(directory / "bwrapinfo.json") as f:
+                    pid = int(json.load(f).get("child-pid", 0))
+            except (OSError, ValueError, TypeError):
+                pid = 0
+        if not pid or not os.path.exists(f"/proc/{pid}"):
+            continue
+        app = info.get("Application", {}).get("name") or info.get("Runtime", {}).get("runtime", "")
+        instances.append({"instance": entry.name, "app": app, "pid": pid})
+    return sorted(instances, key=lambda instance: (instance["app"], instance["instance"]))
+
+def running_app_ids():
+    """Devuelve el conjunto de aplicaciones con alguna instancia en ejecución"""
+    return {instance["app"] for instance in list_running_instances()}
+
+@dataclass
+class InstanceSample:
+    """Consumo de recursos de una instancia en ejecución"""
+    instance: str
+    app: str
+    pid: int
+    processes: int = 0
+    cpu_percent: float = 0.0
+    rss: int = 0
+    read_rate: float = 0.0
+    write_rate: float = 0.0
+
+class ProcessSampler:
+    """
+    Muestrea CPU, memoria y E/S de los árboles de procesos de las instancias
+
+    Solo lee /proc: el árbol de cada instancia se recorre con los archivos
+    task/*/children y los contadores se comparan con la muestra anterior de
+    cada PID para obtener tasas, sin lanzar ningún subproceso por muestra.
+    """
+    def __init__(self):
+        self.clock_ticks = os.sysconf("SC_CLK_TCK")
+        self.page_size = os.sysconf("SC_PAGE_SIZE")
+        self._previous = {}
+
+    @staticmethod
+    def _children(pid):
+        """Devuelve los hijos directos de un proceso"""
+        children = []
+        try:
+            tasks = os.listdir(f"/proc/{pid}/task")
+        except OSError:
+            return children
+        for task in tasks:
+            try:
+                with open(f"/proc/{pid}/task/{task}/children") as f:
+                    children.extend(int(child) for child in f.read().split())
+            except OSError:
+                continue
+        return children
+
+    def process_tree(self, root):
+        """Devuelve los PID del árbol de procesos que cuelga de root"""
+        pids = []
+        pending = [root]
+        while pending:
+            pid = pending.pop()
+            pids.append(pid)
+            pending.extend(self._children(pid))
+        return pids
+
+    def _read_counters(self, pid):
+        """Lee los contadores de CPU (ticks), memoria residente y E/S de un proceso"""
+        with open(f"/proc/{pid}/stat") as f:
+            # El nombre del proceso puede contener espacios: partir tras el último ')'
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = int(fields[11]) + int(fields[12])
+        with open(f"/proc/{pid}/statm") as f:
+            rss = int(f.read().split()[1]) * self.page_size
+        read_bytes = write_bytes = 0
+        try:
+            with open(f"/proc/{pid}/io") as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    if key == "read_bytes":
+                        read_bytes = int(value)
+                    elif key == "write_bytes":
+                        write_bytes = int(value)
+        except OSError:
+            pass
+        return ticks, rss, read_bytes, write_bytes
+
+    def sample(self, instances):
+        """
+        Toma una muestra de todas las instancias
+
+        Returns:
+            list: Objetos InstanceSample
+        """
+        now = time.monotonic()
+        current = {}
+        samples = []
+        for instance in instances:
+            sample = InstanceSample(instance["instance"], instance["app"], instance["pid"])
+            for pid in self.process_tree(instance["pid"]):
+                try:
+                    ticks, rss, read_bytes, write_bytes = self._read_counters(pid)
+                except (OSError, ValueError, IndexError):
+                    continue  # El proceso terminó durante la lectura
+                current[pid] = (now, ticks, read_bytes, write_bytes)
+                sample.processes += 1
+                sample.rss += rss
+                previous = self._previous.get(pid)
+                if previous is None:
+                    continue
+                elapsed = now - previous[0]
+                if elapsed <= 0:
+                    continue
+                sample.cpu_percent += (ticks - previous[1]) / self.clock_ticks / elapsed * 100
+                sample.read_rate += max(read_bytes - previous[2], 0) / elapsed
+                sample.write_rate += max(write_bytes - previous[3], 0) / elapsed
+            samples.append(sample)
+        self._previous = current
+        return samples
+
+def kill_app(app_id):
+    """Detiene todas las instancias de una aplicación con flatpak kill"""
+    return run_recorded(["flatpak", "kill", app_id]).returncode == 0
+
+METADATA_CACHE_FILE = CACHE_DIR / "metadata.json"
+
+def fetch_ref_metadata(ref):
+    """
+    Obtiene el metadata y el estado de fin de vida de una ref instalada
+
+    Returns:
+        dict: metadata (keyfile interpretado), eol y eol_rebase
+    """
+    metadata = subprocess.check_output(
+        ["flatpak", "info", "--show-metadata", ref], text=True, stderr=subprocess.DEVNULL)
+    info = parse_info_output(subprocess.check_output(
+        ["flatpak", "info", ref], text=True, env=c_locale_env(), stderr=subprocess.DEVNULL))
+    return {
+        "metadata": parse_keyfile(metadata),
+        "eol": info.get("End-of-life", ""),
+        "eol_rebase": info.get("End-of-life-rebase", ""),
+    }
+
+def list_installed_with_runtime():
+    """
+    Obtiene todas las refs instaladas con su runtime, tamaño y commit activo
+
+    Returns:
+        list: Diccionarios con ref, runtime, size, commit e installation
+    """
+    output = subprocess.check_output(
+        ["flatpak", "list", "--columns=ref,runtime,size,active,installation"], text=True)
+    refs = []
+    for line in output.splitlines():
+        fields = line.split("\t")
+        if len(fields) < 5 or "/" not in fields[0]:
+            continue
+        refs.append({
+            "ref": fields[0].strip(),
+            "runtime": fields[1].strip(),
+            "size": parse_size(fields[2]),
+            "commit": fields[3].strip(),
+            "installation": fields[4].strip(),
+        })
+    return refs
+
+class DependencyGraph:
+    """
+    Grafo en memoria de dependencias aplicación → runtime → extensión
+
+    Una arista A → B indica que A usa B: una aplicación usa su runtime y
+    cualquier ref usa las extensiones instaladas que encajan en sus puntos
+    de extensión ([Extension ...] del metadata), como los drivers GL o los
+    paquetes de idioma. El grafo se construye una vez y después se
+    sincroniza de forma incremental con sync().
+    """
+    def __init__(self):
+        self.nodes = {}      # ref -> datos de la ref instalada y su metadata
+        self.depends = {}    # ref -> refs que usa
+        self.users = {}      # ref -> refs que la usan
+
+    @staticmethod
+    def _parts(ref):
+        kind, ref_id, arch, branch = (ref.split("/") + ["", "", ""])[:4]
+        return kind, ref_id, arch, branch
+
+    def _extension_points(self, ref):
+        """Devuelve (nombre, versiones) de los puntos de extensión de una ref"""
+        node = self.nodes[ref]
+        branch = self._parts(ref)[3]
+        points = []
+        for section, values in node.get("metadata", {}).items():
+            if not section.startswith("Extension "):
+                continue
+            name = section[len("Extension "):].strip()
+            versions = values.get("versions") or values.get("version") or branch
+            points.append((name, {version for version in versions.split(";") if version}))
+        return points
+
+    def _provides(self, point, ref):
+        """Indica si ref encaja en el punto de extensión (nombre, versiones)"""
+        name, versions = point
+        kind, ref_id, arch, branch = self._parts(ref)
+        return (kind == "runtime" and branch in versions
+                and (ref_id == name or ref_id.startswith(name + ".")))
+
+    def _link(self, user, used):
+        if user != used:
+            self.depends.setdefault(user, set()).add(used)
+            self.users.setdefault(used, set()).add(user)
+
+    def _connect(self, ref):
+        """Crea las aristas de ref con el resto de nodos en ambos sentidos"""
+        node = self.nodes[ref]
+        arch = self._parts(ref)[2]
+        if node.get("runtime"):
+            runtime = f"runtime/{node['runtime']}"
+            if runtime in self.nodes:
+                self._link(ref, runtime)
+        for point in self._extension_points(ref):
+            for other in self.nodes:
+                if self._parts(other)[2] == arch and self._provides(point, other):
+                    self._link(ref, other)
+        # Refs existentes que usan a la nueva como runtime o extensión
+        for other, other_node in self.nodes.items():
+            if other == ref:
+                continue
+            if other_node.get("runtime") and f"runtime/{other_node['runtime']}" == ref:
+                self._link(other, ref)
+            if self._parts(other)[2] == arch and any(
+                    self._provides(point, ref) for point in self._extension_points(other)):
+                self._link(other, ref)
+
+    def add(self, item, details):
+        """Añade o reemplaza una ref instalada en el grafo"""
+        if item["ref"] in self.nodes:
+            self.remove(item["ref"])
+        self.nodes[item["ref"]] = dict(item, **details)
+        self._connect(item["ref"])
+
+    def copy(self):
+        """Devuelve una copia independiente para sincronizarla en otro hilo"""
+        graph = DependencyGraph()
+        graph.nodes = dict(self.nodes)  # Los nodos no se modifican: add() los reemplaza
+        graph.depends = {ref: set(refs) for ref, refs in self.depends.items()}
+        graph.users = {ref: set(refs) for ref, refs in self.users.items()}
+        return graph
+
+    def remove(self, ref):
+        """Elimina una ref y sus aristas del grafo"""
+        self.nodes.pop(ref, None)
+        for used in self.depends.pop(ref, set()):
+            self.users.get(used, set()).discard(ref)
+        for user in self.users.pop(ref, set()):
+            self.depends.get(user, set()).discard(ref)
+
+    def sync(self, log, installed, cache, max_workers=METADATA_WORKERS):
+        """
+        Sincroniza el grafo con las refs instaladas
+
+        Solo se añaden las refs nuevas o con otro commit y se eliminan las
+        desinstaladas; el metadata se consulta en paralelo y solo si no está
+        en la caché por commit.
+        """
+        installed = {item["ref"]: item for item in installed}
+        for ref in set(self.nodes) - set(installed):
+            self.remove(ref)
+        changed = [item for ref, item in installed.items()
+                   if ref not in self.nodes or self.nodes[ref].get("commit") != item["commit"]]
+        missing = [item for item in changed if cache.get(item["ref"], item["commit"]) is None]
+        if missing:
+            log(f"Consultando metadata de {len(missing)} refs...")
+
+            def fetch(item):
+                try:
+                    return item, fetch_ref_metadata(item["ref"])
+                except (subprocess.CalledProcessError, OSError):
+                    return item, None
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for item, details in executor.map(fetch, missing):
+                    if details is not None:
+                        cache.put(item["ref"], item["commit"], details)
+            cache.prune(installed)
+            cache.save()
+        for item in changed:
+            self.add(item, cache.get(item["ref"], item["commit"]) or {})
+        return self
+
+    def users_of(self, ref, transitive=True):
+        """Devuelve las refs que usan ref, directa o indirectamente"""
+        found = set()
+        pending = list(self.users.get(ref, ()))
+        while pending:
+            user = pending.pop()
+            if user in found:
+                continue
+            found.add(user)
+            if transitive:
+                pending.extend(self.users.get(user, ()))
+        return found
+
+    def unused(self):
+        """Devuelve los runtimes y extensiones que ninguna ref usa"""
+        return {ref for ref in self.nodes
+                if ref.startswith("runtime/") and not self.users.get(ref)}
+
+    def removable_after(self, refs):
+        """
+        Devuelve las refs que quedarían sin uso al desinstalar refs
+
+        No incluye las refs que ya estaban sin uso antes de desinstalar.
+        """
+        removed = set(refs)
+        candidates = set()
+        changed = True
+        while changed:
+            changed = False
+            for ref, users in self.users.items():
+                if ref in removed or ref not in self.nodes or not users:
+                    continue
+                if users <= removed:
+                    removed.add(ref)
+                    candidates.add(ref)
+                    changed = True
+        return candidates
+
+    def end_of_life(self):
+        """Devuelve {ref: motivo} de las refs instaladas marcadas como fin de vida"""
+        return {ref: node.get("eol") for ref, node in self.nodes.items() if node.get("eol")}
+
+    def size_of(self, refs):
+        """Suma el tamaño instalado de las refs"""
+        return sum(self.nodes.get(ref, {}).get("size", 0) for ref in refs)
+
+    def reclaimable(self):
+        """Devuelve el espacio que liberaría eliminar las refs sin uso (flatpak uninstall --unused)"""
+        unused = self.unused()
+        return self.size_of(unused | self.removable_after(unused))
+
+def load_dependency_graph(log, graph, cache):
+    """
+    Sincroniza el grafo de dependencias con lo instalado y lo devuelve
+
+    El grafo debe ser una copia (DependencyGraph.copy) que no use ningún otro hilo.
+    """
+    return graph.sync(log, list_installed_with_runtime(), cache)
+
+def commit_is_local(commit, installation):
+    """Indica si el objeto del commit ya está en el repositorio local de la instalación"""
+    repo = installation_repo(installation)
+    return (repo / "objects" / commit[:2] / f"{commit[2:]}.commit").exists()
+
+def fetch_commit_log(log, app):
+    """
+    Obtiene el historial de commits de una aplicación en su remoto
+
+    Returns:
+        list: Diccionarios con commit, subject, date y local, del más reciente al más antiguo
+    """
+    output = subprocess.check_output(
+        ["flatpak", "remote-info", "--log", app["origin"], app["ref"]],
+        text=True, env=c_locale_env(), stderr=subprocess.STDOUT)
+    commits = []
+    for line in output.splitlines():
+        key, _, value = line.strip().partition(": ")
+        if key == "Commit":
+            commits.append({"commit": value.strip(), "subject": "", "date": ""})
+        elif commits and key in ("Subject", "Date"):
+            commits[-1][key.lower()] = value.strip()
+    # El commit de cabecera aparece también en el historial
+    unique = []
+    for entry in commits:
+        if all(entry["commit"] != other["commit"] for other in unique):
+            entry["local"] = commit_is_local(entry["commit"], app["installation"])
+            unique.append(entry)
+    return unique
+
+VAR_APP_DIR = Path.home() / ".var" / "app"
+DATA_USAGE_CACHE_FILE = CACHE_DIR / "data_usage.json"
+
+@dataclass
+class AppDataUsage:
+    """Espacio ocupado por los datos de usuario de una aplicación en ~/.var/app"""
+    app: str
+    path: str
+    size: int
+    installed: bool
+
+def directory_size(root, cache, seen):
+    """
+    Suma el espacio en disco de un árbol de directorios recorriéndolo con os.scandir
+
+    Por cada directorio se guarda en cache [mtime, espacio de sus archivos,
+    subdirectorios]. Si su mtime no ha cambiado no se vuelve a listar y solo
+    se comprueban sus subdirectorios. Como el mtime de un directorio solo
+    cambia al crear, borrar o renombrar entradas, un archivo existente que
+    crece no se detecta hasta el siguiente cambio en su directorio.
+
+    Args:
+        root (str): Directorio a medir
+        cache (dict): Entradas del análisis anterior por ruta (solo lectura)
+        seen (dict): Recibe las entradas vigentes de este análisis
+
+    Returns:
+        int: Bytes ocupados en disco
+    """
+    total = 0
+    pending = [root]
+    while pending:
+        path = pending.pop()
+        try:
+            mtime = os.stat(path, follow_symlinks=False).st_mtime_ns
+        except OSError:
+            continue
+        entry = cache.get(path)
+        if entry is None or entry[0] != mtime:
+            files = 0
+            subdirs = []
+            try:
+                with os.scandir(path) as entries:
+                    for item in entries:
+                        try:
+                            if item.is_dir(follow_symlinks=False):
+                                subdirs.append(item.name)
+                            else:
+                                files += item.stat(follow_symlinks=False).st_blocks * 512
+                        except OSError:
+                            pass
+            except OSError:
+                continue
+            entry = [mtime, files, subdirs]
+        seen[path] = entry
+        total += entry[1]
+        pending.extend(os.path.join(path, name) for name in entry[2])
+    return total
+
+def scan_app_data(log=None, max_workers=METADATA_WORKERS):
+    """
+    Mide en paralelo los datos de cada aplicación en ~/.var/app
+
+    Los tamaños por directorio se guardan en DATA_USAGE_CACHE_FILE, de modo
+    que volver a analizar solo lista los directorios que han cambiado.
+
+    Returns:
+        list: AppDataUsage ordenados de mayor a menor tamaño
+    """
+    try:
+        with open(DATA_USAGE_CACHE_FILE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    try:
+        with os.scandir(VAR_APP_DIR) as entries:
+            roots = [entry.path for entry in entries if entry.is_dir(follow_symlinks=False)]
+    except FileNotFoundError:
+        roots = []
+    installed = set()
+    for item in list_installed_refs():
+        parts = item["ref"].split("/")
+        installed.add(parts[1] if parts[0] in ("app", "runtime") else parts[0])
+
+    def scan(root):
+        seen = {}
+        return directory_size(root, cache, seen), seen
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(scan, roots))
+
+    usage = []
+    entries = {}
+    for root, (size, seen) in zip(roots, results):
+        entries.update(seen)
+        app = os.path.basename(root)
+        usage.append(AppDataUsage(app, root, size, app in installed))
+    if log:
+        reused = sum(1 for path, entry in entries.items() if cache.get(path) is entry)
+        log(f"Analizados {len(entries)} directorios de {len(roots)} aplicaciones "
+            f"({reused} sin cambios desde el análisis anterior)")
+    # Las rutas que ya no existen se descartan al guardar solo las vistas ahora
+    DATA_USAGE_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(DATA_USAGE_CACHE_FILE, "w") as f:
+        json.dump(entries, f)
+    return sorted(usage, key=lambda item: -item.size)
+
+def remove_app_data(log, paths):
+    """
+    Elimina directorios de datos de ~/.var/app
+
+    Returns:
+        list: Rutas eliminadas
+    """
+    removed = []
+    for path in paths:
+        # Nunca se borra nada que no sea un directorio de aplicación de ~/.var/app
+        if Path(path).parent != VAR_APP_DIR or Path(path).is_symlink():
+            log(f"Se omite {path}: no es un directorio de ~/.var/app")
+            continue
+        try:
+            shutil.rmtree(path)
+        except OSError as e:
+            log(f"No se pudo eliminar {path}: {e}")
+            continue
+        log(f"Eliminado {path}")
+        removed.append(path)
+    return removed
+
+VERIFY_CACHE_FILE = CACHE_DIR / "verified.json"
+VERIFY_WORKERS = min(4, METADATA_WORKERS)  # ostree diff lee todos los archivos: limitado por E/S
+
+def installation_flag(installation):
+    """Devuelve la opción de flatpak para operar sobre una instalación ('system' o 'user')"""
+    return "--user" if installation == "user" else "--system"
+
+def is_deploy_only_path(status, path, subpaths=(), extra_data=False):
+    """
+    Indica si una diferencia entre el despliegue y su commit es normal
+
+    Flatpak reescribe los archivos exportados (.desktop, servicios D-Bus) y
+    añade sus propios archivos de control al desplegar una ref. Las refs con
+    subpaths (como las extensiones .Locale, que solo se despliegan para los
+    idiomas configurados) no contienen el resto de files/, y las de extra-data
+    descargan files/extra al instalarse.
+
+    Args:
+        status (str): 'M', 'D' o 'A', como en ostree diff
+        path (str): Ruta dentro del commit
+        subpaths (list): Subpaths desplegados (ej: ['/de', '/en']); vacío si es completo
+        extra_data (bool): La ref usa extra-data
+    """
+    if path == "/export" or path.startswith("/export/"):
+        return True
+    if extra_data and status == "A" and (path == "/files/extra" or path.startswith("/files/extra/")):
+        return True
+    if subpaths and status == "D" and path.startswith("/files/"):
+        relative = path[len("/files"):]
+        # Directorios padre de un subpath y rutas dentro de uno se comparan; el resto no se despliega
+        if not any(relative == subpath or relative.startswith(subpath.rstrip("/") + "/")
+                   or subpath.startswith(relative + "/") for subpath in subpaths):
+            return True
+    return status == "A" and path in ("/deploy", "/.ref", "/files/.ref")
+
+def filter_deploy_diff(output, subpaths=(), extra_data=False):
+    """
+    Extrae de la salida de ostree diff las diferencias que indican daños
+
+    Returns:
+        list: Diferencias 'M ruta', 'D ruta' o 'A ruta'
+    """
+    problems = []
+    for line in output.splitlines():
+        fields = line.split(None, 1)
+        if (len(fields) == 2 and fields[0] in ("M", "D", "A")
+                and not is_deploy_only_path(fields[0], fields[1], subpaths, extra_data)):
+            problems.append(f"{fields[0]} {fields[1]}")
+    return problems
+
+def deploy_subpaths(item):
+    """Devuelve los subpaths desplegados de una ref según flatpak info (vacío si es completa)"""
+    output = subprocess.check_output(
+        ["flatpak", "info", installation_flag(item["installation"]), item["ref"]],
+        text=True, env=c_locale_env(), stderr=subprocess.DEVNULL)
+    value = parse_info_output(output).get("Subdirectories", "")
+    return [subpath for subpath in re.split(r"[\s,;]+", value) if subpath.startswith("/")]
+
+def verify_ref(item):
+    """
+    Compara el contenido desplegado de una ref con su commit en el repositorio local
+
+    Args:
+        item (dict): Ref instalada, como la devuelve list_installed_refs
+
+    Returns:
+        list: Diferencias 'M ruta', 'D ruta' o 'A ruta' (vacía si la ref está íntegra)
+    """
+    location = subprocess.check_output(
+        ["flatpak", "info", installation_flag(item["installation"]), "--show-location", item["ref"]],
+        text=True, stderr=subprocess.DEVNULL).strip()
+    try:
+        metadata = parse_keyfile((Path(location) / "metadata").read_text())
+    except OSError:
+        metadata = {}
+    # Los objetos se guardan con propietario 0:0 y sin xattrs; se compara igual el despliegue
+    result = subprocess.run(
+        ["ostree", "diff", f"--repo={installation_repo(item['installation'])}", "--no-xattrs",
+         "--owner-uid=0", "--owner-gid=0", item["commit"], location],
+        capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"ostree diff terminó con código {result.returncode}")
+    return filter_deploy_diff(result.stdout, deploy_subpaths(item), "Extra Data" in metadata)
+
+def verify_refs(log, cache, force=False, refs=None, max_workers=VERIFY_WORKERS):
+    """
+    Verifica en paralelo las refs instaladas cuyo commit actual no se ha verificado aún
+
+    Las refs íntegras se guardan en cache con su commit, así que las
+    siguientes verificaciones solo comprueban las refs instaladas o
+    actualizadas desde entonces.
+
+    Args:
+        log (callable): Función de registro
+        cache (CommitCache): Commits ya verificados por ref
+        force (bool): Verificar también las refs ya verificadas
+        refs (list): Limitar la verificación a estas refs (opcional)
+
+    Returns:
+        dict: ref -> datos de la ref instalada con la lista problems, solo de las dañadas
+    """
+    if shutil.which("ostree") is None:
+        raise RuntimeError("La verificación necesita el comando ostree")
+    installed = list_installed_refs()
+    candidates = [item for item in installed if refs is None or item["ref"] in refs]
+    pending = [item for item in candidates
+               if force or cache.get(item["ref"], item["commit"]) is None]
+    log(f"Refs ya verificadas en su commit actual: {len(candidates) - len(pending)}; "
+        f"por verificar: {len(pending)}")
+    corrupted = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(verify_ref, item): item for item in pending}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                problems = future.result()
+            except (OSError, RuntimeError, subprocess.CalledProcessError) as e:
+                log(f"? {item['ref']}: no se pudo verificar ({e})")
+                continue
+            if problems:
+                corrupted[item["ref"]] = dict(item, problems=problems)
+                log(f"✗ {item['ref']}: {len(problems)} archivos dañados")
+                for problem in problems[:10]:
+                    log(f"    {problem}")
+            else:
+                cache.put(item["ref"], item["commit"], time.time())
+                log(f"✓ {item['ref']}")
+    cache.prune(item["ref"] for item in installed)
+    cache.save()
+    return corrupted
+
+def remote_head_commit(item):
+    """Devuelve el commit más reciente de la ref en su remoto según el summary en caché, o ''"""
+    result = subprocess.run(
+        ["flatpak", "remote-info", installation_flag(item["installation"]), "--cached",
+         "--show-commit", item["origin"], item["ref"]],
+        capture_output=True, text=True)
+    return result.stdout.strip() if result.returncode == 0 else ""
+
+def reinstall_refs(log, items, cache):
+    """
+    Reinstala las refs dañadas y las vuelve a verificar
+
+    flatpak install --reinstall despliega el último commit del remoto, así
+    que solo se reinstalan las refs que ya están en él: las fijadas con
+    flatpak mask o desplegadas en un commit anterior (una vuelta atrás) se
+    omiten para no cambiarlas de versión.
+
+    Returns:
+        dict: Refs reinstaladas que siguen dañadas, como en verify_refs
+    """
+    masks = {installation: list_masks(installation=installation)
+             for installation in {item["installation"] for item in items}}
+    reinstalled = []
+    for item in items:
+        if is_masked(item["ref"], masks[item["installation"]]):
+            log(f"Omitiendo {item['ref']}: su versión está fijada; desfíjala o usa flatpak repair")
+            continue
+        if remote_head_commit(item) != item["commit"]:
+            log(f"Omitiendo {item['ref']}: el commit instalado no es el último del remoto "
+                f"y reinstalar lo cambiaría de versión; usa flatpak repair")
+            continue
+        log(f"Reinstalando {item['ref']}...")
+        run_process(["flatpak", "install", "--reinstall", "-y", "--noninteractive",
+                     installation_flag(item["installation"]), item["origin"], item["ref"]], log)
+        reinstalled.append(item)
+    if not reinstalled:
+        return {}
+    return verify_refs(log, cache, force=True, refs={item["ref"] for item in reinstalled})
+
+class _QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
+    """Manejador HTTP estático que no escribe cada petición en stderr"""
+    def log_message(self, format, *args):
+        pass
+
+class LocalMirror:
+    """
+    Espejo OSTree local con las refs seleccionadas
+
+    El espejo es un repositorio en modo archive que se puede servir por HTTP
+    desde esta máquina y añadir como remoto en el resto de equipos, de modo
+    que los runtimes y aplicaciones solo se descarguen de Flathub una vez.
+    """
+    def __init__(self, path=None, port=MIRROR_DEFAULT_PORT):
+        self.path = Path(path) if path else DATA_DIR / "mirror"
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    @property
+    def exists(self):
+        """Indica si el repositorio del espejo ya fue inicializado"""
+        return (self.path / "config").exists()
+
+    @property
+    def is_serving(self):
+        """Indica si el servidor HTTP está activo"""
+        return self._server is not None
+
+    @property
+    def local_url(self):
+        """URL del espejo para esta misma máquina"""
+        return f"http://127.0.0.1:{self.port}/"
+
+    def refs(self):
+        """Devuelve las refs publicadas en el espejo leyendo refs/heads"""
+        heads = self.path / "refs" / "heads"
+        if not heads.is_dir():
+            return []
+        return sorted(
+            str(path.relative_to(heads))
+            for path in heads.rglob("*") if path.is_file()
+        )
+
+    def sync(self, log, refs):
+        """
+        Copia al espejo los commits instalados de las refs indicadas y regenera el summary
+
+        El espejo no firma su summary: los clientes verifican la firma de cada
+        commit con la clave del remoto de origen, para lo que el espejo publica
+        las refs bajo el collection-id de ese remoto. Por eso todas las refs de
+        un espejo deben proceder del mismo origen.
+
+        Args:
+            log (callable): Función para informar del progreso
+            refs (list): Refs a publicar (ej: app/org.gimp.GIMP/x86_64/stable)
+
+        Returns:
+            list: Refs publicadas correctamente
+        """
+        if not self.exists:
+            self.path.mkdir(parents=True, exist_ok=True)
+            result = run_process(["ostree", f"--repo={self.path}", "init", "--mode=archive"], log)
+            if result.returncode != 0:
+                raise RuntimeError("No se pudo inicializar el repositorio del espejo")
+
+        installed = {item["ref"]: item for item in list_installed_refs()}
+        origins = [installed[ref]["origin"] for ref in refs if ref in installed]
+        origin = origins[0] if origins else ""
+        collection = remote_collection_id(origin) if origin else ""
+        if origin and not collection:
+            raise RuntimeError(f"El remoto '{origin}' no tiene collection-id; sus commits "
+                               "no se podrían verificar desde el espejo")
+        if collection:
+            result = run_process(["ostree", f"--repo={self.path}", "config", "set",
+                                  "core.collection-id", collection], log)
+            if result.returncode != 0:
+                raise RuntimeError("No se pudo asignar el collection-id al espejo")
+        published = []
+        for ref in refs:
+            item = installed.get(ref)
+            if item is None:
+                log(f"Omitiendo {ref}: no está instalada")
+                continue
+            if item["origin"] != origin:
+                log(f"Omitiendo {ref}: procede de '{item['origin']}' y el espejo es de '{origin}'")
+                continue
+            log(f"Copiando {ref} ({item['commit'][:12]})...")
+            source = installation_repo(item["installation"])
+            result = run_process(
+                ["ostree", f"--repo={self.path}", "pull-local", str(source), item["commit"]], log)
+            if result.returncode != 0:
+                log(f"Error al copiar {ref}")
+                continue
+            # Recrear la ref para que apunte al commit instalado
+            subprocess.run(["ostree", f"--repo={self.path}", "refs", "--delete", ref],
+                           capture_output=True)
+            result = run_process(
+                ["ostree", f"--repo={self.path}", "refs", f"--create={ref}", item["commit"]], log)
+            if result.returncode == 0:
+                published.append(ref)
+
+        result = run_process(["flatpak", "build-update-repo", str(self.path)], log)
+        if result.returncode != 0:
+            raise RuntimeError("No se pudo regenerar el summary del espejo")
+        return published
+
+    def start(self):
+        """Empieza a servir el espejo por HTTP en un hilo de fondo"""
+        if self._server is not None:
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        handler = partial(_QuietHTTPRequestHandler, directory=str(self.path))
+        # Se sirve en todas las interfaces para la red local; los clientes
+        # verifican la firma GPG de cada commit, así que no hace falta confiar en él
+        self._server = ThreadingHTTPServer(("", self.port), handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Detiene el servidor HTTP del espejo"""
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join(2)
+        self._server = None
+        self._thread = None
+
+METRICS_DEFAULT_PORT = 9469
+METRICS_PREFIX = "flatpak_manager_"
+# Métricas de valor único: nombre -> descripción
+METRICS_GAUGES = {
+    "installed_apps": "Aplicaciones instaladas",
+    "installed_runtimes": "Runtimes y extensiones instalados",
+    "installed_bytes": "Espacio ocupado por las refs instaladas",
+    "pending_updates": "Actualizaciones pendientes en la última búsqueda",
+    "last_update_check_timestamp_seconds": "Hora de la última búsqueda de actualizaciones",
+    "reclaimable_bytes": "Espacio que liberaría eliminar los runtimes sin uso",
+    "unused_runtimes": "Runtimes y extensiones que ninguna ref usa",
+    "end_of_life_refs": "Refs instaladas marcadas como fin de vida",
+    "last_update_failed_refs": "Refs que fallaron en la última transacción de actualización",
+    "staged_updates": "Actualizaciones descargadas pendientes de aplicar",
+    "corrupted_refs": "Refs con archivos dañados en la última verificación de integridad",
+}
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class MetricsRegistry:
+    """
+    Estado en memoria que publica el exportador de métricas
+
+    La aplicación lo actualiza cuando obtiene datos nuevos (inventario, grafo
+    de dependencias, búsquedas de actualizaciones, operaciones), de modo que
+    generar el texto para Prometheus nunca ejecuta flatpak.
+    """
+    def __init__(self):
+        self._gauges = {}
+        self._operations = {}  # operación -> [total, fallidas, segundos]
+        self._lock = threading.Lock()
+
+    def set(self, name, value):
+        """Fija el valor de una métrica de METRICS_GAUGES"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def get(self, name, default=None):
+        """Devuelve el valor de una métrica o default si aún no se conoce"""
+        with self._lock:
+            return self._gauges.get(name, default)
+
+    def observe_operation(self, operation, seconds, failed):
+        """Cuenta una operación terminada con su duración"""
+        with self._lock:
+            totals = self._operations.setdefault(operation, [0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += int(failed)
+            totals[2] += max(seconds, 0.0)
+
+    def render(self):
+        """Devuelve las métricas en el formato de texto de Prometheus"""
+        with self._lock:
+            gauges = dict(self._gauges)
+            operations = {name: list(totals) for name, totals in self._operations.items()}
+        lines = [f"# HELP {METRICS_PREFIX}info Versión del gestor",
+                 f"# TYPE {METRICS_PREFIX}info gauge",
+                 f'{METRICS_PREFIX}info{{version="{VERSION}"}} 1']
+        # Las métricas que todavía no se conocen se omiten en lugar de publicar 0
+        for name, description in METRICS_GAUGES.items():
+            if name in gauges:
+                lines += [f"# HELP {METRICS_PREFIX}{name} {description}",
+                          f"# TYPE {METRICS_PREFIX}{name} gauge",
+                          f"{METRICS_PREFIX}{name} {gauges[name]}"]
+        families = [
+            ("operations_total", "counter", "Operaciones ejecutadas por el gestor", [("", 0)]),
+            ("operation_failures_total", "counter", "Operaciones que terminaron con error", [("", 1)]),
+            ("operation_duration_seconds", "summary", "Duración de las operaciones",
+             [("_sum", 2), ("_count", 0)]),
+        ]
+        for name, kind, description, series in families:
+            lines += [f"# HELP {METRICS_PREFIX}{name} {description}",
+                      f"# TYPE {METRICS_PREFIX}{name} {kind}"]
+            for operation, totals in sorted(operations.items()):
+                label = f'{{operation="{_escape_label(operation)}"}}'
+                for suffix, index in series:
+                    lines.append(f"{METRICS_PREFIX}{name}{suffix}{label} {totals[index]}")
+        return "\n".join(lines) + "\n"
+
+METRICS = MetricsRegistry()
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Sirve /metrics desde el estado en memoria de METRICS"""
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = METRICS.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class MetricsExporter:
+    """Servidor HTTP opcional con las métricas en formato Prometheus"""
+    def __init__(self, port=METRICS_DEFAULT_PORT, address="127.0.0.1"):
+        self.port = port
+        self.address = address
+        self._server = None
+        self._thread = None
+
+    @property
+    def is_serving(self):
+        """Indica si el servidor HTTP está activo"""
+        return self._server is not None
+
+    def start(self):
+        """Empieza a servir /metrics en un hilo de fondo"""
+        if self._server is not None:
+            return
+        self._server = ThreadingHTTPServer((self.address, self.port), _MetricsRequestHandler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Detiene el servidor de métricas"""
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join(2)
+        self._server = None
+        self._thread = None
+
 class CommandThread(QThread):
     """Hilo para ejecutar comandos en segundo plano"""
     output_signal = pyqtSignal(str)
@@ -35,39 +2526,54 @@ class CommandThread(QThread):
         self._is_running = True
     
     def run(self):
+        process = None
         try:
             self._is_running = True
+            started = time.time()
+            lines = []
             process = subprocess.Popen(
                 self.command,
-                shell=True,
+                shell=isinstance(self.command, str),
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,
                 universal_newlines=True,
-                bufsize=1
+                bufsize=1,
+                start_new_session=True
             )
+            PROCESSES.add(process)
             
             while self._is_running and process.poll() is None:
                 line = process.stdout.readline()
                 if line:
+                    lines.append(line.rstrip("\n"))
                     self.output_signal.emit(line.strip())
             
             # Leer cualquier salida restante
             if not self._is_running:
+                PROCESSES.remove(process)
                 process.terminate()
+                if PROCESSES.paused:
+                    os.killpg(process.pid, signal.SIGCONT)  # Un proceso detenido no atiende SIGTERM
                 process.wait()
+                record_operation(self.command, started, time.time(), process.returncode,
+                                 "\n".join(lines))
                 return
                 
             # Leer la salida restante
             for line in process.stdout:
+                lines.append(line.rstrip("\n"))
                 if line.strip():
                     self.output_signal.emit(line.strip())
             
             process.wait()
+            record_operation(self.command, started, time.time(), process.returncode, "\n".join(lines))
             self.finished_signal.emit(process.returncode == 0, "")
             
         except Exception as e:
             self.finished_signal.emit(False, str(e))
         finally:
+            if process is not None:
+                PROCESSES.remove(process)
             self._is_running = False
     
     def stop(self):
@@ -76,6 +2582,878 @@ class CommandThread(QThread):
         self.quit()
         self.wait(2000)  # Esperar hasta 2 segundos a que termine
 
+class TaskThread(QThread):
+    """Hilo para ejecutar una función de Python en segundo plano
+
+    La función recibe como primer argumento una función de registro que
+    envía cada mensaje a output_signal. Si with_progress es verdadero, el
+    segundo argumento es una función que envía el progreso a progress_signal.
+    """
+    output_signal = pyqtSignal(str)
+    progress_signal = pyqtSignal(object)
+    result_signal = pyqtSignal(object)
+    finished_signal = pyqtSignal(bool, str)
+
+    def __init__(self, func, *args, with_progress=False):
+        super().__init__()
+        self.func = func
+        self.args = args
+        self.with_progress = with_progress
+
+    def run(self):
+        try:
+            args = self.args
+            if self.with_progress:
+                args = (self.progress_signal.emit,) + args
+            result = self.func(self.output_signal.emit, *args)
+            self.result_signal.emit(result)
+            self.finished_signal.emit(True, "")
+        except Exception as e:
+            self.finished_signal.emit(False, str(e))
+
+SCHEDULER_TICK = 15 * 60 * 1000     # ms entre revisiones de las tareas programadas
+UPDATE_CHECK_INTERVAL = 6 * 3600     # segundos entre búsquedas de actualizaciones
+CLEANUP_INTERVALS = {"Diariamente": 1, "Semanalmente": 7, "Mensualmente": 30}  # días
+OUTPUT_MAX_LINES = 5000              # líneas conservadas en la salida de comandos
+OUTPUT_BACKLOG_LINES = 500           # líneas guardadas mientras la ventana está cerrada
+TRAY_RELEASE_RETRY = 5000            # ms de espera si hay tareas al ocultar la ventana
+
+def resident_memory():
+    """Devuelve la memoria residente del proceso en bytes (0 si no se puede leer)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def release_memory():
+    """Recolecta objetos sin referencias y devuelve al sistema la memoria libre de glibc"""
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+def clean_unused(log=None):
+    """
+    Elimina los runtimes y extensiones que ya no usa ninguna aplicación
+
+    Returns:
+        str: Salida de flatpak uninstall --unused
+    """
+    result = run_process(["flatpak", "uninstall", "--unused", "-y", "--noninteractive"], log)
+    if result.returncode != 0:
+        raise RuntimeError(result.stdout.strip() or "flatpak uninstall --unused falló")
+    return result.stdout
+
+class BackgroundScheduler(QObject):
+    """
+    Ejecuta las tareas periódicas configuradas sin depender de la ventana
+
+    Busca actualizaciones si updates/auto_check está activo, limpia los
+    runtimes sin uso con la frecuencia de cleanup/frequency y, si
+    staging/enabled está activo, descarga las actualizaciones sin aplicarlas
+    dentro de la franja horaria staging/start–staging/end. La hora de la
+    última ejecución se guarda en la configuración, así que los intervalos
+    se respetan entre reinicios. Sigue funcionando con la ventana destruida
+    mientras la aplicación reside en la bandeja.
+    """
+    updates_found = pyqtSignal(list)
+    cleanup_finished = pyqtSignal(bool, str)
+    updates_staged = pyqtSignal(list)
+    staging_failed = pyqtSignal(str)
+
+    def __init__(self, settings, parent=None):
+        super().__init__(parent)
+        self.settings = settings
+        self.threads = []
+        self.timer = QTimer(self)
+        self.timer.setInterval(SCHEDULER_TICK)
+        self.timer.timeout.connect(self.run_due)
+
+    def start(self):
+        """Busca actualizaciones al iniciar (si está configurado) y activa el temporizador"""
+        if self.settings.value("updates/auto_check", True, type=bool):
+            self.check_updates()
+        self.timer.start()
+
+    def stop(self):
+        """Detiene el temporizador y espera a las tareas en curso"""
+        self.timer.stop()
+        for thread in list(self.threads):
+            thread.wait(2000)
+
+    def is_busy(self):
+        """Indica si hay alguna tarea programada en ejecución"""
+        return bool(self.threads)
+
+    def _elapsed(self, key):
+        return time.time() - self.settings.value(key, 0.0, type=float)
+
+    def run_due(self):
+        """Lanza las tareas cuyo intervalo ha vencido"""
+        if self.is_busy():
+            return
+        if (self.settings.value("updates/auto_check", True, type=bool)
+                and self._elapsed("scheduler/last_update_check") >= UPDATE_CHECK_INTERVAL):
+            self.check_updates()
+        if self.settings.value("cleanup/enabled", False, type=bool):
+            days = CLEANUP_INTERVALS.get(self.settings.value("cleanup/frequency", "Semanalmente"), 7)
+            if self._elapsed("scheduler/last_cleanup") >= days * 86400:
+                self.clean()
+        if (self.settings.value("staging/enabled", False, type=bool)
+                and in_time_window(datetime.now().hour,
+                                   self.settings.value("staging/start", 1, type=int),
+                                   self.settings.value("staging/end", 6, type=int))
+                and self._elapsed("scheduler/last_staging") >= STAGING_INTERVAL):
+            self.stage()
+
+    def check_updates(self):
+        """Busca actualizaciones en segundo plano"""
+        self.settings.setValue("scheduler/last_update_check", time.time())
+        self._run(fetch_update_plan, on_result=self.updates_found.emit)
+
+    def clean(self):
+        """Elimina los runtimes sin uso en segundo plano"""
+        self.settings.setValue("scheduler/last_cleanup", time.time())
+        self._run(clean_unused, on_finished=self.cleanup_finished.emit)
+
+    def stage(self):
+        """Descarga las actualizaciones pendientes sin aplicarlas, en segundo plano"""
+        self.settings.setValue("scheduler/last_staging", time.time())
+        self._run(stage_updates, on_result=self.updates_staged.emit,
+                  on_finished=self._staging_finished)
+
+    def _staging_finished(self, success, message):
+        if not success:
+            self.staging_failed.emit(message)
+
+    def _run(self, func, on_result=None, on_finished=None):
+        # Las tareas programadas usan la política de segundo plano de la configuración
+        thread = TaskThread(partial(apply_policy, background_policy(self.settings), func))
+        if on_result:
+            thread.result_signal.connect(on_result)
+        if on_finished:
+            thread.finished_signal.connect(on_finished)
+        thread.finished.connect(lambda: self.threads.remove(thread))
+        self.threads.append(thread)
+        thread.start()
+
+IPC_SOCKET = Path(os.environ.get("XDG_RUNTIME_DIR", f"/run/user/{os.getuid()}")) / "flatpak-manager.sock"
+IPC_LOCK_FILE = IPC_SOCKET.with_suffix(".lock")
+IPC_HANDOFF_TIMEOUT = 2     # segundos para entregar los argumentos a la instancia en marcha
+IPC_REQUEST_TIMEOUT = 120   # segundos para consultas como updates, que acceden a la red
+JOB_OUTPUT_LINES = 200      # líneas de salida conservadas por trabajo
+
+def acquire_instance_lock():
+    """
+    Toma el bloqueo de instancia única
+
+    Returns:
+        file: Archivo bloqueado que debe mantenerse abierto mientras dure el
+            proceso, o None si otra instancia ya tiene el bloqueo
+    """
+    IPC_LOCK_FILE.parent.mkdir(parents=True, exist_ok=True)
+    lock = open(IPC_LOCK_FILE, "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return None
+    return lock
+
+def ipc_request(request, timeout=IPC_REQUEST_TIMEOUT):
+    """
+    Envía una petición a la instancia en ejecución y devuelve su respuesta
+
+    Args:
+        request (dict): Petición con la clave command y sus argumentos
+        timeout (float): Segundos máximos de espera
+
+    Returns:
+        dict: Respuesta con ok y result o error
+
+    Raises:
+        OSError: Si no hay ninguna instancia escuchando
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(str(IPC_SOCKET))
+        sock.sendall((json.dumps(request) + "\n").encode())
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    if not data:
+        raise ConnectionError("La instancia en ejecución cerró la conexión")
+    return json.loads(data)
+
+def build_job_command(operation, args):
+    """
+    Construye el comando de flatpak de una operación encolada por IPC
+
+    Args:
+        operation (str): install, uninstall, update o clean
+        args (list): Refs (y, para install, el remoto opcional delante)
+
+    Raises:
+        ValueError: Si la operación o sus argumentos no son válidos
+    """
+    if any(not isinstance(arg, str) or not arg or arg.startswith("-") for arg in args):
+        raise ValueError("Los argumentos deben ser refs o remotos, no opciones")
+    if operation == "install" and 1 <= len(args) <= 2:
+        return ["flatpak", "install", "-y", "--noninteractive"] + args
+    if operation == "uninstall" and args:
+        return ["flatpak", "uninstall", "-y", "--noninteractive"] + args
+    if operation == "update":
+        return ["flatpak", "update", "-y", "--noninteractive"] + args
+    if operation == "clean" and not args:
+        return ["flatpak", "uninstall", "--unused", "-y", "--noninteractive"]
+    raise ValueError(f"Operación no válida: {operation} {' '.join(args)}".strip())
+
+def job_app_ids(operation, args):
+    """
+    Devuelve las aplicaciones que modifica una operación encolada
+
+    Para actualizar todo se consulta el plan de actualización, igual que hace
+    la interfaz antes de comprobar qué aplicaciones están en ejecución.
+    """
+    if operation == "update" and not args:
+        return {entry.name for entry in fetch_update_plan() if entry.kind == "app"}
+    if operation not in ("uninstall", "update"):
+        return set()
+    return {arg.split("/")[1] if "/" in arg else arg
+            for arg in args if not arg.startswith("runtime/")}
+
+@dataclass
+class Job:
+    """Operación encolada desde la interfaz IPC"""
+    id: int
+    operation: str
+    args: list
+    command: list
+    state: str = "queued"   # queued, running, done o failed
+    created: float = field(default_factory=time.time)
+    started: float = None
+    finished: float = None
+    returncode: int = None
+    output: list = field(default_factory=list)
+
+class JobQueue(QObject):
+    """
+    Cola de operaciones de flatpak que se ejecutan de una en una
+
+    Las peticiones llegan desde los hilos del servidor IPC y se ejecutan en
+    un hilo propio, así que no dependen de la ventana. job_finished se emite
+    con el trabajo terminado para que la interfaz pueda refrescarse.
+    """
+    job_finished = pyqtSignal(object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._jobs = OrderedDict()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._thread = None
+        self.policy = None  # ResourcePolicy de las operaciones encoladas
+
+    def submit(self, operation, args):
+        """Encola una operación y devuelve el identificador del trabajo"""
+        command = build_job_command(operation, list(args))
+        with self._lock:
+            job = Job(self._next_id, operation, list(args), command)
+            self._next_id += 1
+            self._jobs[job.id] = job
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, daemon=True)
+                self._thread.start()
+        self._queue.put(job)
+        return job.id
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+
+            def log(line, job=job):
+                with self._lock:
+                    job.output.append(line)
+                    del job.output[:-JOB_OUTPUT_LINES]
+
+            with self._lock:
+                job.state = "running"
+                job.started = time.time()
+            try:
+                # Como en la interfaz, no se modifican aplicaciones abiertas
+                running = sorted(job_app_ids(job.operation, job.args) & running_app_ids())
+                if running:
+                    log(f"No se puede ejecutar {job.operation}: aplicaciones en ejecución: "
+                        f"{', '.join(running)}. Ciérralas y vuelve a encolar la operación.")
+                    returncode = -1
+                else:
+                    returncode = apply_policy(self.policy, run_process, job.command, log).returncode
+            except (OSError, RuntimeError, subprocess.CalledProcessError) as e:
+                log(str(e))
+                returncode = -1
+            with self._lock:
+                job.returncode = returncode
+                job.state = "done" if returncode == 0 else "failed"
+                job.finished = time.time()
+            self.job_finished.emit(job)
+
+    def jobs(self):
+        """Devuelve el estado de todos los trabajos, sin su salida"""
+        with self._lock:
+            return [{key: value for key, value in asdict(job).items() if key != "output"}
+                    for job in self._jobs.values()]
+
+    def get(self, job_id):
+        """Devuelve el estado y la salida de un trabajo"""
+        with self._lock:
+            if job_id not in self._jobs:
+                raise KeyError(f"No existe el trabajo {job_id}")
+            return asdict(self._jobs[job_id])
+
+    def stop(self):
+        """Detiene el hilo de la cola al terminar el trabajo en curso"""
+        self._queue.put(None)
+
+class _IpcRequestHandler(socketserver.StreamRequestHandler):
+    """Atiende peticiones JSON, una por línea, con una respuesta JSON por línea"""
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = {"ok": True, "result": self.server.dispatch(json.loads(line))}
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            self.wfile.write((json.dumps(response) + "\n").encode())
+
+class IpcServer(QObject):
+    """
+    Servidor de control local en un socket Unix de XDG_RUNTIME_DIR
+
+    Un segundo arranque le entrega sus argumentos con activate y termina; los
+    scripts pueden encolar operaciones y consultar el inventario o el estado
+    de los trabajos sin abrir la interfaz. Las consultas se resuelven en los
+    hilos del servidor; solo activate pasa por el hilo principal.
+
+    Se inicia antes de construir la ventana para que un segundo arranque no
+    espere a que termine la carga inicial; las activaciones recibidas hasta
+    que la ventana se conecta con connect_activation se guardan.
+    """
+    activated = pyqtSignal(list)
+
+    def __init__(self, jobs, parent=None):
+        super().__init__(parent)
+        self.jobs = jobs
+        self._server = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._connected = False
+        self._pending = []   # activaciones recibidas antes de connect_activation
+
+    def connect_activation(self, slot):
+        """Conecta activated a slot y le entrega las activaciones pendientes"""
+        with self._lock:
+            self.activated.connect(slot)
+            self._connected = True
+            pending, self._pending = self._pending, []
+        for args in pending:
+            slot(args)
+
+    def start(self):
+        """Empieza a escuchar; requiere tener el bloqueo de instancia única"""
+        if self._server is not None:
+            return
+        # Con el bloqueo tomado, un socket existente es de una instancia que ya no está
+        IPC_SOCKET.unlink(missing_ok=True)
+        self._server = socketserver.ThreadingUnixStreamServer(str(IPC_SOCKET), _IpcRequestHandler)
+        self._server.daemon_threads = True
+        self._server.dispatch = self.dispatch
+        os.chmod(IPC_SOCKET, 0o600)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Deja de escuchar y elimina el socket"""
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join(2)
+        self._server = None
+        self._thread = None
+        IPC_SOCKET.unlink(missing_ok=True)
+
+    def dispatch(self, request):
+        """Resuelve una petición y devuelve su resultado"""
+        command = request.get("command")
+        if command == "ping":
+            return {"pid": os.getpid(), "version": VERSION}
+        if command in ("activate", "show"):
+            args = [str(arg) for arg in request.get("args", [])]
+            with self._lock:
+                if self._connected:
+                    self.activated.emit(args)
+                else:
+                    self._pending.append(args)
+            return {"pid": os.getpid()}
+        if command == "inventory":
+            return load_installed_apps()
+        if command == "updates":
+            return [asdict(entry) for entry in fetch_update_plan()]
+        if command == "queue":
+            return {"id": self.jobs.submit(request.get("operation", ""), request.get("args", []))}
+        if command == "jobs":
+            return self.jobs.jobs()
+        if command == "job":
+            return self.jobs.get(int(request.get("id", 0)))
+        raise ValueError(f"Comando desconocido: {command}")
+
+def ctl_request(words):
+    """
+    Convierte los argumentos de --ctl en una petición IPC
+
+    Ejemplos: ping, show, inventory, updates, jobs, job 3,
+    queue install flathub org.gimp.GIMP, queue update, queue clean
+    """
+    if not words:
+        raise ValueError("Falta el comando de control")
+    command, args = words[0], words[1:]
+    if command == "queue":
+        if not args:
+            raise ValueError("Falta la operación a encolar")
+        return {"command": "queue", "operation": args[0], "args": args[1:]}
+    if command == "job":
+        if len(args) != 1 or not args[0].isdigit():
+            raise ValueError("Uso: job ID")
+        return {"command": "job", "id": int(args[0])}
+    return {"command": command, "args": args}
+
+class RefSelectionDialog(QDialog):
+    """Diálogo para seleccionar varias refs de una lista"""
+    def __init__(self, title, refs, checked=(), parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(title)
+        self.setMinimumSize(500, 400)
+        layout = QVBoxLayout(self)
+
+        self.list_widget = QListWidget()
+        for ref in refs:
+            item = QListWidgetItem(ref)
+            item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            item.setCheckState(Qt.CheckState.Checked if ref in checked else Qt.CheckState.Unchecked)
+            self.list_widget.addItem(item)
+        layout.addWidget(self.list_widget)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok |
+                                   QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def selected_refs(self):
+        """Devuelve las refs marcadas"""
+        return [
+            self.list_widget.item(i).text()
+            for i in range(self.list_widget.count())
+            if self.list_widget.item(i).checkState() == Qt.CheckState.Checked
+        ]
+
+class RemotesModel(QAbstractTableModel):
+    """Modelo de tabla con los remotos configurados
+
+    Las filas se mantienen ordenadas por prioridad y se actualizan de forma
+    incremental tras cada operación, sin volver a consultar a flatpak.
+    """
+    HEADERS = ["Nombre", "URL", "Prioridad", "Activo", "Filtro", "Opciones", "Latencia"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.remotes = []
+        self.probes = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.remotes)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        remote = self.remotes[index.row()]
+        column = index.column()
+        if role == Qt.ItemDataRole.DisplayRole:
+            if column == 0:
+                return remote.name
+            if column == 1:
+                return remote.url
+            if column == 2:
+                return str(remote.priority)
+            if column == 3:
+                return "Sí" if remote.enabled else "No"
+            if column == 4:
+                return remote.filter
+            if column == 5:
+                return ", ".join(option for option in remote.options if option != "disabled")
+            if column == 6:
+                probe = self.probes.get(remote.name)
+                if probe is None:
+                    return ""
+                if probe.status in ("ok", "lento", "desactualizado"):
+                    return f"{probe.latency * 1000:.0f} ms ({probe.status})"
+                return probe.status
+        if role == Qt.ItemDataRole.ToolTipRole and column == 6:
+            probe = self.probes.get(remote.name)
+            if probe is not None:
+                return f"Comprobado: {probe.checked}\n{probe.error}".strip()
+        return None
+
+    def set_remotes(self, remotes):
+        """Sustituye todos los remotos"""
+        self.beginResetModel()
+        self.remotes = list(remotes)
+        self.endResetModel()
+
+    def set_probes(self, probes):
+        """Actualiza la columna de latencia con los diagnósticos indicados"""
+        self.probes.update({probe.name: probe for probe in probes})
+        if self.remotes:
+            column = self.HEADERS.index("Latencia")
+            self.dataChanged.emit(self.index(0, column), self.index(len(self.remotes) - 1, column))
+
+    def find(self, name):
+        """Devuelve el remoto con el nombre indicado o None"""
+        for remote in self.remotes:
+            if remote.name == name:
+                return remote
+        return None
+
+    def upsert(self, remote):
+        """Añade o actualiza un remoto manteniendo el orden por prioridad"""
+        for row, current in enumerate(self.remotes):
+            if current.name == remote.name:
+                self.remotes[row] = remote
+                self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.HEADERS) - 1))
+                self.sort_rows()
+                return
+        row = len(self.remotes)
+        for position, current in enumerate(self.remotes):
+            if (-remote.priority, remote.name) < (-current.priority, current.name):
+                row = position
+                break
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.remotes.insert(row, remote)
+        self.endInsertRows()
+
+    def remove(self, name):
+        """Elimina un remoto del modelo"""
+        for row, remote in enumerate(self.remotes):
+            if remote.name == name:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                del self.remotes[row]
+                self.endRemoveRows()
+                return
+
+    def sort_rows(self):
+        """Reordena las filas por prioridad tras un cambio"""
+        self.layoutAboutToBeChanged.emit()
+        self.remotes.sort(key=lambda remote: (-remote.priority, remote.name))
+        self.layoutChanged.emit()
+
+class PermissionsDialog(QDialog):
+    """Auditoría de permisos de las aplicaciones instaladas con filtro instantáneo"""
+    HEADERS = ["Aplicación", "Permisos efectivos", "Anulaciones"]
+
+    def __init__(self, apps, parent=None):
+        super().__init__(parent)
+        self.apps = apps
+        self.app_ids = sorted(apps)
+        self.setWindowTitle("Permisos de las aplicaciones")
+        self.setMinimumSize(900, 550)
+        layout = QVBoxLayout(self)
+
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("Filtrar (ej: filesystem=host sockets=x11 network)")
+        self.filter_edit.textChanged.connect(self.apply_filter)
+        layout.addWidget(self.filter_edit)
+
+        self.table = QTableWidget(len(self.app_ids), len(self.HEADERS))
+        self.table.setHorizontalHeaderLabels(self.HEADERS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        for row, app_id in enumerate(self.app_ids):
+            app = apps[app_id]
+            self.table.setItem(row, 0, QTableWidgetItem(app_id))
+            self.table.setItem(row, 1, QTableWidgetItem("\n".join(flatten_permissions(app["effective"]))))
+            self.table.setItem(row, 2, QTableWidgetItem("\n".join(flatten_permissions(app["overrides"]))))
+        self.table.resizeRowsToContents()
+        layout.addWidget(self.table)
+
+        self.count_label = QLabel()
+        layout.addWidget(self.count_label)
+        self.apply_filter("")
+
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def apply_filter(self, query):
+        """Oculta las aplicaciones que no cumplen el filtro"""
+        visible = 0
+        for row, app_id in enumerate(self.app_ids):
+            match = permissions_match(self.apps[app_id]["effective"], query)
+            self.table.setRowHidden(row, not match)
+            visible += match
+        self.count_label.setText(f"{visible} de {len(self.app_ids)} aplicaciones")
+
+class AppDataDialog(QDialog):
+    """Espacio de los datos de usuario de cada aplicación, con los huérfanos marcados"""
+    HEADERS = ["Aplicación", "Tamaño", "Estado"]
+
+    def __init__(self, usage, parent=None):
+        super().__init__(parent)
+        self.usage = usage
+        self.setWindowTitle("Datos de las aplicaciones (~/.var/app)")
+        self.setMinimumSize(700, 500)
+        layout = QVBoxLayout(self)
+
+        orphans = [item for item in usage if not item.installed]
+        layout.addWidget(QLabel(
+            f"{len(usage)} aplicaciones ocupan {format_size(sum(item.size for item in usage))}; "
+            f"{len(orphans)} ya no están instaladas ({format_size(sum(item.size for item in orphans))})."))
+
+        self.table = QTableWidget(len(usage), len(self.HEADERS))
+        self.table.setHorizontalHeaderLabels(self.HEADERS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        for row, item in enumerate(usage):
+            app_item = QTableWidgetItem(item.app)
+            app_item.setToolTip(item.path)
+            # Solo se pueden eliminar los datos de aplicaciones desinstaladas
+            if not item.installed:
+                app_item.setFlags(app_item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+                app_item.setCheckState(Qt.CheckState.Checked)
+            self.table.setItem(row, 0, app_item)
+            self.table.setItem(row, 1, QTableWidgetItem(format_size(item.size)))
+            self.table.setItem(row, 2, QTableWidgetItem("Instalada" if item.installed else "Desinstalada"))
+        layout.addWidget(self.table)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
+        self.remove_btn = buttons.addButton("Eliminar datos marcados",
+                                            QDialogButtonBox.ButtonRole.AcceptRole)
+        self.remove_btn.setEnabled(bool(orphans))
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def selected_entries(self):
+        """Devuelve los AppDataUsage marcados para eliminar"""
+        return [item for row, item in enumerate(self.usage)
+                if not item.installed
+                and self.table.item(row, 0).checkState() == Qt.CheckState.Checked]
+
+class DependencyDialog(QDialog):
+    """Muestra el grafo de dependencias, las refs sin uso y las de fin de vida"""
+    def __init__(self, graph, parent=None):
+        super().__init__(parent)
+        self.graph = graph
+        self.setWindowTitle("Dependencias")
+        self.setMinimumSize(950, 600)
+        layout = QVBoxLayout(self)
+
+        unused = graph.unused()
+        eol = graph.end_of_life()
+        summary = [f"{len(graph.nodes)} refs instaladas",
+                   f"{len(unused)} sin uso",
+                   f"espacio recuperable: {format_size(graph.reclaimable())}"]
+        if eol:
+            summary.append(f"{len(eol)} en fin de vida")
+        layout.addWidget(QLabel(" — ".join(summary)))
+
+        splitter = QSplitter(Qt.Orientation.Horizontal)
+        self.tree = QTreeWidget()
+        self.tree.setHeaderLabels(["Ref", "Tamaño"])
+        self.tree.header().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.tree.currentItemChanged.connect(self.show_ref)
+        splitter.addWidget(self.tree)
+
+        self.details = QTextEdit()
+        self.details.setReadOnly(True)
+        splitter.addWidget(self.details)
+        splitter.setSizes([500, 450])
+        layout.addWidget(splitter, 1)
+
+        # Las raíces son las refs que nadie usa: aplicaciones y runtimes huérfanos
+        roots = sorted(ref for ref in graph.nodes if not graph.users.get(ref))
+        for ref in roots:
+            self.tree.addTopLevelItem(self._build_item(ref, set()))
+
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def _build_item(self, ref, path):
+        """Crea el elemento del árbol de ref con sus dependencias"""
+        node = self.graph.nodes.get(ref, {})
+        label = ref
+        if node.get("eol"):
+            label += " (fin de vida)"
+        elif ref.startswith("runtime/") and not self.graph.users.get(ref):
+            label += " (sin uso)"
+        item = QTreeWidgetItem([label, format_size(node.get("size", 0))])
+        item.setData(0, Qt.ItemDataRole.UserRole, ref)
+        for used in sorted(self.graph.depends.get(ref, ())):
+            if used not in path:
+                item.addChild(self._build_item(used, path | {ref}))
+        return item
+
+    def show_ref(self, item, *args):
+        """Muestra qué usa la ref seleccionada y qué se liberaría al desinstalarla"""
+        if item is None:
+            self.details.clear()
+            return
+        ref = item.data(0, Qt.ItemDataRole.UserRole)
+        node = self.graph.nodes.get(ref, {})
+        users = sorted(self.graph.users_of(ref))
+        removable = sorted(self.graph.removable_after([ref]))
+        text = [f"<h3>{html.escape(ref)}</h3>"]
+        if node.get("eol"):
+            text.append(f"<p><b>Fin de vida:</b> {html.escape(node['eol'])}</p>")
+            if node.get("eol_rebase"):
+                text.append(f"<p><b>Sustituida por:</b> {html.escape(node['eol_rebase'])}</p>")
+        text.append("<h4>Usada por</h4>")
+        text.append("<br>".join(html.escape(user) for user in users) or "Nadie")
+        text.append(f"<h4>Se podrán eliminar al desinstalarla "
+                    f"({format_size(self.graph.size_of(removable + [ref]))} en total)</h4>")
+        text.append("<br>".join(html.escape(other) for other in removable) or "Nada más")
+        self.details.setHtml("".join(text))
+
+class RollbackDialog(QDialog):
+    """Lista los commits de una aplicación para desplegar una versión anterior"""
+    HEADERS = ["Commit", "Fecha", "Descripción", "Disponible localmente"]
+
+    def __init__(self, app, commits, parent=None):
+        super().__init__(parent)
+        self.commits = commits
+        self.setWindowTitle(f"Versiones de {app['application']}")
+        self.setMinimumSize(800, 400)
+        layout = QVBoxLayout(self)
+
+        self.table = QTableWidget(len(commits), len(self.HEADERS))
+        self.table.setHorizontalHeaderLabels(self.HEADERS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
+        for row, entry in enumerate(commits):
+            commit = entry["commit"][:12]
+            if entry["commit"] == app["commit"]:
+                commit += " (instalado)"
+            values = [commit, entry["date"], entry["subject"], "Sí" if entry["local"] else "No"]
+            for column, value in enumerate(values):
+                self.table.setItem(row, column, QTableWidgetItem(value))
+        layout.addWidget(self.table)
+
+        self.pin_check = QCheckBox("Fijar esta versión (las actualizaciones la omitirán)")
+        self.pin_check.setChecked(True)
+        layout.addWidget(self.pin_check)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Cancel)
+        deploy_button = buttons.addButton("Desplegar versión", QDialogButtonBox.ButtonRole.AcceptRole)
+        deploy_button.setDefault(True)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def selected_commit(self):
+        """Devuelve el commit seleccionado o None"""
+        rows = self.table.selectionModel().selectedRows()
+        return self.commits[rows[0].row()] if rows else None
+
+class UpdatePlannerDialog(QDialog):
+    """Diálogo para revisar y seleccionar las actualizaciones pendientes"""
+    HEADERS = ["Ref", "Versión", "Origen", "Descarga", "Cambio de tamaño", "Runtime"]
+
+    def __init__(self, plan, parent=None):
+        super().__init__(parent)
+        self.plan = plan
+        self.setWindowTitle("Actualizaciones pendientes")
+        self.setMinimumSize(900, 450)
+        layout = QVBoxLayout(self)
+
+        self.table = QTableWidget(len(plan), len(self.HEADERS))
+        self.table.setHorizontalHeaderLabels(self.HEADERS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        for row, entry in enumerate(plan):
+            ref_item = QTableWidgetItem(entry.ref)
+            ref_item.setFlags(ref_item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            ref_item.setCheckState(Qt.CheckState.Checked)
+            self.table.setItem(row, 0, ref_item)
+            self.table.setItem(row, 1, QTableWidgetItem(entry.version))
+            self.table.setItem(row, 2, QTableWidgetItem(entry.origin))
+            self.table.setItem(row, 3, QTableWidgetItem(format_size(entry.download_size)))
+            self.table.setItem(row, 4, QTableWidgetItem(format_size(entry.size_delta, signed=True)))
+            self.table.setItem(row, 5, QTableWidgetItem(self.runtime_text(entry)))
+        self.table.resizeColumnsToContents()
+        self.table.itemChanged.connect(self.update_summary)
+        layout.addWidget(self.table)
+
+        self.summary_label = QLabel()
+        layout.addWidget(self.summary_label)
+        self.update_summary()
+
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Cancel)
+        apply_button = buttons.addButton("Aplicar seleccionadas", QDialogButtonBox.ButtonRole.AcceptRole)
+        apply_button.setDefault(True)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    @staticmethod
+    def runtime_text(entry):
+        """Describe la relación de la actualización con los runtimes compartidos"""
+        if entry.kind == "runtime":
+            if entry.shared_by:
+                return f"Compartido por {len(entry.shared_by)} apps: {', '.join(entry.shared_by)}"
+            return ""
+        if entry.new_runtime:
+            return f"{entry.runtime} (nuevo, se descargará)"
+        return entry.runtime
+
+    def selected_entries(self):
+        """Devuelve las actualizaciones marcadas"""
+        return [
+            entry for row, entry in enumerate(self.plan)
+            if self.table.item(row, 0).checkState() == Qt.CheckState.Checked
+        ]
+
+    def update_summary(self, *args):
+        """Actualiza el total de la selección"""
+        selected = self.selected_entries()
+        download = sum(entry.download_size for entry in selected)
+        delta = sum(entry.size_delta for entry in selected)
+        self.summary_label.setText(
+            f"Seleccionadas: {len(selected)} de {len(self.plan)} — "
+            f"Descarga: {format_size(download)} — "
+            f"Cambio en disco: {format_size(delta, signed=True)}"
+        )
+
 class AboutDialog(QMessageBox):
     """Diálogo Acerca de"""
     def __init__(self, parent=None):
@@ -106,7 +3484,7 @@ class AboutDialog(QMessageBox):
         self.setMinimumSize(400, 300)
 
 class FlatpakManager(QMainWindow):
-    def __init__(self):
+    def __init__(self, ipc=None):
         super().__init__()
         self.setWindowTitle(f"{APP_NAME} v{VERSION}")
         self.setMinimumSize(900, 700)
@@ -115,7 +3493,53 @@ class FlatpakManager(QMainWindow):
         
         # Variables
         self.command_thread = None
+        self.task_threads = []
         self.settings = QSettings("FlatpakManager", "Config")
+        self.permissions_cache = CommitCache(PERMISSIONS_CACHE_FILE)
+        self.installed_apps = []
+        self.masks = {}  # instalación -> patrones de flatpak mask
+        self.metadata_cache = CommitCache(METADATA_CACHE_FILE)
+        self.verify_cache = CommitCache(VERIFY_CACHE_FILE)
+        self.dependency_graph = DependencyGraph()
+        self.graph_loaded = False
+        self.graph_generation = 0  # Aumenta con cada cambio en lo instalado
+        self.graph_resync = False
+        self.app_details = AppDetailsLoader(self.permissions_cache, self)
+        self.app_details.loaded.connect(self.app_details_loaded)
+        self.mirror = LocalMirror(port=self.settings.value("mirror/port", MIRROR_DEFAULT_PORT, type=int))
+        self.metrics_exporter = MetricsExporter()
+        self.graph_sync_thread = None
+        last_check = self.settings.value("scheduler/last_update_check", 0.0, type=float)
+        if last_check:
+            METRICS.set("last_update_check_timestamp_seconds", round(last_check))
+        
+        # Objetos que sobreviven a la destrucción de la interfaz en la bandeja
+        self.ui_built = False
+        self.output_backlog = deque(maxlen=OUTPUT_BACKLOG_LINES)
+        self.system_info_text = ""
+        self.memory_usage = {}  # Memoria residente medida con la ventana y en la bandeja
+        QPixmapCache.setCacheLimit(PIXMAP_CACHE_LIMIT)
+        self.icon_loader = IconLoader(ICON_SIZE, self)
+        self.icon_loader.loaded.connect(self.icon_loaded)
+        self.icon_timer = QTimer(self)
+        self.icon_timer.setSingleShot(True)
+        self.icon_timer.setInterval(50)
+        self.icon_timer.timeout.connect(self.load_visible_icons)
+        self.sampler = ProcessSampler()
+        self.monitor_timer = QTimer(self)
+        self.monitor_timer.timeout.connect(self.sample_running)
+        self.scheduler = BackgroundScheduler(self.settings, self)
+        self.scheduler.updates_found.connect(self.scheduled_updates_found)
+        self.scheduler.cleanup_finished.connect(self.scheduled_cleanup_finished)
+        self.scheduler.updates_staged.connect(self.staged_updates_ready)
+        self.scheduler.staging_failed.connect(self.staging_failed)
+        self.staged_updates = load_staged_updates()
+        METRICS.set("staged_updates", len(self.staged_updates))
+        # El servidor IPC y su cola pueden venir ya iniciados desde main()
+        self.ipc = ipc or IpcServer(JobQueue(self), self)
+        self.jobs = self.ipc.jobs
+        self.jobs.policy = background_policy(self.settings)
+        self.jobs.job_finished.connect(self.queued_job_finished)
         
         self.setup_ui()
         self.setup_menu()
@@ -127,6 +3551,13 @@ class FlatpakManager(QMainWindow):
         # Cargar configuración
         self.load_config()
         
+        # Servir el espejo local y las métricas si están habilitados
+        self.apply_mirror_serving()
+        self.apply_metrics_serving()
+        
+        # Tareas programadas (búsqueda de actualizaciones y limpieza)
+        self.scheduler.start()
+        
     def create_button(self, text, callback, icon=None, tooltip=None):
         """Crea un botón con el texto, icono y tooltip especificados"""
         button = QPushButton(text)
@@ -153,6 +3584,23 @@ class FlatpakManager(QMainWindow):
         self.setup_main_tab()
         self.tabs.addTab(self.main_tab, "Acciones")
         
+        # Pestaña de aplicaciones
+        self.apps_tab = QWidget()
+        self.setup_apps_tab()
+        self.tabs.addTab(self.apps_tab, "Aplicaciones")
+        
+        # Pestaña de aplicaciones en ejecución
+        self.running_tab = QWidget()
+        self.setup_running_tab()
+        self.tabs.addTab(self.running_tab, "En ejecución")
+        self.tabs.currentChanged.connect(self.update_monitor_state)
+        self.tabs.currentChanged.connect(lambda *_: self.icon_timer.start())
+        
+        # Pestaña de historial
+        self.history_tab = QWidget()
+        self.setup_history_tab()
+        self.tabs.addTab(self.history_tab, "Historial")
+        
         # Pestaña de configuración
         self.config_tab = QWidget()
         self.setup_config_tab()
@@ -186,6 +3634,7 @@ class FlatpakManager(QMainWindow):
         self.statusBar.addPermanentWidget(progress_container, 1)
         self.statusBar.setSizeGripEnabled(False)  # Deshabilitar el grip de redimensionamiento
         self.statusBar.showMessage("Listo")
+        self.ui_built = True
     
     def setup_main_tab(self):
         """Configura la pestaña principal con todas las acciones"""
@@ -243,6 +3692,10 @@ class FlatpakManager(QMainWindow):
                                             callback=self.check_updates, 
                                             tooltip="Busca actualizaciones disponibles para aplicaciones Flatpak")
         
+        self.btn_update_all = self.create_button(" Actualizar Todo", 
+                                               callback=self.update_all, 
+                                               tooltip="Aplica todas las actualizaciones en una sola transacción")
+        
         self.btn_install = self.create_button(" Instalar Aplicación", 
                                            callback=self.install_flatpak, 
                                            tooltip="Instalar una nueva aplicación Flatpak")
@@ -251,6 +3704,14 @@ class FlatpakManager(QMainWindow):
                                              callback=self.uninstall_flatpak, 
                                              tooltip="Desinstalar una aplicación Flatpak")
         
+        self.btn_permissions = self.create_button(" Permisos", 
+                                                callback=self.show_permissions, 
+                                                tooltip="Audita los permisos de todas las aplicaciones instaladas")
+        
+        self.btn_dependencies = self.create_button(" Dependencias", 
+                                                 callback=self.show_dependencies, 
+                                                 tooltip="Muestra qué usa cada runtime y qué se puede eliminar")
+        
         self.btn_export = self.create_button(" Exportar Lista", 
                                            callback=self.export_list, 
                                            tooltip="Guarda una lista de todas las aplicaciones instaladas")
@@ -259,13 +3720,21 @@ class FlatpakManager(QMainWindow):
                                                callback=self.clean_cache, 
                                                tooltip="Elimina paquetes no utilizados de la caché de Flatpak")
         
+        self.btn_app_data = self.create_button(" Datos de Aplicaciones", 
+                                             callback=self.scan_app_data, 
+                                             tooltip="Mide ~/.var/app y elimina los datos de aplicaciones desinstaladas")
+        
         # Agregar botones al layout de acciones
         actions_layout.addWidget(self.btn_list)
         actions_layout.addWidget(self.btn_updates)
+        actions_layout.addWidget(self.btn_update_all)
         actions_layout.addWidget(self.btn_install)
         actions_layout.addWidget(self.btn_uninstall)
+        actions_layout.addWidget(self.btn_permissions)
+        actions_layout.addWidget(self.btn_dependencies)
         actions_layout.addWidget(self.btn_export)
         actions_layout.addWidget(self.btn_clean_cache)
+        actions_layout.addWidget(self.btn_app_data)
         actions_layout.addStretch()
         
         actions_group.setLayout(actions_layout)
@@ -277,6 +3746,7 @@ class FlatpakManager(QMainWindow):
         self.output_area = QTextEdit()
         self.output_area.setReadOnly(True)
         self.output_area.setFont(QFont("Monospace", 9))
+        self.output_area.document().setMaximumBlockCount(OUTPUT_MAX_LINES)
         
         output_layout.addWidget(self.output_area)
         output_group.setLayout(output_layout)
@@ -287,6 +3757,514 @@ class FlatpakManager(QMainWindow):
         
         self.main_tab.setLayout(main_layout)
     
+    def setup_apps_tab(self):
+        """Configura la pestaña de aplicaciones con el panel de detalles"""
+        layout = QVBoxLayout(self.apps_tab)
+        
+        self.app_filter = QLineEdit()
+        self.app_filter.setPlaceholderText("Buscar aplicación...")
+        self.app_filter.textChanged.connect(self.filter_apps)
+        layout.addWidget(self.app_filter)
+        
+        splitter = QSplitter(Qt.Orientation.Horizontal)
+        self.app_list = QListWidget()
+        self.app_list.setIconSize(QSize(ICON_SIZE, ICON_SIZE))
+        self.app_list.setUniformItemSizes(True)
+        self.app_list.currentRowChanged.connect(self.app_selected)
+        splitter.addWidget(self.app_list)
+        
+        # Carga perezosa de iconos: solo para las filas visibles, tras un breve retardo
+        self.app_list.verticalScrollBar().valueChanged.connect(lambda *_: self.icon_timer.start())
+        
+        self.app_details_view = QTextEdit()
+        self.app_details_view.setReadOnly(True)
+        splitter.addWidget(self.app_details_view)
+        splitter.setSizes([300, 600])
+        layout.addWidget(splitter, 1)
+        
+        btn_layout = QHBoxLayout()
+        self.refresh_apps_btn = QPushButton("Actualizar lista")
+        self.refresh_apps_btn.clicked.connect(self.refresh_apps)
+        self.rollback_app_btn = QPushButton("Versiones anteriores...")
+        self.rollback_app_btn.setToolTip("Vuelve a una versión anterior de la aplicación")
+        self.rollback_app_btn.clicked.connect(self.rollback_app)
+        self.pin_app_btn = QPushButton("Fijar/Desfijar versión")
+        self.pin_app_btn.setToolTip("Evita o permite que la aplicación se actualice (flatpak mask)")
+        self.pin_app_btn.clicked.connect(self.toggle_app_pin)
+        self.uninstall_app_btn = QPushButton("Desinstalar")
+        self.uninstall_app_btn.clicked.connect(self.uninstall_flatpak)
+        btn_layout.addWidget(self.refresh_apps_btn)
+        btn_layout.addStretch()
+        btn_layout.addWidget(self.rollback_app_btn)
+        btn_layout.addWidget(self.pin_app_btn)
+        btn_layout.addWidget(self.uninstall_app_btn)
+        layout.addLayout(btn_layout)
+        
+        self.refresh_apps()
+    
+    def refresh_apps(self):
+        """Recarga la lista de aplicaciones instaladas y los patrones fijados en segundo plano"""
+        self.run_task(load_installed_apps, quiet=True, on_result=self.apps_loaded)
+        self.run_task(load_masks, quiet=True, on_result=self.masks_loaded)
+    
+    def app_masks(self, app):
+        """Devuelve los patrones fijados en la instalación de la aplicación"""
+        return self.masks.get(app["installation"], [])
+    
+    def masks_loaded(self, masks):
+        """Guarda los patrones fijados y refresca el panel de detalles"""
+        self.masks = masks
+        self.app_selected(self.app_list.currentRow())
+    
+    def apps_loaded(self, apps):
+        """Rellena la lista de aplicaciones conservando la selección"""
+        selected = self.selected_app()
+        self.installed_apps = apps
+        self.app_list.blockSignals(True)
+        self.app_list.clear()
+        for app in apps:
+            item = QListWidgetItem(app["name"] or app["application"])
+            item.setToolTip(app["application"])
+            self.app_list.addItem(item)
+        self.app_list.blockSignals(False)
+        self.filter_apps(self.app_filter.text())
+        self.icon_loader.prune(apps)
+        
+        refs = [app["ref"] for app in apps]
+        if selected and selected["ref"] in refs:
+            self.app_list.setCurrentRow(refs.index(selected["ref"]))
+        elif apps:
+            self.app_list.setCurrentRow(0)
+    
+    def filter_apps(self, text):
+        """Oculta las aplicaciones que no coinciden con la búsqueda"""
+        text = text.lower()
+        for row, app in enumerate(self.installed_apps):
+            match = text in app["name"].lower() or text in app["application"].lower()
+            self.app_list.item(row).setHidden(not match)
+        self.icon_timer.start()
+    
+    def load_visible_icons(self):
+        """Asigna los iconos de las filas visibles, pidiendo los que no están en memoria"""
+        if not self.ui_built:
+            return
+        count = self.app_list.count()
+        if not count or not self.app_list.isVisible():
+            return
+        viewport = self.app_list.viewport()
+        first = self.app_list.indexAt(QPoint(0, 0)).row()
+        last = self.app_list.indexAt(QPoint(0, viewport.height() - 1)).row()
+        first = max(first, 0)
+        last = count - 1 if last < 0 else last
+        for row in range(first, last + 1):
+            item = self.app_list.item(row)
+            if item.isHidden() or not item.icon().isNull():
+                continue
+            app = self.installed_apps[row]
+            pixmap = QPixmapCache.find(self.icon_loader.key(app))
+            if pixmap is not None and not pixmap.isNull():
+                item.setIcon(QIcon(pixmap))
+            else:
+                self.icon_loader.request(app)
+    
+    def icon_loaded(self, key, image):
+        """Guarda el icono decodificado en la caché de pixmaps y lo asigna a su fila"""
+        pixmap = QPixmap.fromImage(image)
+        QPixmapCache.insert(key, pixmap)
+        if not self.ui_built:
+            return
+        for row, app in enumerate(self.installed_apps):
+            if self.icon_loader.key(app) == key:
+                self.app_list.item(row).setIcon(QIcon(pixmap))
+    
+    def selected_app(self):
+        """Devuelve la aplicación seleccionada en la pestaña Aplicaciones o None"""
+        row = self.app_list.currentRow()
+        if 0 <= row < len(self.installed_apps):
+            return self.installed_apps[row]
+        return None
+    
+    def app_selected(self, row):
+        """Muestra los detalles de la aplicación y precarga las vecinas"""
+        if not 0 <= row < len(self.installed_apps):
+            self.app_details_view.clear()
+            return
+        app = self.installed_apps[row]
+        details = self.app_details.get(app)
+        if details is not None:
+            self.show_app_details(app, details)
+        else:
+            self.show_app_details(app, None)
+            self.app_details.request(app)
+        
+        # Precargar las filas visibles cercanas para la navegación con teclado
+        for offset in range(1, PREFETCH_RADIUS + 1):
+            for neighbor in (row - offset, row + offset):
+                if 0 <= neighbor < len(self.installed_apps) and not self.app_list.item(neighbor).isHidden():
+                    self.app_details.request(self.installed_apps[neighbor])
+    
+    def app_details_loaded(self, key, details):
+        """Actualiza el panel si los detalles cargados son los de la aplicación seleccionada"""
+        if not self.ui_built:
+            return
+        app = self.selected_app()
+        if app is not None and self.app_details.key(app) == key:
+            self.show_app_details(app, details)
+    
+    def show_app_details(self, app, details):
+        """Muestra los detalles de una aplicación en el panel"""
+        rows = [
+            ("ID", app["application"]),
+            ("Versión", app["version"]),
+            ("Origen", app["origin"]),
+            ("Instalación", app["installation"]),
+            ("Tamaño", app["size"]),
+            ("Commit", app["commit"]),
+        ]
+        if is_masked(app["ref"], self.app_masks(app)):
+            rows.append(("Versión fijada", "Sí, las actualizaciones la omiten"))
+        if details is None:
+            footer = "<p><i>Cargando detalles...</i></p>"
+        elif "error" in details:
+            footer = f"<p>Error al obtener los detalles: {html.escape(details['error'])}</p>"
+        else:
+            info = details["info"]
+            rows.insert(4, ("Runtime", info.get("Runtime", "")))
+            rows.append(("Licencia", info.get("License", "")))
+            rows.append(("Última actualización", info.get("Date", "")))
+            rows.append(("Cambio", info.get("Subject", "")))
+            permissions = flatten_permissions(details["permissions"])
+            footer = "<h4>Permisos</h4>" + (
+                "<br>".join(html.escape(entry) for entry in permissions) or "Ninguno")
+        
+        table = "".join(
+            f"<tr><td><b>{html.escape(key)}</b></td><td>{html.escape(value)}</td></tr>"
+            for key, value in rows if value
+        )
+        self.app_details_view.setHtml(
+            f"<h3>{html.escape(app['name'] or app['application'])}</h3>"
+            f"<p>{html.escape(app['description'])}</p>"
+            f"<table cellspacing='4'>{table}</table>{footer}"
+        )
+    
+    def rollback_app(self):
+        """Carga el historial de commits de la aplicación seleccionada"""
+        app = self.selected_app()
+        if app is None:
+            QMessageBox.warning(self, "Advertencia", "Selecciona una aplicación.")
+            return
+        self.run_task(fetch_commit_log, app,
+                      status_message=f"Obteniendo versiones de {app['application']}...",
+                      on_result=lambda commits: self.open_rollback_dialog(app, commits))
+    
+    def open_rollback_dialog(self, app, commits):
+        """Permite elegir un commit anterior y lo despliega"""
+        if not commits:
+            QMessageBox.information(self, "Versiones", "El remoto no ofrece versiones anteriores.")
+            return
+        dialog = RollbackDialog(app, commits, self)
+        if not dialog.exec():
+            return
+        entry = dialog.selected_commit()
+        if entry is None or entry["commit"] == app["commit"]:
+            return
+        if not self.confirm_not_running([app["application"]], "cambiar de versión"):
+            return
+        
+        command = ["flatpak", "update", installation_flag(app["installation"]), "-y",
+                   "--noninteractive", f"--commit={entry['commit']}"]
+        # Si el commit sigue en el repositorio local se despliega sin descargar nada
+        if entry["local"]:
+            command.append("--no-pull")
+        command.append(app["ref"])
+        commands = [command]
+        # Fijar después de desplegar: si la máscara se aplicara antes, flatpak omitiría la ref
+        pin = dialog.pin_check.isChecked() and not is_masked(app["ref"], self.app_masks(app))
+        if pin:
+            commands.append(self.mask_command(app, True))
+        
+        def deployed():
+            if pin:
+                self.masks_changed(app, commands[-1], True)
+            self.invalidate_dependency_graph()
+            self.refresh_apps()  # Nuevo commit: los detalles se cargan de nuevo
+        
+        self.tabs.setCurrentWidget(self.main_tab)
+        self.output_area.clear()
+        self.append_output(f"Desplegando {app['application']} en el commit {entry['commit'][:12]}...\n")
+        self.app_details.invalidate(app)
+        self.run_task(run_flatpak_commands, commands,
+                      status_message=f"Cambiando la versión de {app['application']}...",
+                      on_result=lambda result: deployed())
+    
+    def toggle_app_pin(self):
+        """Fija o desfija la versión de la aplicación seleccionada"""
+        app = self.selected_app()
+        if app is None:
+            QMessageBox.warning(self, "Advertencia", "Selecciona una aplicación.")
+            return
+        self.set_app_pinned(app, not is_masked(app["ref"], self.app_masks(app)))
+    
+    def mask_command(self, app, pinned):
+        """Construye el comando flatpak mask que fija o desfija la aplicación en su instalación"""
+        flag = installation_flag(app["installation"])
+        if pinned:
+            return ["flatpak", "mask", flag, app["application"]]
+        patterns = [pattern for pattern in self.app_masks(app) if ref_matches_pattern(app["ref"], pattern)]
+        return ["flatpak", "mask", flag, "--remove", *patterns]
+    
+    def masks_changed(self, app, command, pinned):
+        """Refleja en self.masks un comando flatpak mask ya aplicado"""
+        masks = self.app_masks(app)
+        if pinned:
+            masks = masks + [app["application"]]
+        else:
+            masks = [pattern for pattern in masks if pattern not in command]
+        self.masks[app["installation"]] = masks
+        self.app_selected(self.app_list.currentRow())
+    
+    def set_app_pinned(self, app, pinned):
+        """Añade o elimina el patrón flatpak mask de la aplicación"""
+        command = self.mask_command(app, pinned)
+        self.run_task(run_flatpak_commands, [command],
+                      status_message="Fijando versión..." if pinned else "Desfijando versión...",
+                      on_result=lambda result: self.masks_changed(app, command, pinned))
+    
+    def setup_running_tab(self):
+        """Configura la pestaña de aplicaciones en ejecución"""
+        layout = QVBoxLayout(self.running_tab)
+        
+        interval_layout = QHBoxLayout()
+        self.monitor_interval = QSpinBox()
+        self.monitor_interval.setRange(1, 60)
+        self.monitor_interval.setSuffix(" s")
+        self.monitor_interval.setValue(
+            self.settings.value("monitor/interval", MONITOR_DEFAULT_INTERVAL, type=int))
+        self.monitor_interval.valueChanged.connect(self.set_monitor_interval)
+        interval_layout.addWidget(QLabel("Intervalo de muestreo:"))
+        interval_layout.addWidget(self.monitor_interval)
+        interval_layout.addStretch()
+        layout.addLayout(interval_layout)
+        
+        headers = ["Aplicación", "Instancia", "PID", "Procesos", "CPU", "Memoria",
+                   "Lectura", "Escritura"]
+        self.running_table = QTableWidget(0, len(headers))
+        self.running_table.setHorizontalHeaderLabels(headers)
+        self.running_table.verticalHeader().setVisible(False)
+        self.running_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.running_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.running_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.running_table, 1)
+        
+        btn_layout = QHBoxLayout()
+        self.kill_app_btn = QPushButton("Detener aplicación")
+        self.kill_app_btn.clicked.connect(self.kill_selected_app)
+        btn_layout.addStretch()
+        btn_layout.addWidget(self.kill_app_btn)
+        layout.addLayout(btn_layout)
+    
+    def update_monitor_state(self, *args):
+        """Muestrea solo mientras la pestaña En ejecución está visible"""
+        if self.tabs.currentWidget() is self.running_tab and self.isVisible():
+            self.sample_running()
+            self.monitor_timer.start(self.monitor_interval.value() * 1000)
+        else:
+            self.monitor_timer.stop()
+    
+    def set_monitor_interval(self, seconds):
+        """Cambia y guarda el intervalo de muestreo"""
+        self.settings.setValue("monitor/interval", seconds)
+        if self.monitor_timer.isActive():
+            self.monitor_timer.start(seconds * 1000)
+    
+    def sample_running(self):
+        """Actualiza la tabla de instancias con una nueva muestra"""
+        samples = self.sampler.sample(list_running_instances())
+        self.running_table.setRowCount(len(samples))
+        for row, sample in enumerate(samples):
+            values = [
+                sample.app,
+                sample.instance,
+                str(sample.pid),
+                str(sample.processes),
+                f"{sample.cpu_percent:.1f} %",
+                format_size(sample.rss),
+                f"{format_size(sample.read_rate)}/s",
+                f"{format_size(sample.write_rate)}/s",
+            ]
+            for column, value in enumerate(values):
+                self.running_table.setItem(row, column, QTableWidgetItem(value))
+    
+    def kill_selected_app(self):
+        """Detiene la aplicación seleccionada en la tabla de instancias"""
+        rows = self.running_table.selectionModel().selectedRows()
+        if not rows:
+            QMessageBox.warning(self, "Advertencia", "Selecciona una aplicación en la tabla.")
+            return
+        app_id = self.running_table.item(rows[0].row(), 0).text()
+        reply = QMessageBox.question(
+            self,
+            "Detener aplicación",
+            f"¿Estás seguro de que deseas detener {app_id}? Se perderán los datos sin guardar.",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+            QMessageBox.StandardButton.No
+        )
+        if reply == QMessageBox.StandardButton.Yes:
+            if not kill_app(app_id):
+                QMessageBox.critical(self, "Error", f"No se pudo detener {app_id}.")
+            self.sample_running()
+    
+    def confirm_not_running(self, app_ids, action):
+        """
+        Comprueba que las aplicaciones no estén en ejecución antes de modificarlas
+        
+        Si alguna se está ejecutando, ofrece detenerla primero.
+        
+        Args:
+            app_ids (iterable): Aplicaciones afectadas por la operación
+            action (str): Descripción de la operación (ej: 'desinstalar')
+        
+        Returns:
+            bool: True si se puede continuar con la operación
+        """
+        running = sorted(set(app_ids) & running_app_ids())
+        if not running:
+            return True
+        reply = QMessageBox.question(
+            self,
+            "Aplicaciones en ejecución",
+            f"Antes de {action} hay que cerrar estas aplicaciones en ejecución:\n\n"
+            + "\n".join(running)
+            + "\n\n¿Deseas detenerlas ahora? Se perderán los datos sin guardar.",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.Cancel,
+            QMessageBox.StandardButton.Cancel
+        )
+        if reply != QMessageBox.StandardButton.Yes:
+            return False
+        failed = [app_id for app_id in running if not kill_app(app_id)]
+        if failed:
+            QMessageBox.critical(self, "Error", f"No se pudieron detener: {', '.join(failed)}")
+            return False
+        return True
+    
+    def setup_history_tab(self):
+        """Configura la pestaña de historial de operaciones"""
+        layout = QVBoxLayout(self.history_tab)
+        self.history_cursors = []  # Posición inicial de cada página visitada
+        self.history_rows = []
+        
+        search_layout = QHBoxLayout()
+        self.history_search = QLineEdit()
+        self.history_search.setPlaceholderText("Buscar por comando, ref o salida...")
+        self.history_search_timer = QTimer(self.history_tab)
+        self.history_search_timer.setSingleShot(True)
+        self.history_search_timer.setInterval(250)
+        self.history_search_timer.timeout.connect(self.reload_history)
+        self.history_search.textChanged.connect(self.history_search_timer.start)
+        self.import_history_btn = QPushButton("Importar de flatpak history")
+        self.import_history_btn.clicked.connect(self.import_history)
+        search_layout.addWidget(self.history_search, 1)
+        search_layout.addWidget(self.import_history_btn)
+        layout.addLayout(search_layout)
+        
+        splitter = QSplitter(Qt.Orientation.Vertical)
+        headers = ["Fecha", "Origen", "Comando", "Ámbito", "Refs", "Duración", "Código"]
+        self.history_table = QTableWidget(0, len(headers))
+        self.history_table.setHorizontalHeaderLabels(headers)
+        self.history_table.verticalHeader().setVisible(False)
+        self.history_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.history_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.history_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
+        self.history_table.currentCellChanged.connect(self.show_history_output)
+        splitter.addWidget(self.history_table)
+        
+        self.history_output = QTextEdit()
+        self.history_output.setReadOnly(True)
+        self.history_output.setFont(QFont("Monospace", 9))
+        splitter.addWidget(self.history_output)
+        splitter.setSizes([400, 150])
+        layout.addWidget(splitter, 1)
+        
+        page_layout = QHBoxLayout()
+        self.history_prev_btn = QPushButton("Anterior")
+        self.history_next_btn = QPushButton("Siguiente")
+        self.history_page_label = QLabel()
+        self.history_prev_btn.clicked.connect(self.history_previous_page)
+        self.history_next_btn.clicked.connect(self.history_next_page)
+        page_layout.addWidget(self.history_prev_btn)
+        page_layout.addStretch()
+        page_layout.addWidget(self.history_page_label)
+        page_layout.addStretch()
+        page_layout.addWidget(self.history_next_btn)
+        layout.addLayout(page_layout)
+        
+        self.tabs.currentChanged.connect(self.history_tab_shown)
+    
+    def history_tab_shown(self, index):
+        """Recarga el historial al abrir su pestaña"""
+        if self.tabs.widget(index) is self.history_tab:
+            self.reload_history()
+    
+    def reload_history(self):
+        """Vuelve a la primera página del historial con la búsqueda actual"""
+        self.history_cursors = [None]
+        self.load_history_page()
+    
+    def load_history_page(self):
+        """Muestra la página del historial indicada por el último cursor"""
+        history = get_history()
+        if history is None:
+            self.history_page_label.setText("Historial no disponible")
+            return
+        rows = history.page(self.history_search.text(), self.history_cursors[-1])
+        self.history_rows = rows
+        self.history_table.setRowCount(len(rows))
+        for row, operation in enumerate(rows):
+            started = datetime.fromtimestamp(operation["started"])
+            duration = ""
+            if operation["finished"] and operation["finished"] > operation["started"]:
+                duration = f"{operation['finished'] - operation['started']:.1f} s"
+            exit_code = "" if operation["exit_code"] is None else str(operation["exit_code"])
+            values = [started.strftime("%Y-%m-%d %H:%M:%S"), operation["source"], operation["command"],
+                      operation["scope"], operation["refs"], duration, exit_code]
+            for column, value in enumerate(values):
+                self.history_table.setItem(row, column, QTableWidgetItem(value))
+        self.history_output.clear()
+        self.history_page_label.setText(f"Página {len(self.history_cursors)}")
+        self.history_prev_btn.setEnabled(len(self.history_cursors) > 1)
+        self.history_next_btn.setEnabled(len(rows) == HISTORY_PAGE_SIZE)
+    
+    def history_next_page(self):
+        """Avanza a la siguiente página del historial"""
+        if self.history_rows:
+            last = self.history_rows[-1]
+            self.history_cursors.append((last["started"], last["id"]))
+            self.load_history_page()
+    
+    def history_previous_page(self):
+        """Vuelve a la página anterior del historial"""
+        if len(self.history_cursors) > 1:
+            self.history_cursors.pop()
+            self.load_history_page()
+    
+    def show_history_output(self, row, *args):
+        """Muestra la salida guardada de la operación seleccionada"""
+        history = get_history()
+        if history is None or not 0 <= row < len(self.history_rows):
+            self.history_output.clear()
+            return
+        self.history_output.setPlainText(history.output(self.history_rows[row]["id"]))
+    
+    def import_history(self):
+        """Importa en segundo plano las entradas de flatpak history del journal"""
+        history = get_history()
+        if history is None:
+            QMessageBox.critical(self, "Error", "El historial no está disponible.")
+            return
+        self.run_task(history.import_journal,
+                      status_message="Importando historial de flatpak...",
+                      on_result=lambda count: self.reload_history())
+    
     def setup_config_tab(self):
         """Configura la pestaña de configuración"""
         self.config_tab = QWidget()
@@ -305,6 +4283,22 @@ class FlatpakManager(QMainWindow):
         self.auto_update_check = QCheckBox("Buscar actualizaciones al iniciar")
         general_layout.addRow(self.auto_update_check)
         
+        # Descarga de actualizaciones en horas de poco uso
+        self.staging_check = QCheckBox("Descargar actualizaciones en segundo plano, sin aplicarlas")
+        general_layout.addRow(self.staging_check)
+        staging_layout = QHBoxLayout()
+        self.staging_start = QSpinBox()
+        self.staging_end = QSpinBox()
+        for spin in (self.staging_start, self.staging_end):
+            spin.setRange(0, 23)
+            spin.setSuffix(":00")
+        staging_layout.addWidget(QLabel("entre las"))
+        staging_layout.addWidget(self.staging_start)
+        staging_layout.addWidget(QLabel("y las"))
+        staging_layout.addWidget(self.staging_end)
+        staging_layout.addStretch()
+        general_layout.addRow("Franja de descarga:", staging_layout)
+        
         # Tamaño de fuente
         self.font_size = QComboBox()
         self.font_size.addItems(["Pequeño", "Mediano", "Grande", "Muy grande"])
@@ -354,36 +4348,104 @@ class FlatpakManager(QMainWindow):
         perf_layout.addWidget(self.parallel_downloads)
         perf_layout.addWidget(QLabel("Máximo de descargas simultáneas:"))
         perf_layout.addWidget(self.max_downloads)
+        
+        # Política de recursos de las tareas en segundo plano (las manuales van a plena velocidad)
+        self.background_priority = QComboBox()
+        self.background_priority.addItem("Baja (nice 19, E/S ociosa)", "low")
+        self.background_priority.addItem("Media (nice 10, E/S baja)", "medium")
+        self.background_priority.addItem("Normal", "normal")
+        self.background_bandwidth = QSpinBox()
+        self.background_bandwidth.setRange(0, 1000000)
+        self.background_bandwidth.setSingleStep(256)
+        self.background_bandwidth.setSuffix(" KB/s")
+        self.background_bandwidth.setSpecialValueText("Sin límite")
+        if not shutil.which("trickle"):
+            self.background_bandwidth.setEnabled(False)
+            self.background_bandwidth.setToolTip("Instala trickle para limitar el ancho de banda")
+        self.systemd_scope_check = QCheckBox("Ejecutar en un scope de systemd con menor peso de CPU y E/S")
+        self.systemd_scope_check.setEnabled(
+            shutil.which("systemd-run") is not None and user_bus_available())
+        perf_layout.addWidget(QLabel("Prioridad de las tareas en segundo plano:"))
+        perf_layout.addWidget(self.background_priority)
+        perf_layout.addWidget(QLabel("Ancho de banda en segundo plano:"))
+        perf_layout.addWidget(self.background_bandwidth)
+        perf_layout.addWidget(self.systemd_scope_check)
         perf_group.setLayout(perf_layout)
         
         # Grupo de repositorios
         repo_group = QGroupBox("Repositorios")
         repo_layout = QVBoxLayout()
         
-        self.repo_list = QTextEdit()
-        self.repo_list.setReadOnly(True)
-        self.repo_list.setMaximumHeight(100)
+        self.remotes_model = RemotesModel(self.config_tab)
+        self.repo_table = QTableView()
+        self.repo_table.setModel(self.remotes_model)
+        self.repo_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.repo_table.setSelectionMode(QAbstractItemView.SelectionMode.SingleSelection)
+        self.repo_table.verticalHeader().setVisible(False)
+        self.repo_table.horizontalHeader().setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
+        self.repo_table.setMaximumHeight(160)
         
         # Botones de repositorios
         repo_btn_layout = QHBoxLayout()
         self.refresh_repos_btn = QPushButton("Actualizar")
         self.add_repo_btn = QPushButton("Añadir")
         self.remove_repo_btn = QPushButton("Eliminar")
+        self.probe_repos_btn = QPushButton("Diagnosticar")
+        self.probe_repos_btn.setToolTip("Mide la latencia y velocidad de cada repositorio")
         repo_btn_layout.addWidget(self.refresh_repos_btn)
         repo_btn_layout.addWidget(self.add_repo_btn)
         repo_btn_layout.addWidget(self.remove_repo_btn)
+        self.raise_repo_btn = QPushButton("Subir")
+        self.lower_repo_btn = QPushButton("Bajar")
+        self.toggle_repo_btn = QPushButton("Activar/Desactivar")
+        self.raise_repo_btn.setToolTip("Aumenta la prioridad del repositorio seleccionado")
+        self.lower_repo_btn.setToolTip("Reduce la prioridad del repositorio seleccionado")
+        repo_btn_layout.addWidget(self.raise_repo_btn)
+        repo_btn_layout.addWidget(self.lower_repo_btn)
+        repo_btn_layout.addWidget(self.toggle_repo_btn)
+        repo_btn_layout.addWidget(self.probe_repos_btn)
         
         repo_layout.addWidget(QLabel("Repositorios configurados:"))
-        repo_layout.addWidget(self.repo_list)
+        repo_layout.addWidget(self.repo_table)
         repo_layout.addLayout(repo_btn_layout)
         
-        # Actualizar lista de repositorios
-        self.update_repo_list()
+        # Espejo local
+        mirror_layout = QHBoxLayout()
+        self.mirror_serve_check = QCheckBox("Servir espejo local en el puerto")
+        self.mirror_port = QSpinBox()
+        self.mirror_port.setRange(1024, 65535)
+        self.mirror_port.setValue(MIRROR_DEFAULT_PORT)
+        self.sync_mirror_btn = QPushButton("Sincronizar espejo")
+        self.use_mirror_btn = QPushButton("Usar espejo")
+        self.sync_mirror_btn.setToolTip("Copia las refs seleccionadas al espejo local")
+        self.use_mirror_btn.setToolTip("Añade un espejo como remoto preferente para instalar y actualizar")
+        mirror_layout.addWidget(self.mirror_serve_check)
+        mirror_layout.addWidget(self.mirror_port)
+        mirror_layout.addWidget(self.sync_mirror_btn)
+        mirror_layout.addWidget(self.use_mirror_btn)
+        repo_layout.addLayout(mirror_layout)
+        
         repo_group.setLayout(repo_layout)
         
+        # Grupo de métricas
+        metrics_group = QGroupBox("Métricas (Prometheus)")
+        metrics_layout = QHBoxLayout()
+        self.metrics_serve_check = QCheckBox("Publicar /metrics en el puerto")
+        self.metrics_port = QSpinBox()
+        self.metrics_port.setRange(1024, 65535)
+        self.metrics_port.setValue(METRICS_DEFAULT_PORT)
+        self.metrics_remote_check = QCheckBox("Accesible desde la red")
+        self.metrics_remote_check.setToolTip("Escucha en todas las interfaces en lugar de solo en localhost")
+        metrics_layout.addWidget(self.metrics_serve_check)
+        metrics_layout.addWidget(self.metrics_port)
+        metrics_layout.addWidget(self.metrics_remote_check)
+        metrics_layout.addStretch()
+        metrics_group.setLayout(metrics_layout)
+        
         # Agregar grupos al layout principal
         layout.addWidget(clean_group)
         layout.addWidget(perf_group)
+        layout.addWidget(metrics_group)
         layout.addWidget(repo_group)
         
         # Botones de acción
@@ -411,6 +4473,12 @@ class FlatpakManager(QMainWindow):
         self.refresh_repos_btn.clicked.connect(self.update_repo_list)
         self.add_repo_btn.clicked.connect(self.add_repository)
         self.remove_repo_btn.clicked.connect(self.remove_repository)
+        self.raise_repo_btn.clicked.connect(lambda: self.move_repository(1))
+        self.lower_repo_btn.clicked.connect(lambda: self.move_repository(-1))
+        self.toggle_repo_btn.clicked.connect(self.toggle_repository)
+        self.probe_repos_btn.clicked.connect(self.probe_repositories)
+        self.sync_mirror_btn.clicked.connect(self.sync_mirror)
+        self.use_mirror_btn.clicked.connect(self.use_mirror)
         
         # Actualizar estado inicial
         self.toggle_parallel_downloads(self.parallel_downloads.checkState())
@@ -458,10 +4526,47 @@ class FlatpakManager(QMainWindow):
         update_action.triggered.connect(self.check_updates)
         tools_menu.addAction(update_action)
         
+        update_all_action = QAction("Actualizar &Todo", self)
+        update_all_action.triggered.connect(self.update_all)
+        tools_menu.addAction(update_all_action)
+        
+        self.pause_action = QAction("&Pausar descargas y operaciones", self)
+        self.pause_action.setCheckable(True)
+        self.pause_action.toggled.connect(self.set_operations_paused)
+        tools_menu.addAction(self.pause_action)
+        
+        stage_action = QAction("&Descargar actualizaciones sin aplicar", self)
+        stage_action.triggered.connect(self.stage_updates_now)
+        tools_menu.addAction(stage_action)
+        
+        apply_staged_action = QAction("Aplicar actualizaciones p&reparadas", self)
+        apply_staged_action.triggered.connect(self.apply_staged_updates)
+        tools_menu.addAction(apply_staged_action)
+        
         clean_action = QAction("&Limpiar Caché", self)
         clean_action.triggered.connect(self.clean_cache)
         tools_menu.addAction(clean_action)
         
+        app_data_action = QAction("Datos de a&plicaciones", self)
+        app_data_action.triggered.connect(self.scan_app_data)
+        tools_menu.addAction(app_data_action)
+        
+        permissions_action = QAction("Auditar &permisos", self)
+        permissions_action.triggered.connect(self.show_permissions)
+        tools_menu.addAction(permissions_action)
+        
+        dependencies_action = QAction("&Dependencias", self)
+        dependencies_action.triggered.connect(self.show_dependencies)
+        tools_menu.addAction(dependencies_action)
+        
+        verify_action = QAction("&Verificar integridad", self)
+        verify_action.triggered.connect(self.verify_integrity)
+        tools_menu.addAction(verify_action)
+        
+        verify_all_action = QAction("Verificar integridad de &todas las refs", self)
+        verify_all_action.triggered.connect(lambda: self.verify_integrity(force=True))
+        tools_menu.addAction(verify_all_action)
+        
         repair_action = QAction("&Reparar Flatpaks", self)
         repair_action.triggered.connect(self.repair_flatpaks)
         tools_menu.addAction(repair_action)
@@ -491,14 +4596,25 @@ class FlatpakManager(QMainWindow):
         tray_menu = QMenu()
         
         show_action = QAction("Mostrar", self)
-        show_action.triggered.connect(self.show)
+        show_action.triggered.connect(self.show_window)
         tray_menu.addAction(show_action)
         
+        check_action = QAction("Buscar actualizaciones", self)
+        check_action.triggered.connect(self.scheduler.check_updates)
+        tray_menu.addAction(check_action)
+        
+        self.apply_staged_action = QAction("Aplicar actualizaciones preparadas", self)
+        self.apply_staged_action.triggered.connect(self.apply_staged_updates)
+        tray_menu.addAction(self.apply_staged_action)
+        tray_menu.addAction(self.pause_action)
+        
         exit_action = QAction("Salir", self)
         exit_action.triggered.connect(self.close)
         tray_menu.addAction(exit_action)
         
         self.tray_icon.setContextMenu(tray_menu)
+        self.tray_icon.activated.connect(self.tray_activated)
+        self.update_tray_state()
         self.tray_icon.show()
         
         # Mostrar notificación al iniciar
@@ -517,6 +4633,186 @@ class FlatpakManager(QMainWindow):
         else:
             print("El sistema no soporta notificaciones en la bandeja")
     
+    def tray_activated(self, reason):
+        """Muestra u oculta la ventana al pulsar el icono de la bandeja"""
+        if reason == QSystemTrayIcon.ActivationReason.Trigger:
+            if self.isVisible():
+                self.hide_to_tray()
+            else:
+                self.show_window()
+    
+    def hide_to_tray(self):
+        """Oculta la ventana y libera su interfaz; quedan el planificador y la bandeja"""
+        self.hide()
+        self.monitor_timer.stop()
+        self.release_ui()
+    
+    def release_ui(self):
+        """Destruye los widgets de la ventana oculta cuando no hay tareas que los usen"""
+        if self.isVisible() or not self.ui_built:
+            return
+        running = self.command_thread is not None and self.command_thread.isRunning()
+        if running or self.task_threads:
+            QTimer.singleShot(TRAY_RELEASE_RETRY, self.release_ui)
+            return
+        self.memory_usage["ventana"] = resident_memory()
+        self.ui_built = False
+        self.icon_timer.stop()
+        self.takeCentralWidget().deleteLater()
+        self.setStatusBar(None)
+        self.app_details.cache.clear()
+        QPixmapCache.clear()
+        # Los widgets se destruyen en la siguiente vuelta del bucle de eventos
+        QTimer.singleShot(1000, self.measure_tray_memory)
+    
+    def measure_tray_memory(self):
+        """Libera memoria y mide la memoria residente en la bandeja"""
+        if self.ui_built:
+            return
+        release_memory()
+        self.memory_usage["bandeja"] = resident_memory()
+        self.update_tray_state()
+    
+    def update_tray_state(self):
+        """Refleja en el icono y el menú de la bandeja las actualizaciones preparadas"""
+        staged = len(self.staged_updates)
+        icon = 'SP_ArrowDown' if staged else 'SP_ComputerIcon'
+        self.tray_icon.setIcon(self.style().standardIcon(getattr(QStyle.StandardPixmap, icon)))
+        self.apply_staged_action.setEnabled(bool(staged))
+        self.apply_staged_action.setText(
+            f"Aplicar actualizaciones preparadas ({staged})" if staged
+            else "Aplicar actualizaciones preparadas")
+        tooltip = [f"{APP_NAME} v{VERSION}"]
+        if PROCESSES.paused:
+            tooltip.append("Descargas y operaciones en pausa")
+        if staged:
+            tooltip.append(f"{staged} actualizaciones descargadas, listas para aplicar")
+        if "bandeja" in self.memory_usage:
+            tooltip.append(f"Memoria residente: {format_size(self.memory_usage['bandeja'])} "
+                           f"(con ventana: {format_size(self.memory_usage['ventana'])})")
+        self.tray_icon.setToolTip("\n".join(tooltip))
+    
+    def show_window(self):
+        """Muestra la ventana, reconstruyendo la interfaz si se liberó en la bandeja"""
+        if not self.ui_built:
+            started = time.monotonic()
+            self.setup_ui()
+            self.system_info.setPlainText(self.system_info_text)
+            backlog = list(self.output_backlog)
+            self.output_backlog.clear()
+            for line in backlog:
+                self.append_output(line)
+            self.append_output(
+                f"Interfaz reconstruida en {(time.monotonic() - started) * 1000:.0f} ms. "
+                f"Memoria residente en la bandeja: {format_size(self.memory_usage.get('bandeja', 0))}, "
+                f"con la ventana: {format_size(self.memory_usage.get('ventana', 0))}")
+        self.show()
+        self.raise_()
+        self.activateWindow()
+    
+    def notify(self, setting, title, message):
+        """Muestra una notificación en la bandeja si está habilitada en la configuración"""
+        if self.settings.value(setting, True, type=bool) and self.tray_icon.isVisible():
+            self.tray_icon.showMessage(title, message, msecs=5000)
+    
+    def scheduled_updates_found(self, plan):
+        """Informa de las actualizaciones encontradas por el planificador"""
+        self.record_update_check(plan)
+        self.append_output(f"Búsqueda programada: {len(plan)} actualizaciones disponibles")
+        if plan:
+            self.notify("notif/updates", "Actualizaciones disponibles",
+                        f"Hay {len(plan)} actualizaciones de Flatpak disponibles")
+    
+    def scheduled_cleanup_finished(self, success, message):
+        """Informa del resultado de la limpieza programada"""
+        if success:
+            self.invalidate_dependency_graph()
+            self.append_output("Limpieza programada completada")
+            self.notify("notif/complete", "Limpieza completada",
+                        "Se eliminaron los runtimes sin uso")
+        else:
+            self.append_output(f"Error en la limpieza programada: {message}")
+            self.notify("notif/errors", "Error en la limpieza", message)
+    
+    def staged_updates_ready(self, staged):
+        """Marca en la bandeja las actualizaciones descargadas por el planificador"""
+        self.staged_updates = staged
+        METRICS.set("staged_updates", len(staged))
+        self.update_tray_state()
+        self.append_output(f"Actualizaciones descargadas y listas para aplicar: {len(staged)}")
+        if staged:
+            self.notify("notif/updates", "Actualizaciones preparadas",
+                        f"{len(staged)} actualizaciones descargadas; se aplicarán en segundos")
+    
+    def set_operations_paused(self, paused):
+        """Pausa o reanuda las descargas y operaciones de flatpak en curso"""
+        if paused:
+            PROCESSES.pause()
+            message = "Descargas y operaciones en pausa"
+        else:
+            PROCESSES.resume()
+            message = "Descargas y operaciones reanudadas"
+        self.append_output(message)
+        if self.ui_built:
+            self.statusBar.showMessage(message, 3000)
+        self.update_tray_state()
+    
+    def staging_failed(self, message):
+        """Informa de un error al descargar las actualizaciones en segundo plano"""
+        self.append_output(f"Error al preparar las actualizaciones: {message}")
+        self.notify("notif/errors", "Error al preparar las actualizaciones", message)
+    
+    def stage_updates_now(self):
+        """Descarga ahora las actualizaciones pendientes sin aplicarlas"""
+        self.append_output("Descargando actualizaciones en segundo plano (sin aplicarlas)...")
+        self.scheduler.stage()
+    
+    def apply_staged_updates(self):
+        """Aplica las actualizaciones descargadas sin acceder a la red"""
+        if not self.ui_built or not self.isVisible():
+            self.show_window()
+        if not self.staged_updates:
+            self.append_output("No hay actualizaciones preparadas.")
+            return
+        apps = [entry.name for entry in self.staged_updates if entry.kind == "app"]
+        if not self.confirm_not_running(apps, "actualizar"):
+            return
+        self.output_area.clear()
+        self.append_output(f"Aplicando {len(self.staged_updates)} actualizaciones preparadas...\n")
+        self.set_buttons_enabled(False)
+        self.run_task(deploy_staged_updates,
+                      status_message="Aplicando actualizaciones preparadas...",
+                      on_progress=self.update_progress,
+                      on_result=self.staged_updates_applied)
+    
+    def staged_updates_applied(self, stats):
+        """Muestra el resultado de aplicar las actualizaciones preparadas"""
+        if stats is None:
+            # La lista en disco ya estaba vacía
+            self.staged_updates = []
+            METRICS.set("staged_updates", 0)
+            self.update_tray_state()
+            return
+        self.report_update_stats(stats)
+    
+    def handle_activation(self, args):
+        """Atiende un segundo arranque del programa, que entrega aquí sus argumentos"""
+        if "--tray" not in args:
+            self.show_window()
+    
+    def queued_job_finished(self, job):
+        """Informa del fin de una operación encolada por IPC y refresca los datos"""
+        command = shlex.join(job.command)
+        if job.state == "done":
+            self.append_output(f"Trabajo {job.id} completado: {command}")
+            self.notify("notif/complete", "Operación completada", command)
+        else:
+            self.append_output(f"Trabajo {job.id} falló ({job.returncode}): {command}")
+            self.notify("notif/errors", "Error en la operación", command)
+        self.invalidate_dependency_graph()
+        if self.ui_built:
+            self.refresh_apps()
+    
     def show_system_info(self):
         """Muestra información del sistema"""
         info = []
@@ -547,7 +4843,8 @@ class FlatpakManager(QMainWindow):
         except subprocess.CalledProcessError as e:
             info.append("Error al obtener información de Flatpak")
         
-        self.system_info.setPlainText("\n".join(info))
+        self.system_info_text = "\n".join(info)
+        self.system_info.setPlainText(self.system_info_text)
     
     def run_command(self, command, show_output=True, status_message=""):
         """
@@ -567,7 +4864,7 @@ class FlatpakManager(QMainWindow):
         
         # Mostrar el comando en la salida si es necesario
         if show_output and hasattr(self, 'append_output'):
-            self.append_output(f"$ {command}")
+            self.append_output(f"$ {command if isinstance(command, str) else shlex.join(command)}")
         
         # Verificar si hay un hilo en ejecución
         if hasattr(self, 'command_thread') and self.command_thread and self.command_thread.isRunning():
@@ -578,8 +4875,53 @@ class FlatpakManager(QMainWindow):
         if show_output and hasattr(self, 'append_output'):
             self.command_thread.output_signal.connect(self.append_output)
         self.command_thread.finished_signal.connect(self.command_finished)
+        self.command_thread.finished_signal.connect(self.invalidate_dependency_graph)
         self.command_thread.start()
     
+    def run_task(self, func, *args, status_message="", on_result=None, on_progress=None,
+                 quiet=False):
+        """
+        Ejecuta una función de Python en segundo plano
+        
+        Args:
+            func (callable): Función a ejecutar; recibe una función de registro y args
+            status_message (str): Mensaje a mostrar en la barra de estado
+            on_result (callable): Se llama con el valor devuelto por func (opcional)
+            on_progress (callable): Recibe el progreso estructurado; si se indica,
+                func recibe también una función de progreso (opcional)
+            quiet (bool): No actualizar la barra de estado (para cargas de datos)
+        """
+        if not quiet:
+            if status_message:
+                self.status_label.setText(status_message)
+            self.progress_bar.setRange(0, 0)  # Modo indeterminado
+        
+        thread = TaskThread(func, *args, with_progress=on_progress is not None)
+        thread.output_signal.connect(self.append_output)
+        if on_progress:
+            thread.progress_signal.connect(on_progress)
+        if on_result:
+            thread.result_signal.connect(on_result)
+        if quiet:
+            thread.finished_signal.connect(self.quiet_task_finished)
+        else:
+            thread.finished_signal.connect(self.task_finished)
+        thread.finished.connect(lambda: self.task_threads.remove(thread))
+        self.task_threads.append(thread)
+        thread.start()
+        return thread
+    
+    def task_finished(self, success, message):
+        """Se ejecuta cuando termina una tarea en segundo plano"""
+        if not success and message:
+            self.append_output(f"Error: {message}")
+        self.command_finished(success, message)
+    
+    def quiet_task_finished(self, success, message):
+        """Informa solo de los errores de las tareas silenciosas"""
+        if not success:
+            self.append_output(f"Error: {message}")
+    
     def command_finished(self, success, message):
         """Se ejecuta cuando termina un comando"""
         self.set_buttons_enabled(True)
@@ -599,7 +4941,7 @@ class FlatpakManager(QMainWindow):
     def set_buttons_enabled(self, enabled):
         """Habilita o deshabilita los botones"""
         # Solo intentar habilitar/deshabilitar los botones que existen
-        buttons = ['btn_list', 'btn_updates', 'btn_install', 
+        buttons = ['btn_list', 'btn_updates', 'btn_update_all', 'btn_install', 
                   'btn_uninstall', 'btn_export']
         
         for btn_name in buttons:
@@ -609,7 +4951,10 @@ class FlatpakManager(QMainWindow):
                     btn.setEnabled(enabled)
     
     def append_output(self, text):
-        """Agrega texto al área de salida"""
+        """Agrega texto al área de salida (o al registro pendiente si la interfaz no existe)"""
+        if not self.ui_built:
+            self.output_backlog.append(text)
+            return
         self.output_area.moveCursor(QTextCursor.MoveOperation.End)
         self.output_area.insertPlainText(text + "\n")
         self.output_area.moveCursor(QTextCursor.MoveOperation.End)
@@ -639,43 +4984,189 @@ class FlatpakManager(QMainWindow):
             self.statusBar.showMessage("Error inesperado", 5000)
     
     def check_updates(self):
-        """Busca actualizaciones disponibles"""
+        """Busca actualizaciones disponibles y abre el planificador"""
         self.output_area.clear()
         self.append_output("Buscando actualizaciones disponibles...\n" + "="*50 + "\n")
+        self.run_task(self._load_update_plan,
+                      status_message="Buscando actualizaciones...",
+                      on_result=self.show_update_plan)
+    
+    @staticmethod
+    def _load_update_plan(log):
+        """Refresca la información de los repositorios y calcula el plan de actualización"""
+        # Primero actualizamos la información de los repositorios
+        update_result = run_recorded(["flatpak", "update", "--appstream"])
+        if update_result.returncode != 0:
+            log("Advertencia: No se pudo actualizar la información de los repositorios")
+            log(update_result.stderr.strip())
+        return fetch_update_plan()
+    
+    def show_update_plan(self, plan):
+        """Muestra las actualizaciones pendientes y aplica las seleccionadas"""
+        self.record_update_check(plan)
+        if not plan:
+            self.append_output("No hay actualizaciones disponibles.")
+            self.statusBar.showMessage("No hay actualizaciones disponibles", 3000)
+            return
         
-        try:
-            # Primero actualizamos la información de los repositorios
-            update_result = subprocess.run(
-                ["flatpak", "update", "--appstream"],
-                capture_output=True,
-                text=True
-            )
-            
-            if update_result.returncode != 0:
-                self.append_output("Advertencia: No se pudo actualizar la información de los repositorios")
-                self.append_output(update_result.stderr)
-            
-            # Luego buscamos actualizaciones disponibles
-            result = subprocess.run(
-                ["flatpak", "remote-ls", "--updates", "--columns=application,version,branch,origin"],
-                capture_output=True,
-                text=True
-            )
-            
-            if result.returncode == 0 and result.stdout.strip():
-                self.append_output("Actualizaciones disponibles:")
-                self.append_output("=" * 50)
-                self.append_output("Aplicación                Versión Actual    Rama      Origen")
-                self.append_output("-" * 50)
-                self.append_output(result.stdout)
-                self.statusBar.showMessage("Búsqueda de actualizaciones completada", 3000)
-            else:
-                self.append_output("No hay actualizaciones disponibles.")
-                self.statusBar.showMessage("No hay actualizaciones disponibles", 3000)
-                
-        except Exception as e:
-            self.append_output(f"Error al buscar actualizaciones: {str(e)}")
-            self.statusBar.showMessage("Error al buscar actualizaciones", 5000)
+        self.append_output("Actualizaciones disponibles:")
+        self.append_output("=" * 50)
+        self.append_output(f"{'Ref':<50} {'Versión':<12} {'Origen':<10} {'Descarga':>10} {'Cambio':>10}")
+        self.append_output("-" * 96)
+        for entry in plan:
+            self.append_output(f"{entry.ref:<50} {entry.version:<12} {entry.origin:<10} "
+                               f"{format_size(entry.download_size):>10} "
+                               f"{format_size(entry.size_delta, signed=True):>10}")
+        self.statusBar.showMessage("Búsqueda de actualizaciones completada", 3000)
+        
+        dialog = UpdatePlannerDialog(plan, self)
+        if not dialog.exec():
+            return
+        selected = dialog.selected_entries()
+        if selected:
+            self.append_output(f"\nActualizando {len(selected)} refs en una sola transacción...\n")
+            self.apply_updates(selected)
+    
+    def apply_updates(self, plan):
+        """
+        Aplica actualizaciones en una sola transacción
+        
+        Args:
+            plan (list): Actualizaciones (UpdateEntry) a aplicar; None para actualizar todo
+        
+        Returns:
+            bool: False si el usuario canceló la actualización
+        """
+        if plan is not None:
+            apps = [entry.name for entry in plan if entry.kind == "app"]
+            if not self.confirm_not_running(apps, "actualizar"):
+                return False
+        self.set_buttons_enabled(False)
+        self.run_task(run_update_transaction, plan,
+                      status_message="Aplicando actualizaciones...",
+                      on_progress=self.update_progress,
+                      on_result=self.report_update_stats)
+        return True
+    
+    def update_all(self):
+        """Actualiza todas las refs instaladas en una única transacción"""
+        self.output_area.clear()
+        self.append_output("Actualizando todo...\n" + "="*50 + "\n")
+        # Obtener primero el plan para saber qué aplicaciones se verán afectadas.
+        # La búsqueda es silenciosa para que su final no rehabilite los botones
+        # mientras la transacción sigue en curso; los botones quedan deshabilitados
+        # hasta que termina la transacción o se descarta el plan.
+        self.set_buttons_enabled(False)
+        self.status_label.setText("Buscando actualizaciones...")
+        self.progress_bar.setRange(0, 0)
+        thread = self.run_task(fetch_update_plan, quiet=True,
+                               on_result=self.update_all_with_plan)
+        thread.finished_signal.connect(
+            lambda success, message: success or self.command_finished(False, message))
+    
+    def update_all_with_plan(self, plan):
+        """Aplica todas las actualizaciones del plan"""
+        self.record_update_check(plan)
+        if not plan:
+            self.append_output("No hay actualizaciones disponibles.")
+            self.command_finished(True, "")
+            return
+        if not self.apply_updates(plan):
+            self.command_finished(True, "")
+    
+    def update_progress(self, progress):
+        """Refleja el progreso estructurado de una transacción en la barra de estado"""
+        self.progress_bar.setRange(0, progress["total"])
+        self.progress_bar.setValue(progress["index"] - 1)
+        action = {"Installing": "Instalando", "Updating": "Actualizando",
+                  "Uninstalling": "Desinstalando"}.get(progress["action"], progress["action"])
+        self.status_label.setText(f"{action} {progress['index']}/{progress['total']}: "
+                                  f"{progress['ref'].split('/')[1] if '/' in progress['ref'] else progress['ref']}")
+    
+    def report_update_stats(self, stats):
+        """Muestra las estadísticas de la transacción comparadas con las anteriores"""
+        if not stats:
+            return
+        METRICS.set("last_update_failed_refs", len(stats["failed"]))
+        if self.staged_updates:
+            self.staged_updates = discard_staged_updates(stats)
+            METRICS.set("staged_updates", len(self.staged_updates))
+            self.update_tray_state()
+        pending = METRICS.get("pending_updates")
+        if pending is not None:
+            METRICS.set("pending_updates", max(0, pending - (stats["refs"] - len(stats["failed"]))))
+        self.invalidate_dependency_graph()
+        if self.ui_built:
+            self.refresh_apps()  # Recoger los nuevos commits para el panel de detalles
+        self.append_output("\nResumen de la actualización:")
+        self.append_output("=" * 50)
+        self.append_output(f"Refs procesadas:       {stats['refs']}")
+        self.append_output(f"Bytes descargados:     {format_size(stats['bytes'])} (según el plan)")
+        self.append_output(f"Tiempo total:          {stats['seconds']:.1f} s")
+        self.append_output(f"Velocidad media:       {format_size(stats['throughput'])}/s")
+        if stats["failed"]:
+            self.append_output(f"Fallidas:              {', '.join(stats['failed'])}")
+        self.append_output("\nDuración por ref:")
+        for ref, seconds in sorted(stats["durations"].items(), key=lambda item: -item[1]):
+            self.append_output(f"  {seconds:8.1f} s  {ref}")
+        
+        previous = [item for item in load_update_stats()[:-1] if item.get("throughput")]
+        if previous:
+            average = sum(item["throughput"] for item in previous) / len(previous)
+            self.append_output(f"\nVelocidad media de las {len(previous)} actualizaciones anteriores: "
+                               f"{format_size(average)}/s")
+    
+    def show_permissions(self):
+        """Carga los permisos de todas las aplicaciones y abre la auditoría"""
+        self.append_output("Cargando permisos de las aplicaciones...")
+        self.run_task(load_app_permissions, self.permissions_cache,
+                      status_message="Cargando permisos...",
+                      on_result=self.open_permissions_dialog)
+    
+    def open_permissions_dialog(self, apps):
+        """Muestra la auditoría de permisos"""
+        dialog = PermissionsDialog(apps, self)
+        dialog.exec()
+    
+    def scan_app_data(self):
+        """Mide los datos de usuario de ~/.var/app y abre el resumen"""
+        self.append_output("Analizando ~/.var/app...")
+        self.run_task(scan_app_data,
+                      status_message="Analizando datos de las aplicaciones...",
+                      on_result=self.open_app_data_dialog)
+    
+    def open_app_data_dialog(self, usage):
+        """Muestra el espacio por aplicación y elimina los datos huérfanos marcados"""
+        dialog = AppDataDialog(usage, self)
+        if not dialog.exec():
+            return
+        selected = dialog.selected_entries()
+        if not selected:
+            return
+        reply = QMessageBox.question(
+            self,
+            "Eliminar datos",
+            f"¿Eliminar los datos de {len(selected)} aplicaciones desinstaladas "
+            f"({format_size(sum(item.size for item in selected))})? Esta acción no se puede deshacer.",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+            QMessageBox.StandardButton.No
+        )
+        if reply == QMessageBox.StandardButton.Yes:
+            self.run_task(remove_app_data, [item.path for item in selected],
+                          status_message="Eliminando datos de aplicaciones...")
+    
+    def show_dependencies(self):
+        """Sincroniza el grafo de dependencias y lo muestra"""
+        generation = self.graph_generation
+        self.run_task(load_dependency_graph, self.dependency_graph.copy(), self.metadata_cache,
+                      status_message="Analizando dependencias...",
+                      on_result=lambda graph: self.open_dependency_dialog(graph, generation))
+    
+    def open_dependency_dialog(self, graph, generation):
+        """Abre el diálogo de dependencias"""
+        self.dependency_graph_synced(graph, generation)
+        dialog = DependencyDialog(graph, self)
+        dialog.exec()
     
     def install_flatpak(self):
         """Instala una nueva aplicación Flatpak"""
@@ -684,73 +5175,62 @@ class FlatpakManager(QMainWindow):
         if ok and app_id:
             self.output_area.clear()
             self.append_output(f"Instalando {app_id}...\n" + "="*50 + "\n")
-            
-            try:
-                result = subprocess.run(
-                    ["flatpak", "install", "-y", app_id],
-                    capture_output=True,
-                    text=True
-                )
-                if result.returncode == 0:
-                    self.append_output(f"\n{app_id} instalado exitosamente!")
-                    self.statusBar.showMessage(f"{app_id} instalado exitosamente", 3000)
-                else:
-                    self.append_output(f"Error al instalar {app_id}:")
-                    self.append_output(result.stderr)
-                    self.statusBar.showMessage(f"Error al instalar {app_id}", 5000)
-            except Exception as e:
-                self.append_output(f"Error inesperado: {str(e)}")
-                self.statusBar.showMessage("Error inesperado", 5000)
+            # Consultar el espejo y descargar en segundo plano: un espejo
+            # inaccesible no debe bloquear la ventana
+            self.set_buttons_enabled(False)
+            self.run_task(install_app, app_id, self.mirror_remote_configured(),
+                          status_message=f"Instalando {app_id}...",
+                          on_result=self.app_installed)
+    
+    def app_installed(self, app_id):
+        """Informa de la instalación y refresca los datos"""
+        self.append_output(f"\n{app_id} instalado exitosamente!")
+        self.statusBar.showMessage(f"{app_id} instalado exitosamente", 3000)
+        self.invalidate_dependency_graph()
+        self.refresh_apps()
     
     def uninstall_flatpak(self):
-        """Desinstala una aplicación Flatpak"""
+        """Desinstala la aplicación seleccionada en la pestaña Aplicaciones"""
+        app = self.selected_app()
+        if app is None or self.tabs.currentWidget() is not self.apps_tab:
+            self.tabs.setCurrentWidget(self.apps_tab)
+            self.statusBar.showMessage("Selecciona la aplicación a desinstalar", 3000)
+            return
+        
+        reply = QMessageBox.question(
+            self,
+            "Desinstalar aplicación",
+            f"¿Estás seguro de que deseas desinstalar {app['name'] or app['application']} "
+            f"({app['application']})?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+            QMessageBox.StandardButton.No
+        )
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        if not self.confirm_not_running([app["application"]], "desinstalar"):
+            return
+        
         try:
-            # Obtener lista de aplicaciones instaladas
-            result = subprocess.run(
-                ["flatpak", "list", "--app", "--columns=application"],
-                capture_output=True,
-                text=True
-            )
-            
-            if result.returncode != 0:
-                self.append_output("Error al obtener la lista de aplicaciones:")
-                self.append_output(result.stderr)
-                return
-                
-            apps = [app.strip() for app in result.stdout.split('\n') if app.strip()]
+            self.output_area.clear()
+            self.append_output(f"Desinstalando {app['application']}...\n" + "="*50 + "\n")
             
-            if not apps:
-                QMessageBox.information(self, "Información", "No hay aplicaciones instaladas.")
-                return
-                
-            # Mostrar diálogo para seleccionar aplicación
-            app, ok = QInputDialog.getItem(
-                self, 
-                "Desinstalar aplicación", 
-                "Selecciona la aplicación a desinstalar:",
-                apps, 
-                0, 
-                False
-            )
+            result = run_recorded(["flatpak", "uninstall", "-y", app["ref"]])
             
-            if ok and app:
-                self.output_area.clear()
-                self.append_output(f"Desinstalando {app}...\n" + "="*50 + "\n")
-                
-                result = subprocess.run(
-                    ["flatpak", "uninstall", "-y", app],
-                    capture_output=True,
-                    text=True
-                )
+            if result.returncode == 0:
+                self.append_output(f"\n{app['application']} desinstalado exitosamente!")
+                self.statusBar.showMessage(f"{app['application']} desinstalado exitosamente", 3000)
+                self.app_details.invalidate(app)
+                self.dependency_graph.remove(app["ref"])
+                # Una sincronización en curso no verá la desinstalación: repetirla al terminar
+                self.graph_generation += 1
+                if self.graph_sync_thread is not None and self.graph_sync_thread.isRunning():
+                    self.graph_resync = True
+                self.refresh_apps()
+            else:
+                self.append_output(f"Error al desinstalar {app['application']}:")
+                self.append_output(result.stderr)
+                self.statusBar.showMessage(f"Error al desinstalar {app['application']}", 5000)
                 
-                if result.returncode == 0:
-                    self.append_output(f"\n{app} desinstalado exitosamente!")
-                    self.statusBar.showMessage(f"{app} desinstalado exitosamente", 3000)
-                else:
-                    self.append_output(f"Error al desinstalar {app}:")
-                    self.append_output(result.stderr)
-                    self.statusBar.showMessage(f"Error al desinstalar {app}", 5000)
-                    
         except Exception as e:
             self.append_output(f"Error inesperado: {str(e)}")
             self.statusBar.showMessage("Error inesperado", 5000)
@@ -798,6 +5278,53 @@ class FlatpakManager(QMainWindow):
                 status_message="Limpiando caché de Flatpak..."
             )
     
+    def verify_integrity(self, force=False):
+        """Verifica las refs instaladas o actualizadas desde la última verificación"""
+        self.output_area.clear()
+        self.append_output("Verificando la integridad de las refs instaladas...\n" + "="*50 + "\n")
+        self.run_task(verify_refs, self.verify_cache, force,
+                      status_message="Verificando integridad...",
+                      on_result=self.integrity_verified)
+    
+    def integrity_verified(self, corrupted):
+        """Informa del resultado de la verificación y ofrece reparar las refs dañadas"""
+        METRICS.set("corrupted_refs", len(corrupted))
+        if not corrupted:
+            self.append_output("\nNo se encontraron refs dañadas.")
+            return
+        dialog = RefSelectionDialog("Reinstalar refs dañadas", sorted(corrupted),
+                                    checked=corrupted, parent=self)
+        if not dialog.exec():
+            return
+        items = [corrupted[ref] for ref in dialog.selected_refs()]
+        if items:
+            self.run_task(reinstall_refs, items, self.verify_cache,
+                          status_message="Reinstalando refs dañadas...",
+                          on_result=self.corrupted_refs_reinstalled)
+    
+    def corrupted_refs_reinstalled(self, corrupted):
+        """Ofrece reparar solo las instalaciones con refs que siguen dañadas"""
+        METRICS.set("corrupted_refs", len(corrupted))
+        self.invalidate_dependency_graph()
+        if not corrupted:
+            self.append_output("\nTodas las refs reinstaladas están íntegras.")
+            return
+        installations = sorted({item["installation"] for item in corrupted.values()})
+        reply = QMessageBox.question(
+            self,
+            "Refs dañadas",
+            f"{len(corrupted)} refs siguen dañadas tras reinstalarlas; sus objetos en el "
+            f"repositorio local pueden estar corruptos.\n\n¿Ejecutar flatpak repair en "
+            f"la instalación {', '.join(installations)}?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+            QMessageBox.StandardButton.No
+        )
+        if reply == QMessageBox.StandardButton.Yes:
+            self.run_task(run_flatpak_commands,
+                          [["flatpak", "repair", installation_flag(installation)]
+                           for installation in installations],
+                          status_message="Reparando instalaciones...")
+    
     def repair_flatpaks(self):
         """Intenta reparar instalaciones de Flatpak dañadas"""
         reply = QMessageBox.question(
@@ -818,24 +5345,36 @@ class FlatpakManager(QMainWindow):
     
     def cleanup(self):
         """Limpia los recursos antes de salir"""
+        # Reanudar antes de esperar a los hilos: un proceso detenido no terminaría nunca
+        PROCESSES.resume()
         if hasattr(self, 'command_thread') and self.command_thread:
             if self.command_thread.isRunning():
                 self.command_thread.stop()
                 self.command_thread.wait(2000)  # Esperar hasta 2 segundos
             self.command_thread = None
+        for thread in list(self.task_threads):
+            thread.wait(2000)
+        self.ipc.stop()
+        self.jobs.stop()
+        self.scheduler.stop()
+        self.app_details.shutdown()
+        self.icon_loader.shutdown()
+        self.monitor_timer.stop()
+        self.mirror.stop()
+        self.metrics_exporter.stop()
             
     def clean_cache(self):
         """Limpia la caché de Flatpak"""
         try:
             self.output_area.clear()
             self.append_output("Limpiando caché de Flatpak...\n" + "="*50 + "\n")
+            if self.graph_loaded:
+                unused = self.dependency_graph.unused()
+                self.append_output(f"Runtimes sin uso: {len(unused)}, espacio recuperable estimado: "
+                                   f"{format_size(self.dependency_graph.reclaimable())}\n")
             
             # Ejecutar limpieza de caché
-            result = subprocess.run(
-                ["flatpak", "uninstall", "--unused", "-y"],
-                capture_output=True,
-                text=True
-            )
+            result = run_recorded(["flatpak", "uninstall", "--unused", "-y"])
             
             if result.returncode == 0:
                 self.append_output("\n¡Caché limpiada exitosamente!")
@@ -843,6 +5382,7 @@ class FlatpakManager(QMainWindow):
                 self.append_output("=" * 50)
                 self.append_output(result.stdout)
                 self.statusBar.showMessage("Caché limpiada exitosamente", 3000)
+                self.invalidate_dependency_graph()
             else:
                 self.append_output("Error al limpiar la caché:")
                 self.append_output(result.stderr)
@@ -873,6 +5413,9 @@ class FlatpakManager(QMainWindow):
         
         # Cargar configuración de actualizaciones
         self.auto_update_check.setChecked(self.settings.value("updates/auto_check", True, type=bool))
+        self.staging_check.setChecked(self.settings.value("staging/enabled", False, type=bool))
+        self.staging_start.setValue(self.settings.value("staging/start", 1, type=int))
+        self.staging_end.setValue(self.settings.value("staging/end", 6, type=int))
         
         # Cargar configuración de limpieza
         self.auto_clean_check.setChecked(self.settings.value("cleanup/enabled", False, type=bool))
@@ -887,6 +5430,23 @@ class FlatpakManager(QMainWindow):
         index = self.max_downloads.findText(max_downloads)
         if index >= 0:
             self.max_downloads.setCurrentIndex(index)
+        index = self.background_priority.findData(
+            self.settings.value("performance/background_priority", "low"))
+        if index >= 0:
+            self.background_priority.setCurrentIndex(index)
+        self.background_bandwidth.setValue(
+            self.settings.value("performance/background_bandwidth", 0, type=int))
+        self.systemd_scope_check.setChecked(
+            self.settings.value("performance/systemd_scope", True, type=bool))
+        
+        # Cargar configuración del espejo local
+        self.mirror_serve_check.setChecked(self.settings.value("mirror/serve", False, type=bool))
+        self.mirror_port.setValue(self.settings.value("mirror/port", MIRROR_DEFAULT_PORT, type=int))
+        
+        # Cargar configuración de métricas
+        self.metrics_serve_check.setChecked(self.settings.value("metrics/serve", False, type=bool))
+        self.metrics_port.setValue(self.settings.value("metrics/port", METRICS_DEFAULT_PORT, type=int))
+        self.metrics_remote_check.setChecked(self.settings.value("metrics/remote", False, type=bool))
         
         # Aplicar configuración de fuente
         font_size = self.settings.value("ui/font_size", "Mediano")
@@ -908,6 +5468,9 @@ class FlatpakManager(QMainWindow):
         
         # Guardar configuración de actualizaciones
         self.settings.setValue("updates/auto_check", self.auto_update_check.isChecked())
+        self.settings.setValue("staging/enabled", self.staging_check.isChecked())
+        self.settings.setValue("staging/start", self.staging_start.value())
+        self.settings.setValue("staging/end", self.staging_end.value())
         
         # Guardar configuración de limpieza
         self.settings.setValue("cleanup/enabled", self.auto_clean_check.isChecked())
@@ -916,6 +5479,21 @@ class FlatpakManager(QMainWindow):
         # Guardar configuración de rendimiento
         self.settings.setValue("performance/parallel_downloads", self.parallel_downloads.isChecked())
         self.settings.setValue("performance/max_downloads", self.max_downloads.currentText())
+        self.settings.setValue("performance/background_priority", self.background_priority.currentData())
+        self.settings.setValue("performance/background_bandwidth", self.background_bandwidth.value())
+        self.settings.setValue("performance/systemd_scope", self.systemd_scope_check.isChecked())
+        self.jobs.policy = background_policy(self.settings)
+        
+        # Guardar configuración del espejo local
+        self.settings.setValue("mirror/serve", self.mirror_serve_check.isChecked())
+        self.settings.setValue("mirror/port", self.mirror_port.value())
+        self.apply_mirror_serving()
+        
+        # Guardar configuración de métricas
+        self.settings.setValue("metrics/serve", self.metrics_serve_check.isChecked())
+        self.settings.setValue("metrics/port", self.metrics_port.value())
+        self.settings.setValue("metrics/remote", self.metrics_remote_check.isChecked())
+        self.apply_metrics_serving()
         
         # Guardar configuración de interfaz
         self.settings.setValue("ui/font_size", self.font_size.currentText())
@@ -987,55 +5565,338 @@ class FlatpakManager(QMainWindow):
         self.max_downloads.setEnabled(state == Qt.CheckState.Checked.value)
     
     def update_repo_list(self):
-        """Actualiza la lista de repositorios"""
-        try:
-            result = subprocess.check_output(["flatpak", "remotes", "--columns=name,url,options"], 
-                                           text=True)
-            self.repo_list.setPlainText(result.strip())
-        except subprocess.CalledProcessError as e:
-            self.repo_list.setPlainText("Error al obtener la lista de repositorios")
+        """Carga la lista de repositorios en segundo plano"""
+        self.run_task(load_remotes, quiet=True, on_result=self.remotes_loaded)
+    
+    def remotes_loaded(self, remotes):
+        """Muestra los repositorios cargados junto con su último diagnóstico"""
+        self.remotes_model.set_remotes(remotes)
+        self.remotes_model.set_probes(load_remote_probes().values())
+        self.repo_table.resizeColumnsToContents()
+    
+    def selected_remote(self):
+        """Devuelve el repositorio seleccionado en la tabla o None"""
+        rows = self.repo_table.selectionModel().selectedRows()
+        if not rows:
+            QMessageBox.warning(self, "Advertencia", "Selecciona un repositorio en la tabla.")
+            return None
+        return self.remotes_model.remotes[rows[0].row()]
+    
+    def run_remote_job(self, commands, status_message, on_success):
+        """Ejecuta comandos de remotos en segundo plano y aplica el cambio al modelo si terminan bien"""
+        self.run_task(run_flatpak_commands, commands,
+                      status_message=status_message,
+                      on_result=lambda result: on_success())
     
     def add_repository(self):
         """Añade un nuevo repositorio"""
         name, ok = QInputDialog.getText(self, "Añadir repositorio", "Nombre del repositorio:")
         if not ok or not name:
             return
+        # Con --if-not-exists flatpak no haría nada y la tabla mostraría datos que no son los reales
+        if self.remotes_model.find(name) is not None:
+            QMessageBox.warning(self, "Advertencia", f"Ya existe un repositorio llamado '{name}'.")
+            return
             
         url, ok = QInputDialog.getText(self, "Añadir repositorio", "URL del repositorio:")
         if not ok or not url:
             return
-            
+        
+        self.run_remote_job(
+            [["flatpak", "remote-add", "--if-not-exists", name, url]],
+            f"Añadiendo repositorio '{name}'...",
+            lambda: self.reload_remote(name)
+        )
+    
+    def reload_remote(self, name):
+        """Actualiza en la tabla un remoto con los datos que muestra flatpak remotes"""
         try:
-            subprocess.run(["flatpak", "remote-add", "--if-not-exists", name, url], check=True)
-            self.update_repo_list()
-            QMessageBox.information(self, "Éxito", f"Repositorio '{name}' añadido correctamente.")
-        except subprocess.CalledProcessError as e:
-            QMessageBox.critical(self, "Error", f"No se pudo añadir el repositorio: {e}")
+            remote = next((remote for remote in load_remotes() if remote.name == name), None)
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            self.append_output(f"No se pudo leer el repositorio '{name}': {e}")
+            return
+        if remote is not None:
+            self.remotes_model.upsert(remote)
     
     def remove_repository(self):
-        """Elimina un repositorio"""
-        repos = self.repo_list.toPlainText().split('\n')
-        if not repos or not repos[0]:
-            QMessageBox.warning(self, "Advertencia", "No hay repositorios para eliminar.")
+        """Elimina el repositorio seleccionado"""
+        remote = self.selected_remote()
+        if remote is None:
             return
-            
-        repo_names = [repo.split('\t')[0] for repo in repos if '\t' in repo]
-        if not repo_names:
-            QMessageBox.warning(self, "Advertencia", "No se encontraron repositorios válidos.")
+        
+        reply = QMessageBox.question(
+            self,
+            "Eliminar repositorio",
+            f"¿Estás seguro de que deseas eliminar el repositorio '{remote.name}'?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No,
+            QMessageBox.StandardButton.No
+        )
+        if reply != QMessageBox.StandardButton.Yes:
             return
-            
-        name, ok = QInputDialog.getItem(self, "Eliminar repositorio", 
-                                       "Selecciona el repositorio a eliminar:", 
-                                       repo_names, 0, False)
-        if not ok or not name:
+        
+        self.run_remote_job(
+            [["flatpak", "remote-delete", *remote.scope_args, remote.name]],
+            f"Eliminando repositorio '{remote.name}'...",
+            lambda: self.remotes_model.remove(remote.name)
+        )
+    
+    def move_repository(self, direction):
+        """
+        Cambia la prioridad del repositorio seleccionado respecto a su vecino
+        
+        Args:
+            direction (int): 1 para subir, -1 para bajar
+        """
+        remote = self.selected_remote()
+        if remote is None:
             return
-            
+        remotes = self.remotes_model.remotes
+        row = remotes.index(remote)
+        neighbor_row = row - direction
+        if not 0 <= neighbor_row < len(remotes):
+            return
+        neighbor = remotes[neighbor_row]
+        
+        # Intercambiar prioridades; si son iguales, separar una posición
+        new_priority, neighbor_priority = neighbor.priority, remote.priority
+        if new_priority == neighbor_priority:
+            new_priority += direction
+        commands = [["flatpak", "remote-modify", *remote.scope_args,
+                     f"--prio={new_priority}", remote.name]]
+        if neighbor_priority != neighbor.priority:
+            commands.append(["flatpak", "remote-modify", *neighbor.scope_args,
+                             f"--prio={neighbor_priority}", neighbor.name])
+        
+        def apply():
+            remote.priority = new_priority
+            neighbor.priority = neighbor_priority
+            self.remotes_model.sort_rows()
+        
+        self.run_remote_job(commands, f"Cambiando la prioridad de '{remote.name}'...", apply)
+    
+    def toggle_repository(self):
+        """Activa o desactiva el repositorio seleccionado"""
+        remote = self.selected_remote()
+        if remote is None:
+            return
+        enable = not remote.enabled
+        
+        def apply():
+            options = [option for option in remote.options if option != "disabled"]
+            if not enable:
+                options.append("disabled")
+            self.remotes_model.upsert(RemoteInfo(remote.name, remote.url, remote.priority,
+                                                 options, remote.filter))
+        
+        self.run_remote_job(
+            [["flatpak", "remote-modify", *remote.scope_args,
+              "--enable" if enable else "--disable", remote.name]],
+            f"{'Activando' if enable else 'Desactivando'} repositorio '{remote.name}'...",
+            apply
+        )
+    
+    def mirror_remote_configured(self):
+        """Indica si el remoto del espejo está configurado en el sistema"""
+        return self.remotes_model.find(MIRROR_REMOTE) is not None
+    
+    def apply_mirror_serving(self):
+        """Inicia o detiene el servidor del espejo según la configuración"""
+        serve = self.settings.value("mirror/serve", False, type=bool)
+        port = self.settings.value("mirror/port", MIRROR_DEFAULT_PORT, type=int)
+        if self.mirror.is_serving and (not serve or port != self.mirror.port):
+            self.mirror.stop()
+        self.mirror.port = port
+        if serve and not self.mirror.is_serving:
+            try:
+                self.mirror.start()
+                self.statusBar.showMessage(f"Espejo local disponible en el puerto {port}", 3000)
+            except OSError as e:
+                QMessageBox.critical(self, "Error", f"No se pudo servir el espejo local: {e}")
+    
+    def apply_metrics_serving(self):
+        """Inicia o detiene el exportador de métricas según la configuración"""
+        serve = self.settings.value("metrics/serve", False, type=bool)
+        port = self.settings.value("metrics/port", METRICS_DEFAULT_PORT, type=int)
+        address = "" if self.settings.value("metrics/remote", False, type=bool) else "127.0.0.1"
+        exporter = self.metrics_exporter
+        if exporter.is_serving and (not serve or port != exporter.port or address != exporter.address):
+            exporter.stop()
+        exporter.port = port
+        exporter.address = address
+        if serve and not exporter.is_serving:
+            try:
+                exporter.start()
+                self.statusBar.showMessage(f"Métricas disponibles en el puerto {port}", 3000)
+            except OSError as e:
+                QMessageBox.critical(self, "Error", f"No se pudieron publicar las métricas: {e}")
+                return
+            self.sync_dependency_graph()
+    
+    def sync_dependency_graph(self):
+        """
+        Sincroniza el grafo de dependencias en segundo plano para las métricas
+        
+        El hilo trabaja sobre una copia del grafo, que sustituye al actual en
+        el hilo de la interfaz al terminar.
+        """
+        if self.graph_sync_thread is not None and self.graph_sync_thread.isRunning():
+            self.graph_resync = True  # Repetir al terminar la sincronización en curso
+            return
+        self.graph_resync = False
+        generation = self.graph_generation
+        self.graph_sync_thread = self.run_task(
+            load_dependency_graph, self.dependency_graph.copy(), self.metadata_cache,
+            quiet=True, on_result=lambda graph: self.dependency_graph_synced(graph, generation))
+        self.graph_sync_thread.finished.connect(self.dependency_graph_sync_done)
+    
+    def dependency_graph_sync_done(self):
+        """Lanza la sincronización pendiente si lo instalado cambió durante la anterior"""
+        if self.graph_resync:
+            self.sync_dependency_graph()
+    
+    def dependency_graph_synced(self, graph, generation):
+        """Adopta el grafo sincronizado y publica en las métricas su inventario y espacio"""
+        self.dependency_graph = graph
+        # Si lo instalado cambió desde que empezó la sincronización, el grafo no está al día
+        self.graph_loaded = generation == self.graph_generation
+        runtimes = [ref for ref in graph.nodes if ref.startswith("runtime/")]
+        METRICS.set("installed_apps", len(graph.nodes) - len(runtimes))
+        METRICS.set("installed_runtimes", len(runtimes))
+        METRICS.set("installed_bytes", graph.size_of(graph.nodes))
+        METRICS.set("unused_runtimes", len(graph.unused()))
+        METRICS.set("reclaimable_bytes", graph.reclaimable())
+        METRICS.set("end_of_life_refs", len(graph.end_of_life()))
+    
+    def invalidate_dependency_graph(self, *args):
+        """Marca el grafo como desactualizado tras cambiar lo instalado"""
+        self.graph_generation += 1
+        self.graph_loaded = False  # Se sincronizará de nuevo al consultarlo
+        if self.metrics_exporter.is_serving:
+            self.sync_dependency_graph()
+    
+    def record_update_check(self, plan):
+        """Publica en las métricas el resultado de una búsqueda de actualizaciones"""
+        METRICS.set("pending_updates", len(plan))
+        METRICS.set("last_update_check_timestamp_seconds", round(time.time()))
+    
+    def sync_mirror(self):
+        """Copia las refs seleccionadas al espejo local"""
         try:
-            subprocess.run(["flatpak", "remote-delete", name], check=True)
-            self.update_repo_list()
-            QMessageBox.information(self, "Éxito", f"Repositorio '{name}' eliminado correctamente.")
-        except subprocess.CalledProcessError as e:
-            QMessageBox.critical(self, "Error", f"No se pudo eliminar el repositorio: {e}")
+            installed = [item["ref"] for item in list_installed_refs()]
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            QMessageBox.critical(self, "Error", f"No se pudo obtener la lista de refs: {e}")
+            return
+        
+        previous = self.settings.value("mirror/refs", [], type=list)
+        dialog = RefSelectionDialog("Refs del espejo local", installed, previous, self)
+        if not dialog.exec():
+            return
+        refs = dialog.selected_refs()
+        if not refs:
+            return
+        self.settings.setValue("mirror/refs", refs)
+        
+        self.output_area.clear()
+        self.append_output(f"Sincronizando espejo local en {self.mirror.path}...\n" + "="*50 + "\n")
+        self.run_task(self.mirror.sync, refs,
+                      status_message="Sincronizando espejo local...",
+                      on_result=self.mirror_synced)
+    
+    def mirror_synced(self, published):
+        """Informa del resultado de la sincronización del espejo"""
+        self.append_output(f"\n{len(published)} refs publicadas en el espejo local")
+        if self.mirror.is_serving:
+            self.append_output(f"Otros equipos pueden usarlo con \"Usar espejo\" y la URL "
+                               f"http://{platform.node()}:{self.mirror.port}/")
+    
+    def use_mirror(self):
+        """Añade un espejo como remoto con prioridad sobre el resto"""
+        url, ok = QInputDialog.getText(self, "Usar espejo", "URL del espejo:",
+                                       text=self.mirror.local_url)
+        if not ok or not url:
+            return
+        
+        # Los commits del espejo se verifican con la clave y el collection-id del remoto de origen
+        origins = [remote.name for remote in self.remotes_model.remotes
+                   if remote.name != MIRROR_REMOTE and "user" not in remote.options]
+        if not origins:
+            QMessageBox.warning(self, "Advertencia", "No hay remotos del sistema que el espejo pueda replicar.")
+            return
+        origin, ok = QInputDialog.getItem(self, "Usar espejo", "Remoto que replica el espejo:",
+                                          origins, origins.index("flathub") if "flathub" in origins else 0,
+                                          False)
+        if not ok:
+            return
+        keyring = remote_trusted_keys(origin)
+        try:
+            collection = remote_collection_id(origin)
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            QMessageBox.critical(self, "Error", f"No se pudo consultar el remoto '{origin}': {e}")
+            return
+        if not collection or not keyring.exists():
+            QMessageBox.critical(self, "Error",
+                                 f"El remoto '{origin}' no tiene collection-id o clave GPG; "
+                                 "no se podrían verificar los commits del espejo.")
+            return
+        
+        remote = RemoteInfo(MIRROR_REMOTE, url, MIRROR_PRIORITY, ["system"])
+        self.run_remote_job(
+            [["flatpak", "remote-add", "--system", "--if-not-exists", f"--gpg-import={keyring}",
+              f"--collection-id={collection}", f"--prio={MIRROR_PRIORITY}",
+              "--title=Espejo local", MIRROR_REMOTE, url],
+             ["flatpak", "remote-modify", "--system", f"--url={url}", f"--gpg-import={keyring}",
+              f"--collection-id={collection}", MIRROR_REMOTE]],
+            "Añadiendo espejo local...",
+            lambda: self.mirror_added(remote)
+        )
+    
+    def mirror_added(self, remote):
+        """Registra el espejo y ofrece actualizar desde él las refs instaladas"""
+        self.remotes_model.upsert(remote)
+        answer = QMessageBox.question(
+            self, "Usar espejo",
+            "¿Actualizar desde el espejo las aplicaciones y runtimes instalados que ofrece?\n"
+            "Se reinstalarán desde el espejo sin cambiar de versión.",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if answer != QMessageBox.StandardButton.Yes:
+            return
+        self.run_task(repoint_refs_to_mirror,
+                      status_message="Cambiando el origen de las refs al espejo...",
+                      on_result=lambda count: self.append_output(
+                          f"\n{count} refs se actualizarán desde el espejo"))
+    
+    def probe_repositories(self):
+        """Diagnostica todos los repositorios en segundo plano"""
+        remotes = [(remote.name, remote.url) for remote in self.remotes_model.remotes]
+        if not remotes:
+            QMessageBox.warning(self, "Advertencia", "No hay repositorios para diagnosticar.")
+            return
+        
+        self.tabs.setCurrentWidget(self.main_tab)
+        self.output_area.clear()
+        self.append_output(f"Diagnosticando {len(remotes)} repositorios...\n" + "="*50 + "\n")
+        self.run_task(probe_remotes, remotes,
+                      status_message="Diagnosticando repositorios...",
+                      on_result=self.show_remote_probes)
+    
+    def show_remote_probes(self, probes):
+        """Muestra el resultado del diagnóstico de repositorios"""
+        self.remotes_model.set_probes(probes)
+        self.append_output("")
+        self.append_output(f"{'Repositorio':<20} {'Estado':<15} {'Latencia':>10} {'Velocidad':>12} {'Antigüedad':>12}")
+        self.append_output("-" * 73)
+        for probe in probes:
+            age = f"{probe.age_days:.1f} días" if probe.age_days >= 0 else "-"
+            self.append_output(f"{probe.name:<20} {probe.status:<15} {probe.latency * 1000:>8.0f} ms "
+                               f"{format_size(probe.throughput) + '/s':>12} {age:>12}")
+            if probe.error:
+                self.append_output(f"    {probe.error}")
+        
+        problems = [probe.name for probe in probes if probe.status != "ok"]
+        if problems:
+            self.statusBar.showMessage(f"Repositorios con problemas: {', '.join(problems)}", 5000)
+        else:
+            self.statusBar.showMessage("Todos los repositorios responden correctamente", 3000)
     
     def show_documentation(self):
         """Muestra la documentación"""
@@ -1059,7 +5920,7 @@ class FlatpakManager(QMainWindow):
             )
             
             if reply == QMessageBox.StandardButton.Yes:
-                self.hide()
+                self.hide_to_tray()
                 event.ignore()
             elif reply == QMessageBox.StandardButton.No:
                 self.cleanup()
@@ -1101,14 +5962,64 @@ class FlatpakManager(QMainWindow):
                 )
 
 def main():
-    app = QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description=f"{APP_NAME} v{VERSION}")
+    parser.add_argument("--tray", action="store_true",
+                        help="inicia oculto en la bandeja del sistema")
+    parser.add_argument("--ctl", nargs=argparse.REMAINDER, metavar="COMANDO",
+                        help="envía un comando a la instancia en ejecución sin abrir la interfaz "
+                             "(ping, show, inventory, updates, jobs, job ID, "
+                             "queue install|uninstall|update|clean [REF...])")
+    args, qt_args = parser.parse_known_args()
+    
+    # Control por IPC: nunca inicia la interfaz
+    if args.ctl is not None:
+        try:
+            response = ipc_request(ctl_request(args.ctl))
+        except ValueError as e:
+            parser.error(str(e))
+        except OSError as e:
+            print(f"No hay ninguna instancia de {APP_NAME} en ejecución: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps(response.get("result", response), indent=2, ensure_ascii=False))
+        sys.exit(0 if response.get("ok") else 1)
+    
+    # Instancia única: si ya hay una, se le entregan los argumentos y se termina
+    instance_lock = acquire_instance_lock()
+    if instance_lock is None:
+        deadline = time.monotonic() + IPC_HANDOFF_TIMEOUT
+        while True:
+            try:
+                ipc_request({"command": "activate", "args": sys.argv[1:]}, timeout=IPC_HANDOFF_TIMEOUT)
+                sys.exit(0)
+            except OSError as e:
+                # La otra instancia puede estar arrancando todavía
+                if time.monotonic() >= deadline:
+                    print(f"{APP_NAME} ya se está ejecutando pero no responde: {e}", file=sys.stderr)
+                    sys.exit(1)
+                time.sleep(0.1)
+    
+    app = QApplication(sys.argv[:1] + qt_args)
     
     # Establecer estilo y tema
     app.setStyle('Fusion')
     
+    # Escuchar antes de construir la ventana, que ejecuta flatpak al iniciarse:
+    # así un segundo arranque recibe respuesta enseguida
+    jobs = JobQueue()
+    jobs.policy = background_policy(QSettings("FlatpakManager", "Config"))
+    ipc = IpcServer(jobs)
+    try:
+        ipc.start()
+    except OSError as e:
+        print(f"No se pudo iniciar la interfaz de control local: {e}")
+    
     # Crear y mostrar la ventana principal
-    window = FlatpakManager()
-    window.show()
+    window = FlatpakManager(ipc)
+    if args.tray and QSystemTrayIcon.isSystemTrayAvailable():
+        window.hide_to_tray()
+    else:
+        window.show()
+    ipc.connect_activation(window.handle_activation)
     
     # Conectar la señal aboutToQuit para limpiar recursos
     def handle_about_to_quit():
@@ -0,0 +1,6 @@
+"""Configuración común de las pruebas"""
+import sys
+from pathlib import Path
+
+# El gestor es un único módulo en la raíz del repositorio
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
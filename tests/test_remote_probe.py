@@ -0,0 +1,118 @@
+"""Pruebas del diagnóstico de remotos contra un servidor HTTP local"""
+import os
+import socket
+import threading
+import time
+from functools import partial
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("PyQt6")
+
+import flatpak_manager_improved as manager
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """Sirve tmp_path por HTTP en 127.0.0.1 y devuelve (directorio, url)"""
+    handler = partial(manager._QuietHTTPRequestHandler, directory=str(tmp_path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield tmp_path, f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+    thread.join(2)
+
+
+@pytest.fixture
+def probes_file(tmp_path, monkeypatch):
+    path = tmp_path / "cache" / "remote_probes.json"
+    monkeypatch.setattr(manager, "REMOTE_PROBES_FILE", path)
+    return path
+
+
+def test_probe_measures_summary_idx(repo):
+    path, url = repo
+    (path / "summary.idx").write_bytes(b"x" * 4096)
+    probe = manager.probe_remote("local", url)
+    assert probe.status == "ok"
+    assert probe.error == ""
+    assert probe.size == 4096
+    assert 0 < probe.latency < manager.PROBE_SLOW_LATENCY
+    assert probe.throughput > 0
+    assert 0 <= probe.age_days < 1
+
+
+def test_probe_falls_back_to_summary(repo):
+    path, url = repo
+    (path / "summary").write_bytes(b"y" * 100)
+    probe = manager.probe_remote("local", url)
+    assert probe.status == "ok"
+    assert probe.size == 100
+
+
+def test_probe_reports_slow_remote(repo, monkeypatch):
+    path, url = repo
+    (path / "summary.idx").write_bytes(b"x")
+    monkeypatch.setattr(manager, "PROBE_SLOW_LATENCY", 0.0)
+    assert manager.probe_remote("local", url).status == "lento"
+
+
+def test_probe_detects_stale_summary(repo):
+    path, url = repo
+    summary = path / "summary.idx"
+    summary.write_bytes(b"x")
+    old = time.time() - (manager.PROBE_STALE_DAYS + 1) * 86400
+    os.utime(summary, (old, old))
+    probe = manager.probe_remote("local", url)
+    assert probe.status == "desactualizado"
+    assert probe.age_days > manager.PROBE_STALE_DAYS
+
+
+def test_probe_missing_summary_is_unreachable(repo):
+    _, url = repo
+    probe = manager.probe_remote("local", url)
+    assert probe.status == "inaccesible"
+    assert probe.error == "HTTP 404 al descargar summary"
+
+
+def test_probe_closed_port_is_unreachable():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    probe = manager.probe_remote("closed", f"http://127.0.0.1:{port}/", timeout=2)
+    assert probe.status == "inaccesible"
+    assert probe.error
+
+
+def test_probe_rejects_unsupported_url():
+    assert manager.probe_remote("ssh", "ssh://example.org/repo").status == "no soportado"
+
+
+def test_probe_results_round_trip_through_cache(repo, probes_file):
+    path, url = repo
+    (path / "summary.idx").write_bytes(b"x" * 10)
+    log = []
+    probes = manager.probe_remotes(log.append, [("local", url), ("missing", url + "missing/")])
+    assert [probe.status for probe in probes] == ["ok", "inaccesible"]
+    assert log == ["local: ok", "missing: inaccesible"]
+
+    cached = manager.load_remote_probes()
+    assert cached == {probe.name: probe for probe in probes}
+    assert cached["local"].checked
+
+    # Un nuevo diagnóstico de un remoto conserva los demás y actualiza su fecha
+    first_checked = cached["local"].checked
+    time.sleep(1)
+    manager.probe_remotes(log.append, [("local", url)])
+    cached = manager.load_remote_probes()
+    assert set(cached) == {"local", "missing"}
+    assert cached["local"].checked > first_checked
+
+
+def test_load_remote_probes_ignores_corrupt_cache(probes_file):
+    probes_file.parent.mkdir(parents=True)
+    probes_file.write_text("{not json")
+    assert manager.load_remote_probes() == {}
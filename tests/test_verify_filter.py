@@ -0,0 +1,49 @@
+"""Pruebas del filtro de diferencias de la verificación de integridad"""
+import pytest
+
+pytest.importorskip("PyQt6")
+
+import flatpak_manager_improved as manager
+
+LOCALE_DIFF = """\
+A    /deploy
+A    /files/.ref
+M    /export/share/applications/org.gimp.GIMP.desktop
+D    /files/fr
+D    /files/fr/LC_MESSAGES
+D    /files/fr/LC_MESSAGES/gimp20.mo
+D    /files/pt_BR/LC_MESSAGES/gimp20.mo
+"""
+
+
+def test_control_and_export_files_are_ignored():
+    diff = "A    /deploy\nA    /.ref\nA    /files/.ref\nM    /export/bin/org.gimp.GIMP\n"
+    assert manager.filter_deploy_diff(diff) == []
+
+
+def test_modified_and_missing_files_are_reported():
+    diff = "M    /files/bin/gimp\nD    /files/lib/libgimp.so\nA    /files/bin/extra\n"
+    assert manager.filter_deploy_diff(diff) == [
+        "M /files/bin/gimp", "D /files/lib/libgimp.so", "A /files/bin/extra"]
+
+
+def test_languages_outside_subpaths_are_not_corruption():
+    assert manager.filter_deploy_diff(LOCALE_DIFF, ["/de", "/en"]) == []
+
+
+def test_damage_inside_subpaths_is_reported():
+    diff = LOCALE_DIFF + "D    /files/de/LC_MESSAGES/gimp20.mo\nM    /files/en/LC_MESSAGES/gimp20.mo\n"
+    assert manager.filter_deploy_diff(diff, ["/de", "/en"]) == [
+        "D /files/de/LC_MESSAGES/gimp20.mo", "M /files/en/LC_MESSAGES/gimp20.mo"]
+
+
+def test_full_deploy_reports_missing_languages():
+    assert "D /files/fr/LC_MESSAGES/gimp20.mo" in manager.filter_deploy_diff(LOCALE_DIFF)
+
+
+def test_extra_data_is_ignored_only_for_extra_data_refs():
+    diff = "A    /files/extra\nA    /files/extra/app.bin\n"
+    assert manager.filter_deploy_diff(diff, extra_data=True) == []
+    assert manager.filter_deploy_diff(diff) == ["A /files/extra", "A /files/extra/app.bin"]
+    assert manager.filter_deploy_diff("D    /files/extra/app.bin\n", extra_data=True) == [
+        "D /files/extra/app.bin"]